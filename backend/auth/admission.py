@@ -0,0 +1,148 @@
+'''
+Business: Admission control for password hashing in login/registration: concurrency cap and token buckets
+Args: AUTH_MAX_CONCURRENT_HASHES, AUTH_EMAIL_BUCKET / AUTH_SOURCE_BUCKET ("capacity/refill seconds"),
+      AUTH_RATE_LIMIT_STORE - memory (default) or postgres to share buckets between instances
+Returns: None when a request may hash a password, otherwise a 429 response with Retry-After
+'''
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Iterator, Optional, Tuple
+from db import discard_connection, get_connection, release_connection
+
+MAX_CONCURRENT_HASHES = int(os.environ.get('AUTH_MAX_CONCURRENT_HASHES', '2'))
+RATE_LIMIT_STORE = os.environ.get('AUTH_RATE_LIMIT_STORE', 'memory')
+MAX_BUCKETS = int(os.environ.get('AUTH_MAX_BUCKETS', '10000'))
+
+def parse_bucket(value: str) -> Tuple[float, float]:
+    '''"capacity/seconds" -> (capacity, tokens refilled per second)'''
+    capacity, _, seconds = value.partition('/')
+    return float(capacity), float(capacity) / float(seconds)
+
+# 5 attempts per email and 20 per source address, each refilled over a minute
+EMAIL_BUCKET = parse_bucket(os.environ.get('AUTH_EMAIL_BUCKET', '5/60'))
+SOURCE_BUCKET = parse_bucket(os.environ.get('AUTH_SOURCE_BUCKET', '20/60'))
+# A bucket idle this long has refilled completely, so its row is no different from a missing one
+IDLE_BUCKET_SECONDS = max(capacity / rate for capacity, rate in (EMAIL_BUCKET, SOURCE_BUCKET))
+
+_slots = threading.BoundedSemaphore(MAX_CONCURRENT_HASHES)
+_lock = threading.Lock()
+_stats = {
+    'in_flight': 0, 'max_in_flight': 0, 'admitted': 0,
+    'rejected_concurrency': 0, 'rejected_email': 0, 'rejected_source': 0
+}
+
+class MemoryBuckets:
+    '''Token buckets of this instance, least recently used keys are dropped beyond MAX_BUCKETS'''
+
+    def __init__(self, max_buckets: int):
+        self.max_buckets = max_buckets
+        self.buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        '''Take one token; returns 0 on success or seconds until a token is available'''
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            while len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+            return wait
+
+class PostgresBuckets:
+    '''Token buckets shared by all instances in auth_rate_limits, refilled in SQL under the row lock'''
+
+    def __init__(self, database_url: str):
+        self.database_url = database_url
+
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        conn = get_connection(self.database_url)
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                '''INSERT INTO auth_rate_limits AS b (bucket_key, tokens, updated_at) VALUES (%(key)s, %(capacity)s, %(now)s)
+                ON CONFLICT (bucket_key) DO UPDATE SET
+                    tokens = LEAST(%(capacity)s, b.tokens + GREATEST(EXTRACT(EPOCH FROM EXCLUDED.updated_at - b.updated_at), 0) * %(rate)s),
+                    updated_at = EXCLUDED.updated_at
+                RETURNING tokens''',
+                {'key': key, 'capacity': capacity, 'rate': rate, 'now': datetime.utcnow()}
+            )
+            tokens = cur.fetchone()[0]
+            wait = 0.0
+            if tokens >= 1:
+                cur.execute('UPDATE auth_rate_limits SET tokens = tokens - 1 WHERE bucket_key = %s', (key,))
+            else:
+                wait = (1 - tokens) / rate
+            conn.commit()
+            cur.close()
+        except Exception:
+            discard_connection(conn)
+            raise
+        finally:
+            release_connection(conn)
+        return wait
+
+memory_buckets = MemoryBuckets(MAX_BUCKETS)
+
+def _buckets(database_url: str):
+    return PostgresBuckets(database_url) if RATE_LIMIT_STORE == 'postgres' else memory_buckets
+
+def too_many(retry_after: float) -> Dict[str, Any]:
+    seconds = max(1, math.ceil(retry_after))
+    return {
+        'statusCode': 429,
+        'headers': {'Retry-After': str(seconds)},
+        'body': json.dumps({'error': 'Too many attempts, try again later', 'retry_after': seconds})
+    }
+
+def check_rate_limits(email: str, source: str, database_url: str) -> Optional[Dict[str, Any]]:
+    '''Spend one token from the source and the email bucket, 429 if either is empty'''
+    buckets = _buckets(database_url)
+    if source:
+        wait = buckets.take(f'source:{source}', *SOURCE_BUCKET)
+        if wait > 0:
+            with _lock:
+                _stats['rejected_source'] += 1
+            return too_many(wait)
+    if email:
+        wait = buckets.take(f'email:{email}', *EMAIL_BUCKET)
+        if wait > 0:
+            with _lock:
+                _stats['rejected_email'] += 1
+            return too_many(wait)
+    return None
+
+@contextmanager
+def hashing_slot() -> Iterator[bool]:
+    '''Yields False right away when MAX_CONCURRENT_HASHES derivations are already running'''
+    if not _slots.acquire(blocking=False):
+        with _lock:
+            _stats['rejected_concurrency'] += 1
+        yield False
+        return
+    with _lock:
+        _stats['admitted'] += 1
+        _stats['in_flight'] += 1
+        _stats['max_in_flight'] = max(_stats['max_in_flight'], _stats['in_flight'])
+    try:
+        yield True
+    finally:
+        with _lock:
+            _stats['in_flight'] -= 1
+        _slots.release()
+
+def admission_stats() -> Dict[str, Any]:
+    with _lock:
+        return dict(_stats)
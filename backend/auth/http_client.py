@@ -0,0 +1,153 @@
+'''
+Business: Keep-alive HTTP client for OAuth provider calls with timeouts, jittered retries and latency metrics
+Args: OAUTH_CONNECT_TIMEOUT_SECONDS, OAUTH_READ_TIMEOUT_SECONDS, OAUTH_MAX_RETRIES, OAUTH_HTTP_KEEPALIVE=0 to disable reuse
+Returns: parsed JSON responses, ProviderError on failures, per-endpoint request/latency stats
+'''
+import http.client
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+CONNECT_TIMEOUT_SECONDS = float(os.environ.get('OAUTH_CONNECT_TIMEOUT_SECONDS', '3'))
+READ_TIMEOUT_SECONDS = float(os.environ.get('OAUTH_READ_TIMEOUT_SECONDS', '5'))
+MAX_RETRIES = int(os.environ.get('OAUTH_MAX_RETRIES', '2'))
+KEEPALIVE = os.environ.get('OAUTH_HTTP_KEEPALIVE', '1') != '0'
+# Idle connections kept per host; an instance talks to four provider hosts at most
+POOL_SIZE = 2
+BACKOFF_SECONDS = 0.2
+RETRY_STATUSES = (429, 502, 503, 504)
+LATENCY_SAMPLES = 1000
+
+# The server closed an idle keep-alive connection before it saw the request, safe to resend even a POST
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+class ProviderError(Exception):
+    '''Provider call that failed after retries or answered with an error status'''
+
+    def __init__(self, endpoint: str, status: Optional[int], details: str):
+        super().__init__(f'{endpoint}: {status or "no response"} {details[:200]}')
+        self.endpoint = endpoint
+        self.status = status
+
+_lock = threading.Lock()
+_idle: Dict[Tuple[str, str, int], List[http.client.HTTPConnection]] = {}
+_metrics: Dict[str, Dict[str, Any]] = {}
+
+def _endpoint_metrics(endpoint: str) -> Dict[str, Any]:
+    with _lock:
+        if endpoint not in _metrics:
+            _metrics[endpoint] = {
+                'requests': 0, 'errors': 0, 'retries': 0, 'reused': 0,
+                'latencies': deque(maxlen=LATENCY_SAMPLES)
+            }
+        return _metrics[endpoint]
+
+def _checkout(key: Tuple[str, str, int]) -> Tuple[http.client.HTTPConnection, bool]:
+    '''Idle connection to the host or a new one, and whether it was reused'''
+    with _lock:
+        idle = _idle.get(key)
+        if idle:
+            return idle.pop(), True
+    scheme, host, port = key
+    connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+    conn = connection_class(host, port, timeout=CONNECT_TIMEOUT_SECONDS)
+    conn.connect()
+    conn.sock.settimeout(READ_TIMEOUT_SECONDS)
+    return conn, False
+
+def _checkin(key: Tuple[str, str, int], conn: http.client.HTTPConnection) -> None:
+    with _lock:
+        idle = _idle.setdefault(key, [])
+        if KEEPALIVE and len(idle) < POOL_SIZE:
+            idle.append(conn)
+            return
+    conn.close()
+
+def _backoff(attempt: int) -> None:
+    '''Full jitter so instances retrying the same provider do not synchronize'''
+    time.sleep(random.uniform(0, BACKOFF_SECONDS * (2 ** attempt)))
+
+def request(endpoint: str, method: str, url: str, body: Optional[bytes] = None,
+            headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+    '''One provider call over a pooled connection; GETs are retried on errors and 429/5xx'''
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    metrics = _endpoint_metrics(endpoint)
+
+    for attempt in range(MAX_RETRIES + 1):
+        started = time.perf_counter()
+        conn, reused = None, False
+        try:
+            conn, reused = _checkout(key)
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            if conn is not None:
+                conn.close()
+            retry = method == 'GET' or (reused and isinstance(e, STALE_CONNECTION_ERRORS))
+            with _lock:
+                metrics['errors'] += 1
+            if retry and attempt < MAX_RETRIES:
+                with _lock:
+                    metrics['retries'] += 1
+                if not reused:
+                    _backoff(attempt)
+                continue
+            raise ProviderError(endpoint, None, f'{type(e).__name__}: {e}')
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with _lock:
+            metrics['requests'] += 1
+            metrics['reused'] += int(reused)
+            metrics['latencies'].append(elapsed_ms)
+        if response.will_close:
+            conn.close()
+        else:
+            _checkin(key, conn)
+
+        if response.status in RETRY_STATUSES and method == 'GET' and attempt < MAX_RETRIES:
+            with _lock:
+                metrics['retries'] += 1
+            _backoff(attempt)
+            continue
+        return response.status, data
+    raise ProviderError(endpoint, None, 'retries exhausted')
+
+def fetch_json(endpoint: str, url: str, method: str = 'GET', body: Optional[bytes] = None,
+               headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    '''Parsed JSON of a successful response, ProviderError for error statuses'''
+    status, data = request(endpoint, method, url, body, headers)
+    if status >= 400:
+        raise ProviderError(endpoint, status, data.decode('utf-8', 'replace'))
+    return json.loads(data.decode('utf-8'))
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 2)
+
+def http_stats() -> Dict[str, Dict[str, Any]]:
+    with _lock:
+        stats = {}
+        for endpoint, metrics in _metrics.items():
+            ordered = sorted(metrics['latencies'])
+            stats[endpoint] = {
+                **{key: value for key, value in metrics.items() if key != 'latencies'},
+                'p50_ms': _percentile(ordered, 0.5),
+                'p95_ms': _percentile(ordered, 0.95)
+            }
+        return stats
+
+def close_all() -> None:
+    with _lock:
+        for idle in _idle.values():
+            for conn in idle:
+                conn.close()
+        _idle.clear()
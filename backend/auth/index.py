@@ -6,33 +6,58 @@ Returns: HTTP response с session_token или информацией о пол
 
 import json
 import os
-import hashlib
 import secrets
 from datetime import datetime, timedelta
 from typing import Dict, Any
-import psycopg2
+from db import discard_connection, get_connection, release_connection
+from session_cache import get_verified, remember_session, remember_rejection, invalidate_session
+from admission import check_rate_limits, hashing_slot, too_many
+from passwords import hash_password, verify_password, needs_rehash
+from session_gc import collect_expired, maybe_collect
+from signed_tokens import signed_tokens_enabled, is_signed_token, issue_token, parse_token, is_revoked, revoke_token
+from http_client import fetch_json, ProviderError
 from urllib.parse import urlencode
-import urllib.request
 
-def hash_password(password: str) -> str:
-    """Хеширование пароля с солью"""
-    salt = secrets.token_hex(16)
-    pwdhash = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), 100000)
-    return f"{salt}${pwdhash.hex()}"
-
-def verify_password(password: str, password_hash: str) -> bool:
-    """Проверка пароля"""
-    try:
-        salt, pwdhash = password_hash.split('$')
-        pwdhash_check = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), 100000)
-        return pwdhash == pwdhash_check.hex()
-    except:
-        return False
+# Адреса провайдеров переопределяются для локальной заглушки в бенчмарках
+YANDEX_OAUTH_URL = os.environ.get('YANDEX_OAUTH_URL', 'https://oauth.yandex.ru')
+YANDEX_LOGIN_URL = os.environ.get('YANDEX_LOGIN_URL', 'https://login.yandex.ru')
+VK_OAUTH_URL = os.environ.get('VK_OAUTH_URL', 'https://oauth.vk.com')
+VK_API_URL = os.environ.get('VK_API_URL', 'https://api.vk.com')
 
 def generate_session_token() -> str:
     """Генерация сессионного токена"""
     return secrets.token_urlsafe(64)
 
+def request_source(event: Dict[str, Any]) -> str:
+    """Адрес клиента для ограничения частоты запросов"""
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    headers = event.get('headers') or {}
+    forwarded = headers.get('X-Forwarded-For') or headers.get('x-forwarded-for') or ''
+    return identity.get('sourceIp') or forwarded.split(',')[0].strip()
+
+def admit_password_request(handle, body: Dict, event: Dict[str, Any], database_url: str) -> Dict[str, Any]:
+    """Вход и регистрация считают хеш пароля: сначала лимиты по email и адресу, затем слот на инстансе"""
+    email = str(body.get('email', '')).strip().lower()
+    rejection = check_rate_limits(email, request_source(event), database_url)
+    if rejection:
+        return rejection
+    with hashing_slot() as admitted:
+        if not admitted:
+            # Не ставим в очередь: занятый инстанс должен успевать отвечать на verify
+            return too_many(1)
+        return handle(body, database_url)
+
+def create_session(cur, user_id: int, expires_at: datetime) -> str:
+    """Выдача сессии: подписанный токен без записи в БД или непрозрачный токен в auth_sessions"""
+    if signed_tokens_enabled():
+        return issue_token(user_id, expires_at)
+    session_token = generate_session_token()
+    cur.execute(
+        'INSERT INTO auth_sessions (user_id, session_token, expires_at) VALUES (%s, %s, %s)',
+        (user_id, session_token, expires_at)
+    )
+    return session_token
+
 def handle_register(body: Dict, database_url: str) -> Dict[str, Any]:
     """Регистрация по email"""
     email = body.get('email', '').strip().lower()
@@ -45,32 +70,32 @@ def handle_register(body: Dict, database_url: str) -> Dict[str, Any]:
     if len(password) < 6:
         return {'statusCode': 400, 'body': json.dumps({'error': 'Password must be at least 6 characters'})}
     
-    conn = psycopg2.connect(database_url)
-    cur = conn.cursor()
-    
-    cur.execute('SELECT id FROM auth_users WHERE email = %s', (email,))
-    if cur.fetchone():
+    conn = get_connection(database_url)
+    try:
+        cur = conn.cursor()
+        
+        cur.execute('SELECT id FROM auth_users WHERE email = %s', (email,))
+        if cur.fetchone():
+            cur.close()
+            return {'statusCode': 409, 'body': json.dumps({'error': 'User with this email already exists'})}
+        
+        password_hash = hash_password(password)
+        cur.execute(
+            'INSERT INTO auth_users (email, password_hash, display_name, email_verified) VALUES (%s, %s, %s, %s) RETURNING id',
+            (email, password_hash, display_name or email.split('@')[0], False)
+        )
+        user_id = cur.fetchone()[0]
+        
+        expires_at = datetime.utcnow() + timedelta(days=30)
+        session_token = create_session(cur, user_id, expires_at)
+        
+        conn.commit()
         cur.close()
-        conn.close()
-        return {'statusCode': 409, 'body': json.dumps({'error': 'User with this email already exists'})}
-    
-    password_hash = hash_password(password)
-    cur.execute(
-        'INSERT INTO auth_users (email, password_hash, display_name, email_verified) VALUES (%s, %s, %s, %s) RETURNING id',
-        (email, password_hash, display_name or email.split('@')[0], False)
-    )
-    user_id = cur.fetchone()[0]
-    
-    session_token = generate_session_token()
-    expires_at = datetime.utcnow() + timedelta(days=30)
-    cur.execute(
-        'INSERT INTO auth_sessions (user_id, session_token, expires_at) VALUES (%s, %s, %s)',
-        (user_id, session_token, expires_at)
-    )
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
     
     return {
         'statusCode': 201,
@@ -91,29 +116,36 @@ def handle_login(body: Dict, database_url: str) -> Dict[str, Any]:
     if not email or not password:
         return {'statusCode': 400, 'body': json.dumps({'error': 'Email and password are required'})}
     
-    conn = psycopg2.connect(database_url)
-    cur = conn.cursor()
-    
-    cur.execute('SELECT id, password_hash, display_name, avatar_url FROM auth_users WHERE email = %s', (email,))
-    user_data = cur.fetchone()
-    
-    if not user_data or not verify_password(password, user_data[1]):
+    conn = get_connection(database_url)
+    try:
+        cur = conn.cursor()
+        
+        cur.execute('SELECT id, password_hash, display_name, avatar_url FROM auth_users WHERE email = %s', (email,))
+        user_data = cur.fetchone()
+        
+        if not user_data or not verify_password(password, user_data[1]):
+            cur.close()
+            return {'statusCode': 401, 'body': json.dumps({'error': 'Invalid email or password'})}
+        
+        user_id, password_hash, display_name, avatar_url = user_data
+        
+        # Хеш старого формата или с другой стоимостью пересчитываем, пока пароль известен
+        if needs_rehash(password_hash):
+            cur.execute(
+                'UPDATE auth_users SET password_hash = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s',
+                (hash_password(password), user_id)
+            )
+        
+        expires_at = datetime.utcnow() + timedelta(days=30)
+        session_token = create_session(cur, user_id, expires_at)
+        
+        conn.commit()
         cur.close()
-        conn.close()
-        return {'statusCode': 401, 'body': json.dumps({'error': 'Invalid email or password'})}
-    
-    user_id, _, display_name, avatar_url = user_data
-    
-    session_token = generate_session_token()
-    expires_at = datetime.utcnow() + timedelta(days=30)
-    cur.execute(
-        'INSERT INTO auth_sessions (user_id, session_token, expires_at) VALUES (%s, %s, %s)',
-        (user_id, session_token, expires_at)
-    )
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
     
     return {
         'statusCode': 200,
@@ -129,29 +161,45 @@ def handle_login(body: Dict, database_url: str) -> Dict[str, Any]:
 
 def handle_verify(session_token: str, database_url: str) -> Dict[str, Any]:
     """Проверка сессии"""
-    conn = psycopg2.connect(database_url)
-    cur = conn.cursor()
+    if is_signed_token(session_token):
+        return handle_verify_signed(session_token, database_url)
     
-    cur.execute('''
-        SELECT s.user_id, s.expires_at, u.email, u.display_name, u.avatar_url
-        FROM auth_sessions s
-        JOIN auth_users u ON s.user_id = u.id
-        WHERE s.session_token = %s
-    ''', (session_token,))
+    cached = get_verified(session_token)
+    if cached is not None:
+        return cached
     
-    session_data = cur.fetchone()
-    cur.close()
-    conn.close()
+    conn = get_connection(database_url)
+    try:
+        cur = conn.cursor()
+        
+        cur.execute('''
+            SELECT s.user_id, s.expires_at, u.email, u.display_name, u.avatar_url
+            FROM auth_sessions s
+            JOIN auth_users u ON s.user_id = u.id
+            WHERE s.session_token = %s
+        ''', (session_token,))
+        
+        session_data = cur.fetchone()
+        cur.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
     
     if not session_data:
-        return {'statusCode': 401, 'body': json.dumps({'error': 'Invalid session token'})}
+        result = {'statusCode': 401, 'body': json.dumps({'error': 'Invalid session token'})}
+        remember_rejection(session_token, result)
+        return result
     
     user_id, expires_at, email, display_name, avatar_url = session_data
     
     if expires_at < datetime.utcnow():
-        return {'statusCode': 401, 'body': json.dumps({'error': 'Session expired'})}
+        result = {'statusCode': 401, 'body': json.dumps({'error': 'Session expired'})}
+        remember_rejection(session_token, result)
+        return result
     
-    return {
+    result = {
         'statusCode': 200,
         'body': json.dumps({
             'user_id': user_id,
@@ -161,6 +209,78 @@ def handle_verify(session_token: str, database_url: str) -> Dict[str, Any]:
             'expires_at': expires_at.isoformat()
         })
     }
+    remember_session(session_token, result, user_id, expires_at)
+    return result
+
+def handle_verify_signed(session_token: str, database_url: str) -> Dict[str, Any]:
+    """Проверка подписанного токена: подпись, срок и отзыв проверяются без запроса к auth_sessions"""
+    claims = parse_token(session_token)
+    if not claims:
+        return {'statusCode': 401, 'body': json.dumps({'error': 'Invalid session token'})}
+    
+    if claims['expires_at'] < datetime.utcnow():
+        return {'statusCode': 401, 'body': json.dumps({'error': 'Session expired'})}
+    
+    if is_revoked(claims['token_id'], database_url):
+        return {'statusCode': 401, 'body': json.dumps({'error': 'Session revoked'})}
+    
+    # Профиль пользователя не хранится в токене: берём из кэша или по первичному ключу
+    cached = get_verified(session_token)
+    if cached is not None:
+        return cached
+    
+    conn = get_connection(database_url)
+    try:
+        cur = conn.cursor()
+        cur.execute('SELECT email, display_name, avatar_url FROM auth_users WHERE id = %s', (claims['user_id'],))
+        user_data = cur.fetchone()
+        cur.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
+    
+    if not user_data:
+        return {'statusCode': 401, 'body': json.dumps({'error': 'Invalid session token'})}
+    
+    email, display_name, avatar_url = user_data
+    result = {
+        'statusCode': 200,
+        'body': json.dumps({
+            'user_id': claims['user_id'],
+            'email': email,
+            'display_name': display_name,
+            'avatar_url': avatar_url,
+            'expires_at': claims['expires_at'].isoformat()
+        })
+    }
+    remember_session(session_token, result, claims['user_id'], claims['expires_at'])
+    return result
+
+def handle_logout(session_token: str, database_url: str) -> Dict[str, Any]:
+    """Выход: удаление сессии или отзыв подписанного токена"""
+    claims = parse_token(session_token) if is_signed_token(session_token) else None
+    
+    conn = get_connection(database_url)
+    try:
+        cur = conn.cursor()
+        
+        if claims:
+            revoke_token(cur, claims)
+        else:
+            cur.execute('DELETE FROM auth_sessions WHERE session_token = %s', (session_token,))
+        
+        conn.commit()
+        cur.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
+    invalidate_session(session_token)
+    
+    return {'statusCode': 200, 'body': json.dumps({'message': 'Logged out'})}
 
 def handle_oauth_yandex(query_params: Dict, context: Any, database_url: str) -> Dict[str, Any]:
     """OAuth через Яндекс"""
@@ -174,69 +294,68 @@ def handle_oauth_yandex(query_params: Dict, context: Any, database_url: str) ->
     
     if not code:
         redirect_uri = f"https://functions.poehali.dev/{context.function_name}?provider=yandex"
-        auth_url = f"https://oauth.yandex.ru/authorize?{urlencode({'response_type': 'code', 'client_id': client_id, 'redirect_uri': redirect_uri})}"
+        auth_url = f"{YANDEX_OAUTH_URL}/authorize?{urlencode({'response_type': 'code', 'client_id': client_id, 'redirect_uri': redirect_uri})}"
         return {'statusCode': 302, 'headers': {'Location': auth_url}, 'body': ''}
     
     redirect_uri = f"https://functions.poehali.dev/{context.function_name}?provider=yandex"
     token_data = urlencode({'grant_type': 'authorization_code', 'code': code, 'client_id': client_id, 'client_secret': client_secret}).encode()
     
-    req = urllib.request.Request('https://oauth.yandex.ru/token', data=token_data, method='POST')
-    req.add_header('Content-Type', 'application/x-www-form-urlencoded')
-    
-    with urllib.request.urlopen(req) as response:
-        token_response = json.loads(response.read().decode())
+    token_response = fetch_json(
+        'yandex.token', f'{YANDEX_OAUTH_URL}/token', method='POST', body=token_data,
+        headers={'Content-Type': 'application/x-www-form-urlencoded'}
+    )
     
     access_token = token_response.get('access_token')
     if not access_token:
         return {'statusCode': 400, 'body': json.dumps({'error': 'Failed to get access token'})}
     
-    req = urllib.request.Request('https://login.yandex.ru/info?format=json')
-    req.add_header('Authorization', f'OAuth {access_token}')
-    
-    with urllib.request.urlopen(req) as response:
-        user_info = json.loads(response.read().decode())
+    user_info = fetch_json(
+        'yandex.info', f'{YANDEX_LOGIN_URL}/info?format=json',
+        headers={'Authorization': f'OAuth {access_token}'}
+    )
     
     yandex_id = user_info.get('id')
     email = user_info.get('default_email')
     display_name = user_info.get('display_name') or user_info.get('real_name') or email.split('@')[0]
     avatar_url = f"https://avatars.yandex.net/get-yapic/{user_info.get('default_avatar_id')}/islands-200" if user_info.get('default_avatar_id') else None
     
-    conn = psycopg2.connect(database_url)
-    cur = conn.cursor()
-    
-    cur.execute('SELECT user_id FROM auth_providers WHERE provider = %s AND provider_user_id = %s', ('yandex', yandex_id))
-    provider_data = cur.fetchone()
-    
-    if provider_data:
-        user_id = provider_data[0]
-    else:
-        cur.execute('SELECT id FROM auth_users WHERE email = %s', (email,))
-        existing_user = cur.fetchone()
+    conn = get_connection(database_url)
+    try:
+        cur = conn.cursor()
+        
+        cur.execute('SELECT user_id FROM auth_providers WHERE provider = %s AND provider_user_id = %s', ('yandex', yandex_id))
+        provider_data = cur.fetchone()
         
-        if existing_user:
-            user_id = existing_user[0]
+        if provider_data:
+            user_id = provider_data[0]
         else:
+            cur.execute('SELECT id FROM auth_users WHERE email = %s', (email,))
+            existing_user = cur.fetchone()
+            
+            if existing_user:
+                user_id = existing_user[0]
+            else:
+                cur.execute(
+                    'INSERT INTO auth_users (email, display_name, avatar_url, email_verified) VALUES (%s, %s, %s, %s) RETURNING id',
+                    (email, display_name, avatar_url, True)
+                )
+                user_id = cur.fetchone()[0]
+            
             cur.execute(
-                'INSERT INTO auth_users (email, display_name, avatar_url, email_verified) VALUES (%s, %s, %s, %s) RETURNING id',
-                (email, display_name, avatar_url, True)
+                'INSERT INTO auth_providers (user_id, provider, provider_user_id, provider_email, provider_data) VALUES (%s, %s, %s, %s, %s)',
+                (user_id, 'yandex', yandex_id, email, json.dumps(user_info))
             )
-            user_id = cur.fetchone()[0]
         
-        cur.execute(
-            'INSERT INTO auth_providers (user_id, provider, provider_user_id, provider_email, provider_data) VALUES (%s, %s, %s, %s, %s)',
-            (user_id, 'yandex', yandex_id, email, json.dumps(user_info))
-        )
-    
-    session_token = generate_session_token()
-    expires_at = datetime.utcnow() + timedelta(days=30)
-    cur.execute(
-        'INSERT INTO auth_sessions (user_id, session_token, expires_at) VALUES (%s, %s, %s)',
-        (user_id, session_token, expires_at)
-    )
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+        expires_at = datetime.utcnow() + timedelta(days=30)
+        session_token = create_session(cur, user_id, expires_at)
+        
+        conn.commit()
+        cur.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
     
     frontend_url = f"{os.environ.get('FRONTEND_URL', 'http://localhost:5173')}/auth/callback?session_token={session_token}"
     return {'statusCode': 302, 'headers': {'Location': frontend_url}, 'body': ''}
@@ -253,14 +372,13 @@ def handle_oauth_vk(query_params: Dict, context: Any, database_url: str) -> Dict
     
     if not code:
         redirect_uri = f"https://functions.poehali.dev/{context.function_name}?provider=vk"
-        auth_url = f"https://oauth.vk.com/authorize?{urlencode({'client_id': client_id, 'redirect_uri': redirect_uri, 'display': 'page', 'scope': 'email', 'response_type': 'code', 'v': '5.131'})}"
+        auth_url = f"{VK_OAUTH_URL}/authorize?{urlencode({'client_id': client_id, 'redirect_uri': redirect_uri, 'display': 'page', 'scope': 'email', 'response_type': 'code', 'v': '5.131'})}"
         return {'statusCode': 302, 'headers': {'Location': auth_url}, 'body': ''}
     
     redirect_uri = f"https://functions.poehali.dev/{context.function_name}?provider=vk"
-    token_url = f"https://oauth.vk.com/access_token?{urlencode({'client_id': client_id, 'client_secret': client_secret, 'redirect_uri': redirect_uri, 'code': code})}"
+    token_url = f"{VK_OAUTH_URL}/access_token?{urlencode({'client_id': client_id, 'client_secret': client_secret, 'redirect_uri': redirect_uri, 'code': code})}"
     
-    with urllib.request.urlopen(token_url) as response:
-        token_response = json.loads(response.read().decode())
+    token_response = fetch_json('vk.access_token', token_url)
     
     access_token = token_response.get('access_token')
     vk_user_id = token_response.get('user_id')
@@ -269,10 +387,9 @@ def handle_oauth_vk(query_params: Dict, context: Any, database_url: str) -> Dict
     if not access_token or not vk_user_id:
         return {'statusCode': 400, 'body': json.dumps({'error': 'Failed to get access token'})}
     
-    api_url = f"https://api.vk.com/method/users.get?{urlencode({'user_ids': vk_user_id, 'fields': 'photo_200', 'access_token': access_token, 'v': '5.131'})}"
+    api_url = f"{VK_API_URL}/method/users.get?{urlencode({'user_ids': vk_user_id, 'fields': 'photo_200', 'access_token': access_token, 'v': '5.131'})}"
     
-    with urllib.request.urlopen(api_url) as response:
-        api_response = json.loads(response.read().decode())
+    api_response = fetch_json('vk.users_get', api_url)
     
     if 'response' not in api_response or len(api_response['response']) == 0:
         return {'statusCode': 400, 'body': json.dumps({'error': 'Failed to get user info'})}
@@ -284,42 +401,43 @@ def handle_oauth_vk(query_params: Dict, context: Any, database_url: str) -> Dict
     if not email:
         email = f"vk{vk_user_id}@vk.com"
     
-    conn = psycopg2.connect(database_url)
-    cur = conn.cursor()
-    
-    cur.execute('SELECT user_id FROM auth_providers WHERE provider = %s AND provider_user_id = %s', ('vk', str(vk_user_id)))
-    provider_data = cur.fetchone()
-    
-    if provider_data:
-        user_id = provider_data[0]
-    else:
-        cur.execute('SELECT id FROM auth_users WHERE email = %s', (email,))
-        existing_user = cur.fetchone()
+    conn = get_connection(database_url)
+    try:
+        cur = conn.cursor()
+        
+        cur.execute('SELECT user_id FROM auth_providers WHERE provider = %s AND provider_user_id = %s', ('vk', str(vk_user_id)))
+        provider_data = cur.fetchone()
         
-        if existing_user:
-            user_id = existing_user[0]
+        if provider_data:
+            user_id = provider_data[0]
         else:
+            cur.execute('SELECT id FROM auth_users WHERE email = %s', (email,))
+            existing_user = cur.fetchone()
+            
+            if existing_user:
+                user_id = existing_user[0]
+            else:
+                cur.execute(
+                    'INSERT INTO auth_users (email, display_name, avatar_url, email_verified) VALUES (%s, %s, %s, %s) RETURNING id',
+                    (email, display_name, avatar_url, True)
+                )
+                user_id = cur.fetchone()[0]
+            
             cur.execute(
-                'INSERT INTO auth_users (email, display_name, avatar_url, email_verified) VALUES (%s, %s, %s, %s) RETURNING id',
-                (email, display_name, avatar_url, True)
+                'INSERT INTO auth_providers (user_id, provider, provider_user_id, provider_email, provider_data) VALUES (%s, %s, %s, %s, %s)',
+                (user_id, 'vk', str(vk_user_id), email, json.dumps(user_info))
             )
-            user_id = cur.fetchone()[0]
         
-        cur.execute(
-            'INSERT INTO auth_providers (user_id, provider, provider_user_id, provider_email, provider_data) VALUES (%s, %s, %s, %s, %s)',
-            (user_id, 'vk', str(vk_user_id), email, json.dumps(user_info))
-        )
-    
-    session_token = generate_session_token()
-    expires_at = datetime.utcnow() + timedelta(days=30)
-    cur.execute(
-        'INSERT INTO auth_sessions (user_id, session_token, expires_at) VALUES (%s, %s, %s)',
-        (user_id, session_token, expires_at)
-    )
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+        expires_at = datetime.utcnow() + timedelta(days=30)
+        session_token = create_session(cur, user_id, expires_at)
+        
+        conn.commit()
+        cur.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
     
     frontend_url = f"{os.environ.get('FRONTEND_URL', 'http://localhost:5173')}/auth/callback?session_token={session_token}"
     return {'statusCode': 302, 'headers': {'Location': frontend_url}, 'body': ''}
@@ -333,7 +451,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token, X-Cleanup-Token',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -360,10 +478,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         # Email auth
         elif action == 'register' and method == 'POST':
             body = json.loads(event.get('body', '{}'))
-            result = handle_register(body, database_url)
+            result = admit_password_request(handle_register, body, event, database_url)
         elif action == 'login' and method == 'POST':
             body = json.loads(event.get('body', '{}'))
-            result = handle_login(body, database_url)
+            result = admit_password_request(handle_login, body, event, database_url)
         elif action == 'verify' and method == 'GET':
             headers = event.get('headers', {})
             session_token = headers.get('X-Session-Token') or headers.get('x-session-token')
@@ -371,16 +489,47 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 result = {'statusCode': 401, 'body': json.dumps({'error': 'Session token required'})}
             else:
                 result = handle_verify(session_token, database_url)
+        elif action == 'logout' and method == 'POST':
+            headers = event.get('headers', {})
+            session_token = headers.get('X-Session-Token') or headers.get('x-session-token')
+            if not session_token:
+                result = {'statusCode': 401, 'body': json.dumps({'error': 'Session token required'})}
+            else:
+                result = handle_logout(session_token, database_url)
+        elif action == 'cleanup' and method == 'POST':
+            headers = event.get('headers', {})
+            cleanup_token = headers.get('X-Cleanup-Token') or headers.get('x-cleanup-token')
+            expected_token = os.environ.get('SESSION_GC_TOKEN')
+            if not expected_token or not cleanup_token or not secrets.compare_digest(cleanup_token, expected_token):
+                result = {'statusCode': 403, 'body': json.dumps({'error': 'Cleanup is not allowed'})}
+            else:
+                result = {'statusCode': 200, 'body': json.dumps(collect_expired(database_url))}
         else:
             result = {'statusCode': 400, 'body': json.dumps({'error': 'Invalid action or method'})}
         
+        # Каждый вход добавляет сессию, поэтому изредка удаляем пачку истёкших
+        if action in ('register', 'login') and result['statusCode'] < 300:
+            try:
+                maybe_collect(database_url)
+            except Exception:
+                pass
+        
         if 'headers' not in result:
             result['headers'] = {}
         result['headers']['Access-Control-Allow-Origin'] = '*'
         result['headers']['Content-Type'] = 'application/json'
+        if 'Retry-After' in result['headers']:
+            result['headers']['Access-Control-Expose-Headers'] = 'Retry-After'
         
         return result
         
+    except ProviderError as e:
+        return {
+            'statusCode': 502,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'OAuth provider request failed', 'endpoint': e.endpoint, 'status': e.status})
+        }
+    
     except Exception as e:
         return {
             'statusCode': 500,
@@ -0,0 +1,84 @@
+'''
+Business: Self-describing password hashes (PBKDF2-SHA256 or scrypt) with tunable cost and rehash detection
+Args: PASSWORD_HASH_ALGORITHM - pbkdf2_sha256 or scrypt, PASSWORD_PBKDF2_ITERATIONS,
+      PASSWORD_SCRYPT_N / PASSWORD_SCRYPT_R / PASSWORD_SCRYPT_P - cost of newly created hashes
+Returns: hash strings like pbkdf2_sha256$<iterations>$<salt>$<hash> or scrypt$<n>$<r>$<p>$<salt>$<hash>
+'''
+import hashlib
+import hmac
+import os
+import secrets
+from typing import Dict, Any, Optional
+
+ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM', 'pbkdf2_sha256')
+PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', '100000'))
+SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', str(2 ** 14)))
+SCRYPT_R = int(os.environ.get('PASSWORD_SCRYPT_R', '8'))
+SCRYPT_P = int(os.environ.get('PASSWORD_SCRYPT_P', '1'))
+
+# Hashes stored before the format was versioned: <salt>$<hex>, salt used as text, 100000 iterations
+LEGACY_ITERATIONS = 100000
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # hashlib refuses to use more than 32 MB unless told otherwise
+    maxmem = 2 * 128 * n * r * p + 1024 * 1024
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=32)
+
+def current_params() -> Dict[str, Any]:
+    if ALGORITHM == 'scrypt':
+        return {'algorithm': 'scrypt', 'n': SCRYPT_N, 'r': SCRYPT_R, 'p': SCRYPT_P}
+    return {'algorithm': 'pbkdf2_sha256', 'iterations': PBKDF2_ITERATIONS}
+
+def hash_password(password: str, params: Optional[Dict[str, Any]] = None) -> str:
+    '''Hash with the configured (or given) algorithm and cost, parameters are stored in the string'''
+    params = params or current_params()
+    salt = secrets.token_hex(16)
+    if params['algorithm'] == 'scrypt':
+        digest = _scrypt(password, bytes.fromhex(salt), params['n'], params['r'], params['p'])
+        return f"scrypt${params['n']}${params['r']}${params['p']}${salt}${digest.hex()}"
+    digest = _pbkdf2(password, bytes.fromhex(salt), params['iterations'])
+    return f"pbkdf2_sha256${params['iterations']}${salt}${digest.hex()}"
+
+def parse_hash(password_hash: str) -> Optional[Dict[str, Any]]:
+    '''Algorithm, cost, salt and digest of a stored hash, None if it is not in a known format'''
+    parts = password_hash.split('$')
+    try:
+        if len(parts) == 2:
+            return {'algorithm': 'legacy', 'iterations': LEGACY_ITERATIONS, 'salt': parts[0], 'digest': parts[1]}
+        if len(parts) == 4 and parts[0] == 'pbkdf2_sha256':
+            return {'algorithm': 'pbkdf2_sha256', 'iterations': int(parts[1]), 'salt': parts[2], 'digest': parts[3]}
+        if len(parts) == 6 and parts[0] == 'scrypt':
+            return {
+                'algorithm': 'scrypt', 'n': int(parts[1]), 'r': int(parts[2]), 'p': int(parts[3]),
+                'salt': parts[4], 'digest': parts[5]
+            }
+    except ValueError:
+        return None
+    return None
+
+def verify_password(password: str, password_hash: str) -> bool:
+    '''Recompute the hash with its own parameters and compare in constant time'''
+    parsed = parse_hash(password_hash or '')
+    if parsed is None:
+        return False
+    try:
+        if parsed['algorithm'] == 'legacy':
+            digest = _pbkdf2(password, parsed['salt'].encode('utf-8'), parsed['iterations'])
+        elif parsed['algorithm'] == 'pbkdf2_sha256':
+            digest = _pbkdf2(password, bytes.fromhex(parsed['salt']), parsed['iterations'])
+        else:
+            digest = _scrypt(password, bytes.fromhex(parsed['salt']), parsed['n'], parsed['r'], parsed['p'])
+    except ValueError:
+        return False
+    return hmac.compare_digest(digest.hex(), parsed['digest'])
+
+def needs_rehash(password_hash: str) -> bool:
+    '''True when the stored hash was made with another algorithm or cost than the current settings'''
+    parsed = parse_hash(password_hash or '')
+    if parsed is None:
+        return True
+    params = current_params()
+    return any(parsed.get(key) != value for key, value in params.items())
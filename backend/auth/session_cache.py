@@ -0,0 +1,129 @@
+'''
+Business: In-process cache of session verification results for the auth verify path
+Args: session token, verify response, user id of the session
+Returns: cached verify response or None, hit/miss/eviction counters
+'''
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Set, Tuple
+
+# Verified sessions are served from memory at most this long, so a session deleted by another
+# warm instance stops working within TTL_SECONDS
+TTL_SECONDS = float(os.environ.get('SESSION_CACHE_TTL_SECONDS', '60'))
+# Unknown or expired tokens are answered from memory this long
+NEGATIVE_TTL_SECONDS = float(os.environ.get('SESSION_CACHE_NEGATIVE_TTL_SECONDS', '10'))
+MAX_ENTRIES = int(os.environ.get('SESSION_CACHE_MAX_ENTRIES', '10000'))
+
+def token_key(session_token: str) -> str:
+    '''Cache key; raw tokens are never kept in memory'''
+    return hashlib.sha256(session_token.encode('utf-8')).hexdigest()
+
+class SessionCache:
+    '''LRU of verify responses bounded by entry count, each entry valid until its own deadline'''
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[str, Tuple[float, int, str, Optional[int]]]' = OrderedDict()
+        self.user_keys: Dict[int, Set[str]] = {}
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, session_token: str) -> Optional[Dict[str, Any]]:
+        key = token_key(session_token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            cached_until, status_code, body, _ = entry
+            if cached_until <= time.time():
+                self._drop(key)
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits' if status_code == 200 else 'negative_hits'] += 1
+            return {'statusCode': status_code, 'body': body}
+
+    def put(self, session_token: str, response: Dict[str, Any], cached_until: float, user_id: Optional[int] = None) -> None:
+        key = token_key(session_token)
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (cached_until, response['statusCode'], response['body'], user_id)
+            if user_id is not None:
+                self.user_keys.setdefault(user_id, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._drop(next(iter(self.entries)))
+                self.stats['evictions'] += 1
+
+    def invalidate(self, session_token: str) -> None:
+        key = token_key(session_token)
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+                self.stats['invalidations'] += 1
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self.lock:
+            for key in list(self.user_keys.get(user_id, ())):
+                self._drop(key)
+                self.stats['invalidations'] += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.user_keys.clear()
+
+    def _drop(self, key: str) -> None:
+        '''Remove an entry, the caller holds the lock'''
+        _, _, _, user_id = self.entries.pop(key)
+        if user_id is not None:
+            keys = self.user_keys.get(user_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.user_keys[user_id]
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            hits = self.stats['hits'] + self.stats['negative_hits']
+            lookups = hits + self.stats['misses']
+            return {
+                **self.stats,
+                'entries': len(self.entries),
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0
+            }
+
+session_cache = SessionCache(MAX_ENTRIES)
+
+def get_verified(session_token: str) -> Optional[Dict[str, Any]]:
+    '''Cached verify response (200 or 401) for this token, None on a miss'''
+    return session_cache.get(session_token)
+
+def remember_session(session_token: str, response: Dict[str, Any], user_id: int, expires_at: datetime) -> None:
+    '''Cache a successful verify until the TTL or the session expiry, whichever comes first'''
+    if TTL_SECONDS <= 0:
+        return
+    expires_ts = expires_at.replace(tzinfo=timezone.utc).timestamp()
+    session_cache.put(session_token, response, min(time.time() + TTL_SECONDS, expires_ts), user_id)
+
+def remember_rejection(session_token: str, response: Dict[str, Any]) -> None:
+    '''Cache a 401 for an unknown or expired token'''
+    if NEGATIVE_TTL_SECONDS > 0:
+        session_cache.put(session_token, response, time.time() + NEGATIVE_TTL_SECONDS)
+
+def invalidate_session(session_token: str) -> None:
+    '''Hook for logout: forget a single token'''
+    session_cache.invalidate(session_token)
+
+def invalidate_user_sessions(user_id: int) -> None:
+    '''Hook for revocation: forget every cached token of a user'''
+    session_cache.invalidate_user(user_id)
+
+def cache_stats() -> Dict[str, Any]:
+    return session_cache.snapshot_stats()
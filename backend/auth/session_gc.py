@@ -0,0 +1,120 @@
+'''
+Business: Batched removal of expired sessions, verification tokens, revocations and idle rate limit buckets
+          from the auth tables
+Args: database_url, batch_size - rows per DELETE, time_budget - seconds one run may take
+Returns: rows removed per table and whether the run stopped before finishing
+'''
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+from admission import IDLE_BUCKET_SECONDS
+from db import discard_connection, get_connection, release_connection
+
+BATCH_SIZE = int(os.environ.get('SESSION_GC_BATCH_SIZE', '5000'))
+TIME_BUDGET_SECONDS = float(os.environ.get('SESSION_GC_TIME_BUDGET_SECONDS', '20'))
+# Chance that a login/registration runs one small batch after answering
+OPPORTUNISTIC_PROBABILITY = float(os.environ.get('SESSION_GC_PROBABILITY', '0.01'))
+OPPORTUNISTIC_BATCH_SIZE = int(os.environ.get('SESSION_GC_OPPORTUNISTIC_BATCH_SIZE', '500'))
+
+# Each table is drained oldest expiry first through the index on its expiry column
+GC_TABLES = ('auth_sessions', 'auth_verification_tokens', 'auth_revoked_tokens', 'auth_rate_limits')
+PRIMARY_KEYS = {
+    'auth_sessions': 'id', 'auth_verification_tokens': 'id', 'auth_revoked_tokens': 'token_id',
+    'auth_rate_limits': 'bucket_key'
+}
+# Rate limit buckets never expire; one that has been idle for a whole refill window is full and can go
+EXPIRY_COLUMNS = {
+    'auth_sessions': 'expires_at', 'auth_verification_tokens': 'expires_at', 'auth_revoked_tokens': 'expires_at',
+    'auth_rate_limits': 'updated_at'
+}
+
+_running = threading.Lock()
+_stats = {'runs': 0, 'batches': 0, 'rows_removed': 0, 'skipped_busy': 0}
+# Table the next run starts with, so one-batch runs reach every table in turn
+_next_table = 0
+
+def delete_batch(cursor, table: str, cutoff: datetime, batch_size: int) -> int:
+    '''Delete up to batch_size expired rows; rows locked by live transactions are left for later'''
+    key, column = PRIMARY_KEYS[table], EXPIRY_COLUMNS[table]
+    cursor.execute(
+        f'''DELETE FROM {table} WHERE {key} IN (
+            SELECT {key} FROM {table} WHERE {column} < %s
+            ORDER BY {column} LIMIT %s FOR UPDATE SKIP LOCKED
+        )''',
+        (cutoff, batch_size)
+    )
+    return cursor.rowcount
+
+def collect_expired(database_url: str, batch_size: int = BATCH_SIZE,
+                    time_budget: float = TIME_BUDGET_SECONDS, max_batches: Optional[int] = None) -> Dict[str, Any]:
+    '''Delete expired rows in short committed batches until done or out of budget.
+    Every batch is its own transaction, so a run that stops early is simply resumed by the next one'''
+    global _next_table
+    if not _running.acquire(blocking=False):
+        _stats['skipped_busy'] += 1
+        return {'removed': {}, 'batches': 0, 'finished': False, 'busy': True}
+
+    started = time.monotonic()
+    removed = {table: 0 for table in GC_TABLES}
+    batches = 0
+    finished = True
+    conn = get_connection(database_url)
+    try:
+        cursor = conn.cursor()
+        now = datetime.utcnow()
+        cutoffs = {table: now for table in GC_TABLES}
+        cutoffs['auth_rate_limits'] = now - timedelta(seconds=IDLE_BUCKET_SECONDS)
+        start = _next_table
+        _next_table = (start + 1) % len(GC_TABLES)
+        for table in GC_TABLES[start:] + GC_TABLES[:start]:
+            while True:
+                if time.monotonic() - started >= time_budget or (max_batches is not None and batches >= max_batches):
+                    finished = False
+                    break
+                deleted = delete_batch(cursor, table, cutoffs[table], batch_size)
+                conn.commit()
+                batches += 1
+                removed[table] += deleted
+                if deleted < batch_size:
+                    break
+            if not finished:
+                break
+        cursor.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
+        _running.release()
+
+    _stats['runs'] += 1
+    _stats['batches'] += batches
+    _stats['rows_removed'] += sum(removed.values())
+    return {
+        'removed': removed,
+        'batches': batches,
+        'finished': finished,
+        'elapsed_ms': round((time.monotonic() - started) * 1000, 1)
+    }
+
+def maybe_collect(database_url: str) -> Optional[Dict[str, Any]]:
+    '''Occasionally run a single small batch from a request handler'''
+    if random.random() >= OPPORTUNISTIC_PROBABILITY:
+        return None
+    return collect_expired(database_url, batch_size=OPPORTUNISTIC_BATCH_SIZE, max_batches=1)
+
+def gc_stats() -> Dict[str, Any]:
+    return dict(_stats)
+
+if __name__ == '__main__':
+    # Standalone run, e.g. from cron: python session_gc.py [batch_size]
+    result = collect_expired(
+        os.environ['DATABASE_URL'],
+        batch_size=int(sys.argv[1]) if len(sys.argv) > 1 else BATCH_SIZE,
+        time_budget=float('inf')
+    )
+    print(result)
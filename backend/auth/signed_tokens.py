@@ -0,0 +1,157 @@
+'''
+Business: Stateless session tokens signed with HMAC-SHA256, key rotation and a revocation list
+Args: SESSION_TOKEN_FORMAT=signed enables issuing, SESSION_SIGNING_KEYS - "key_id:secret,..." with the
+      active key first (or named by SESSION_SIGNING_KEY_ID)
+Returns: signed tokens, their claims after the signature check, revocation state
+'''
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, Tuple
+from db import discard_connection, get_connection, release_connection
+
+# s1.<key id>.<user id>.<expires, unix seconds>.<token id>.<signature>; opaque tokens contain no dots
+TOKEN_PREFIX = 's1'
+# How often a warm instance pulls revocations made by other instances
+REVOCATION_REFRESH_SECONDS = float(os.environ.get('SESSION_REVOCATION_REFRESH_SECONDS', '5'))
+# Re-read revocations this far behind the newest one seen, rows commit out of revoked_at order
+REVOCATION_OVERLAP = timedelta(seconds=30)
+
+def load_keys() -> Tuple[Optional[str], Dict[str, bytes]]:
+    '''Active key id and every key accepted for verification'''
+    keys: Dict[str, bytes] = {}
+    first_key_id = None
+    for item in os.environ.get('SESSION_SIGNING_KEYS', '').split(','):
+        key_id, _, secret = item.strip().partition(':')
+        if not key_id or not secret or '.' in key_id:
+            continue
+        keys[key_id] = secret.encode('utf-8')
+        first_key_id = first_key_id or key_id
+    return os.environ.get('SESSION_SIGNING_KEY_ID') or first_key_id, keys
+
+SIGNING_KEY_ID, SIGNING_KEYS = load_keys()
+
+def signed_tokens_enabled() -> bool:
+    return os.environ.get('SESSION_TOKEN_FORMAT') == 'signed' and SIGNING_KEY_ID in SIGNING_KEYS
+
+def is_signed_token(session_token: str) -> bool:
+    return session_token.startswith(TOKEN_PREFIX + '.')
+
+def _sign(key: bytes, message: str) -> str:
+    digest = hmac.new(key, message.encode('utf-8'), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip('=')
+
+def issue_token(user_id: int, expires_at: datetime) -> str:
+    '''Signed token for a session ending at expires_at (naive UTC)'''
+    expires = int(expires_at.replace(tzinfo=timezone.utc).timestamp())
+    message = f"{TOKEN_PREFIX}.{SIGNING_KEY_ID}.{user_id}.{expires}.{secrets.token_hex(12)}"
+    return f"{message}.{_sign(SIGNING_KEYS[SIGNING_KEY_ID], message)}"
+
+def parse_token(session_token: str) -> Optional[Dict[str, Any]]:
+    '''Claims of a token with a valid signature from a known key, None otherwise; expiry is left to the caller'''
+    message, _, signature = session_token.rpartition('.')
+    parts = message.split('.')
+    if len(parts) != 5 or parts[0] != TOKEN_PREFIX:
+        return None
+    _, key_id, user_id, expires, token_id = parts
+    key = SIGNING_KEYS.get(key_id)
+    if key is None or not hmac.compare_digest(_sign(key, message), signature):
+        return None
+    try:
+        return {
+            'key_id': key_id,
+            'user_id': int(user_id),
+            'expires_at': datetime.fromtimestamp(int(expires), tz=timezone.utc).replace(tzinfo=None),
+            'token_id': token_id
+        }
+    except (ValueError, OverflowError, OSError):
+        return None
+
+class RevocationList:
+    '''Revoked token ids still within their expiry, pulled incrementally from auth_revoked_tokens'''
+
+    def __init__(self):
+        self.revoked: Dict[str, float] = {}
+        self.watermark: Optional[datetime] = None
+        self.refreshed_at = 0.0
+        self.lock = threading.Lock()
+        self.stats = {'refreshes': 0, 'rows_loaded': 0, 'rejected': 0}
+
+    def refresh_due(self) -> bool:
+        return time.monotonic() - self.refreshed_at >= REVOCATION_REFRESH_SECONDS
+
+    def refresh(self, cursor) -> None:
+        loaded_at = None
+        if self.watermark is None:
+            # Full load once per instance, revoked_at is compared in database time from then on
+            cursor.execute('SELECT LOCALTIMESTAMP')
+            loaded_at = cursor.fetchone()[0]
+            cursor.execute(
+                'SELECT token_id, expires_at, revoked_at FROM auth_revoked_tokens WHERE expires_at > %s',
+                (datetime.utcnow(),)
+            )
+        else:
+            cursor.execute(
+                'SELECT token_id, expires_at, revoked_at FROM auth_revoked_tokens WHERE revoked_at > %s',
+                (self.watermark - REVOCATION_OVERLAP,)
+            )
+        rows = cursor.fetchall()
+        now = time.time()
+        with self.lock:
+            self.watermark = self.watermark or loaded_at
+            for token_id, expires_at, revoked_at in rows:
+                self.revoked[token_id] = expires_at.replace(tzinfo=timezone.utc).timestamp()
+                self.watermark = max(self.watermark, revoked_at)
+            self.revoked = {token_id: expires for token_id, expires in self.revoked.items() if expires > now}
+            self.refreshed_at = time.monotonic()
+            self.stats['refreshes'] += 1
+            self.stats['rows_loaded'] += len(rows)
+
+    def add(self, token_id: str, expires_at: datetime) -> None:
+        with self.lock:
+            self.revoked[token_id] = expires_at.replace(tzinfo=timezone.utc).timestamp()
+
+    def is_revoked(self, token_id: str) -> bool:
+        with self.lock:
+            revoked = token_id in self.revoked
+            if revoked:
+                self.stats['rejected'] += 1
+            return revoked
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, 'revoked': len(self.revoked)}
+
+revocations = RevocationList()
+
+def is_revoked(token_id: str, database_url: str) -> bool:
+    '''Revocation check, refreshing the local list from Postgres at most every REVOCATION_REFRESH_SECONDS'''
+    if revocations.refresh_due():
+        conn = get_connection(database_url)
+        try:
+            cursor = conn.cursor()
+            revocations.refresh(cursor)
+            cursor.close()
+        except Exception:
+            discard_connection(conn)
+            raise
+        finally:
+            release_connection(conn)
+    return revocations.is_revoked(token_id)
+
+def revoke_token(cursor, claims: Dict[str, Any]) -> None:
+    '''Record a revoked token until it would have expired anyway'''
+    cursor.execute(
+        '''INSERT INTO auth_revoked_tokens (token_id, user_id, expires_at) VALUES (%s, %s, %s)
+        ON CONFLICT (token_id) DO NOTHING''',
+        (claims['token_id'], claims['user_id'], claims['expires_at'])
+    )
+    revocations.add(claims['token_id'], claims['expires_at'])
+
+def revocation_stats() -> Dict[str, Any]:
+    return revocations.snapshot_stats()
@@ -0,0 +1,204 @@
+'''
+Business: Stream a family tree out of Postgres as GEDCOM 5.5.1 or newline-delimited JSON, batch by batch
+Args: conn - open psycopg2 connection, tree - dict with id, title, description, version of the exported tree,
+      out - binary file-like object the export is written to (optionally gzip-compressed on the fly)
+Returns: number of persons, families/edges and uncompressed bytes written
+'''
+import gzip
+import json
+import os
+import re
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+
+SCHEMA = '"t_p57451291_family_tree_builder_"'
+
+# Rows per FETCH from the server-side cursors; the only part of the tree held in memory at a time
+EXPORT_BATCH_ROWS = int(os.environ.get('EXPORT_BATCH_ROWS', '2000'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+# GEDCOM lines are limited to 255 characters, longer values continue in CONC lines
+GEDCOM_VALUE_CHARS = 200
+MONTHS = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+ISO_DATE = re.compile(r'^(\d{4})-(\d{2})(?:-(\d{2}))?$')
+DOTTED_DATE = re.compile(r'^(\d{1,2})\.(\d{1,2})\.(\d{4})$')
+
+PERSONS_QUERY = f"""SELECT id, client_id, first_name, last_name, middle_name, maiden_name, gender,
+    birth_date, birth_place, death_date, death_place, is_alive, occupation, bio, history_context
+FROM {SCHEMA}.persons
+WHERE tree_id = %s
+ORDER BY id"""
+
+# A family is a spouse pair or the set of parents shared by some children; childless couples are families too
+FAMILIES_QUERY = f"""WITH parent_sets AS (
+    SELECT target_person_id AS child_id, array_agg(DISTINCT source_person_id ORDER BY source_person_id) AS parent_ids
+    FROM {SCHEMA}.relationships
+    WHERE tree_id = %(tree_id)s AND relationship_type <> 'spouse'
+    GROUP BY target_person_id
+), couples AS (
+    SELECT DISTINCT ARRAY[LEAST(source_person_id, target_person_id), GREATEST(source_person_id, target_person_id)] AS parent_ids
+    FROM {SCHEMA}.relationships
+    WHERE tree_id = %(tree_id)s AND relationship_type = 'spouse' AND source_person_id <> target_person_id
+), children AS (
+    SELECT parent_ids, array_agg(child_id ORDER BY child_id) AS child_ids FROM parent_sets GROUP BY parent_ids
+)
+SELECT f.parent_ids,
+    ARRAY(SELECT COALESCE(p.gender, '') FROM unnest(f.parent_ids) WITH ORDINALITY AS u(id, n)
+        JOIN {SCHEMA}.persons p ON p.id = u.id ORDER BY u.n) AS genders,
+    COALESCE(c.child_ids, '{{}}') AS child_ids
+FROM (SELECT parent_ids FROM couples UNION SELECT parent_ids FROM parent_sets) f
+LEFT JOIN children c ON c.parent_ids = f.parent_ids
+ORDER BY f.parent_ids"""
+
+# Same fields as a load-tree node, one JSON document per line built by Postgres
+NODES_NDJSON_QUERY = f"""SELECT json_build_object(
+    'record', 'node', 'id', COALESCE(client_id, id::text),
+    'x', COALESCE(position_x, 0)::float8, 'y', COALESCE(position_y, 0)::float8,
+    'firstName', COALESCE(first_name, ''), 'lastName', COALESCE(last_name, ''),
+    'middleName', COALESCE(middle_name, ''), 'maidenName', COALESCE(maiden_name, ''),
+    'gender', COALESCE(NULLIF(gender, ''), 'male'),
+    'birthDate', COALESCE(birth_date, ''), 'birthPlace', COALESCE(birth_place, ''),
+    'deathDate', COALESCE(death_date, ''), 'deathPlace', COALESCE(death_place, ''),
+    'isAlive', is_alive IS NOT FALSE, 'occupation', COALESCE(occupation, ''),
+    'bio', COALESCE(bio, ''), 'historyContext', COALESCE(history_context, '')
+)::text
+FROM {SCHEMA}.persons
+WHERE tree_id = %s
+ORDER BY id"""
+
+# json_strip_nulls drops "type" from parent edges, as load-tree does
+EDGES_NDJSON_QUERY = f"""SELECT json_strip_nulls(json_build_object(
+    'record', 'edge', 'id', 'e-' || r.id,
+    'source', COALESCE(s.client_id, s.id::text), 'target', COALESCE(t.client_id, t.id::text),
+    'type', CASE WHEN r.relationship_type = 'spouse' THEN 'spouse' END
+))::text
+FROM {SCHEMA}.relationships r
+JOIN {SCHEMA}.persons s ON s.id = r.source_person_id
+JOIN {SCHEMA}.persons t ON t.id = r.target_person_id
+WHERE r.tree_id = %s
+ORDER BY r.id"""
+
+def batches(conn, name: str, query: str, params: Any) -> Iterator[List[tuple]]:
+    '''Rows of a query through a named (server-side) cursor, EXPORT_BATCH_ROWS per round-trip'''
+    cursor = conn.cursor(name=name)
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_ROWS)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+def gedcom_date(value: Optional[str]) -> str:
+    '''"1850-01-12" or "12.01.1850" -> "12 JAN 1850", "1850-01" -> "JAN 1850"; anything else as written'''
+    value = (value or '').strip()
+    match = ISO_DATE.match(value)
+    if match and 1 <= int(match.group(2)) <= 12:
+        year, month, day = match.groups()
+        return f'{int(day)} {MONTHS[int(month) - 1]} {year}' if day else f'{MONTHS[int(month) - 1]} {year}'
+    match = DOTTED_DATE.match(value)
+    if match and 1 <= int(match.group(2)) <= 12:
+        return f'{int(match.group(1))} {MONTHS[int(match.group(2)) - 1]} {match.group(3)}'
+    return value
+
+def gedcom_line(level: int, tag: str, value: Optional[str] = None) -> str:
+    '''One GEDCOM line plus CONT lines for newlines and CONC lines for long values'''
+    if not value:
+        return f'{level} {tag}\n'
+    lines = []
+    for index, text in enumerate(value.replace('\r\n', '\n').replace('@', '@@').split('\n')):
+        pieces = [text[i:i + GEDCOM_VALUE_CHARS] for i in range(0, len(text), GEDCOM_VALUE_CHARS)] or ['']
+        for piece_index, piece in enumerate(pieces):
+            prefix = f'{level} {tag}' if index == 0 and piece_index == 0 else f"{level + 1} {'CONC' if piece_index else 'CONT'}"
+            lines.append(f'{prefix} {piece}' if piece else prefix)
+    return '\n'.join(lines) + '\n'
+
+def gedcom_person(row: tuple) -> str:
+    (person_id, client_id, first_name, last_name, middle_name, maiden_name, gender,
+     birth_date, birth_place, death_date, death_place, is_alive, occupation, bio, history_context) = row
+    given = ' '.join(part for part in (first_name, middle_name) if part)
+    # Birth name first; a different current surname is written as a second NAME of type married
+    birth_surname = maiden_name or last_name or ''
+    parts = [f'0 @I{person_id}@ INDI\n', gedcom_line(1, 'NAME', f'{given} /{birth_surname}/'.strip())]
+    if given:
+        parts.append(gedcom_line(2, 'GIVN', given))
+    if birth_surname:
+        parts.append(gedcom_line(2, 'SURN', birth_surname))
+    if maiden_name and last_name and last_name != maiden_name:
+        parts += [gedcom_line(1, 'NAME', f'{first_name or ""} /{last_name}/'.strip()), '2 TYPE married\n']
+    if gender in ('male', 'female'):
+        parts.append(f"1 SEX {'M' if gender == 'male' else 'F'}\n")
+    if birth_date or birth_place:
+        parts += ['1 BIRT\n', gedcom_line(2, 'DATE', gedcom_date(birth_date)) if birth_date else '',
+                  gedcom_line(2, 'PLAC', birth_place) if birth_place else '']
+    if death_date or death_place:
+        parts += ['1 DEAT\n', gedcom_line(2, 'DATE', gedcom_date(death_date)) if death_date else '',
+                  gedcom_line(2, 'PLAC', death_place) if death_place else '']
+    elif is_alive is False:
+        parts.append('1 DEAT Y\n')
+    if occupation:
+        parts.append(gedcom_line(1, 'OCCU', occupation))
+    for note in (bio, history_context):
+        if note:
+            parts.append(gedcom_line(1, 'NOTE', note))
+    if client_id and client_id != str(person_id):
+        parts.append(gedcom_line(1, 'REFN', client_id))
+    return ''.join(parts)
+
+def gedcom_family(number: int, parent_ids: List[int], genders: List[str], child_ids: List[int]) -> str:
+    # HUSB is the first male parent, WIFE the other one; a lone mother is WIFE
+    parents = list(zip(parent_ids, genders))
+    husband = next((person_id for person_id, gender in parents if gender == 'male'), None)
+    if husband is None and parents and (len(parents) > 1 or parents[0][1] != 'female'):
+        husband = parents[0][0]
+    wife = next((person_id for person_id, _ in parents if person_id != husband), None)
+    parts = [f'0 @F{number}@ FAM\n']
+    if husband is not None:
+        parts.append(f'1 HUSB @I{husband}@\n')
+    if wife is not None:
+        parts.append(f'1 WIFE @I{wife}@\n')
+    parts += [f'1 CHIL @I{child_id}@\n' for child_id in child_ids]
+    return ''.join(parts)
+
+def gedcom_chunks(conn, tree: Dict[str, Any], counts: Dict[str, int]) -> Iterator[str]:
+    yield (
+        '0 HEAD\n1 SOUR FAMILY_TREE_BUILDER\n1 SUBM @U1@\n1 GEDC\n2 VERS 5.5.1\n2 FORM LINEAGE-LINKED\n1 CHAR UTF-8\n'
+        + gedcom_line(1, 'FILE', tree.get('title') or '')
+        + '0 @U1@ SUBM\n1 NAME Family Tree Builder\n'
+    )
+    for rows in batches(conn, 'export_persons', PERSONS_QUERY, (tree['id'],)):
+        counts['persons'] += len(rows)
+        yield ''.join(gedcom_person(row) for row in rows)
+    for rows in batches(conn, 'export_families', FAMILIES_QUERY, {'tree_id': tree['id']}):
+        start = counts['families']
+        counts['families'] += len(rows)
+        yield ''.join(gedcom_family(start + i + 1, *row) for i, row in enumerate(rows))
+    yield '0 TRLR\n'
+
+def ndjson_chunks(conn, tree: Dict[str, Any], counts: Dict[str, int]) -> Iterator[str]:
+    yield json.dumps({
+        'record': 'tree', 'tree_id': tree['id'], 'title': tree.get('title'),
+        'description': tree.get('description'), 'version': tree.get('version')
+    }, ensure_ascii=False) + '\n'
+    for rows in batches(conn, 'export_nodes', NODES_NDJSON_QUERY, (tree['id'],)):
+        counts['persons'] += len(rows)
+        yield ''.join(row[0] + '\n' for row in rows)
+    for rows in batches(conn, 'export_edges', EDGES_NDJSON_QUERY, (tree['id'],)):
+        counts['edges'] += len(rows)
+        yield ''.join(row[0] + '\n' for row in rows)
+
+FORMATS = {'gedcom': gedcom_chunks, 'ndjson': ndjson_chunks}
+
+def export_tree(conn, tree: Dict[str, Any], export_format: str, out: BinaryIO, compress: bool = False) -> Dict[str, int]:
+    '''Write the whole tree to out; memory stays at one batch of rows whatever the tree size'''
+    counts = {'persons': 0, 'families': 0, 'edges': 0, 'bytes': 0}
+    sink = gzip.GzipFile(fileobj=out, mode='wb', compresslevel=GZIP_LEVEL) if compress else out
+    try:
+        for chunk in FORMATS[export_format](conn, tree, counts):
+            data = chunk.encode('utf-8')
+            counts['bytes'] += len(data)
+            sink.write(data)
+    finally:
+        if compress:
+            sink.close()
+    return counts
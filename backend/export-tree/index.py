@@ -0,0 +1,122 @@
+'''
+Business: Export a whole family tree as a GEDCOM 5.5.1 or NDJSON file, read in batches with server-side cursors
+Args: event - dict with httpMethod, queryStringParameters (tree_id, user_email, format=gedcom|ndjson, compress=gzip)
+      context - object with request_id
+Returns: HTTP response with the export file as an attachment (base64 when gzip-compressed), 413 above
+         EXPORT_MAX_BYTES: the response is a single body, so the whole file is held in memory
+'''
+import base64
+import io
+import json
+import os
+from typing import Dict, Any
+from db import discard_connection, get_connection, release_connection
+from export import FORMATS, export_tree
+
+SCHEMA = '"t_p57451291_family_tree_builder_"'
+
+# Largest file the endpoint returns; export_tree() itself streams to a file in flat memory
+MAX_EXPORT_BYTES = int(os.environ.get('EXPORT_MAX_BYTES', str(32 * 1024 * 1024)))
+CONTENT_TYPES = {'gedcom': 'text/plain; charset=utf-8', 'ndjson': 'application/x-ndjson; charset=utf-8'}
+EXTENSIONS = {'gedcom': 'ged', 'ndjson': 'ndjson'}
+
+class ExportTooLarge(Exception):
+    pass
+
+class CappedBuffer(io.BytesIO):
+    '''In-memory file that stops the export as soon as it grows past max_bytes'''
+
+    def __init__(self, max_bytes: int):
+        super().__init__()
+        self.max_bytes = max_bytes
+
+    def write(self, data) -> int:
+        if self.tell() + len(data) > self.max_bytes:
+            raise ExportTooLarge()
+        return super().write(data)
+
+def error(status: int, message: str) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'error': message})
+    }
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Email',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+
+    if method != 'GET':
+        return error(405, 'Method not allowed')
+
+    params = event.get('queryStringParameters', {}) or {}
+    tree_id = params.get('tree_id')
+    user_email = params.get('user_email') or (event.get('headers', {}) or {}).get('X-User-Email')
+    export_format = params.get('format', 'gedcom')
+    compress = params.get('compress', '')
+
+    if not tree_id or not tree_id.isdigit():
+        return error(400, 'tree_id is required')
+    if not user_email:
+        return error(400, 'user_email is required')
+    if export_format not in FORMATS:
+        return error(400, 'format must be gedcom or ndjson')
+    if compress not in ('', 'gzip'):
+        return error(400, 'compress must be gzip or empty')
+
+    database_url = os.environ.get('DATABASE_URL')
+    conn = get_connection(database_url)
+    out = CappedBuffer(MAX_EXPORT_BYTES)
+    try:
+        cursor = conn.cursor()
+        # Persons and relationships are read by separate cursors, one snapshot keeps them consistent with each other
+        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+        cursor.execute(
+            f"""SELECT ft.id, ft.title, ft.description, ft.version
+            FROM {SCHEMA}.family_trees ft
+            WHERE ft.id = %s AND ft.user_id IN (SELECT id FROM {SCHEMA}.users WHERE email = %s)""",
+            (int(tree_id), user_email)
+        )
+        row = cursor.fetchone()
+        cursor.close()
+        if not row:
+            return error(404, 'Tree not found or access denied')
+        tree = dict(zip(('id', 'title', 'description', 'version'), row))
+
+        counts = export_tree(conn, tree, export_format, out, compress=bool(compress))
+        conn.rollback()
+    except ExportTooLarge:
+        hint = '' if compress else ', try compress=gzip'
+        return error(413, f'Export is larger than {MAX_EXPORT_BYTES} bytes{hint}')
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
+    data = out.getbuffer()
+
+    filename = f"tree-{tree['id']}.{EXTENSIONS[export_format]}{'.gz' if compress else ''}"
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/gzip' if compress else CONTENT_TYPES[export_format],
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'Content-Disposition, ETag, X-Export-Persons',
+            'ETag': f'W/"{tree["id"]}-{tree["version"]}"',
+            'X-Export-Persons': str(counts['persons'])
+        },
+        'isBase64Encoded': bool(compress),
+        'body': base64.b64encode(data).decode('ascii') if compress else str(data, 'utf-8')
+    }
@@ -0,0 +1,266 @@
+'''
+Business: Find persons entered twice in one family tree without comparing all pairs: persons are grouped by blocking
+          keys (phonetic surname and first name, birth year, maiden/last name cross match) and scored only within a block
+Args: persons - rows (id, key, first_name, last_name, middle_name, maiden_name, gender, birth_date, birth_place, death_date),
+      relationships - rows (source_person_id, target_person_id, relationship_type)
+Returns: merge suggestions ranked by score, each with the person to keep, the duplicate and the reasons
+'''
+import re
+from bisect import bisect_right
+from collections import defaultdict
+from functools import lru_cache
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Blocks larger than this are not compared all-pairs but as a sorted neighbourhood
+MAX_BLOCK = 8
+# Inside an oversized block a person is compared with the next ones born within a year,
+# at most MAX_NEIGHBOURS of them, or the next WINDOW ones when the birth year is unknown
+MAX_NEIGHBOURS = 6
+WINDOW = 4
+# Duplicates born further apart than this are not the same person
+MAX_YEAR_GAP = 5
+MIN_SCORE = 0.75
+
+# Without agreeing birth dates the other fields alone stay below MIN_SCORE
+WEIGHTS = {'first': 0.25, 'surname': 0.2, 'middle': 0.2, 'birth': 0.3, 'place': 0.05}
+RELATIVES_BONUS = 0.1
+
+LATIN_TO_CYRILLIC = [
+    ('shch', 'щ'), ('sch', 'щ'), ('zh', 'ж'), ('kh', 'х'), ('ts', 'ц'), ('ch', 'ч'), ('sh', 'ш'),
+    ('yu', 'ю'), ('ya', 'я'), ('yo', 'ё'), ('ju', 'ю'), ('ja', 'я'),
+    ('a', 'а'), ('b', 'б'), ('v', 'в'), ('w', 'в'), ('g', 'г'), ('d', 'д'), ('e', 'е'), ('z', 'з'),
+    ('i', 'и'), ('j', 'й'), ('k', 'к'), ('c', 'к'), ('q', 'к'), ('l', 'л'), ('m', 'м'), ('n', 'н'),
+    ('o', 'о'), ('p', 'п'), ('r', 'р'), ('s', 'с'), ('t', 'т'), ('u', 'у'), ('f', 'ф'), ('h', 'х'),
+    ('x', 'кс'), ('y', 'ы')
+]
+LATIN_PATTERN = re.compile('|'.join(latin for latin, _ in LATIN_TO_CYRILLIC))
+LATIN_LETTERS = dict(LATIN_TO_CYRILLIC)
+NON_LETTERS = re.compile(r'[^a-zа-яё]+')
+# Surname endings that differ between men and women or between spellings; both forms get one code
+SURNAME_ENDINGS = re.compile(r'(?:ов|ев|ёв)а?$|ина?$|(?:ск|цк)(?:ий|ая|ой)$|(?:ий|ый|ая|ой)$')
+ENDING_CODES = {'ов': '4', 'ев': '4', 'ёв': '4', 'ин': '8', 'ск': '7', 'цк': '7'}
+VOWELS = str.maketrans('оыаяюуеёэий', 'ааааууиииии')
+VOICED = str.maketrans('бвгдзж', 'пфктсш')
+SOFT_YA = re.compile(r'[иь][яа]')
+REPEATS = re.compile(r'(.)\1+')
+YEAR = re.compile(r'\b(1[0-9]{3}|20[0-9]{2})\b')
+
+@lru_cache(maxsize=65536)
+def normalize(name: Optional[str]) -> str:
+    '''Lower-case Cyrillic letters only; Latin spellings are transliterated'''
+    name = NON_LETTERS.sub('', (name or '').lower())
+    if name and name[0] < 'а':
+        name = LATIN_PATTERN.sub(lambda match: LATIN_LETTERS[match.group(0)], name)
+        # "Andrey", "Dmitriy", "Dmitry", "Yuri": the final y or i is й or ий
+        name = re.sub(r'(?<=[аеиоуыэюя])ы', 'й', name)
+        name = re.sub(r'(?<=[^аеиоуыэюяй])[ыи]$', 'ий', name)
+    return name.replace('ё', 'е')
+
+@lru_cache(maxsize=65536)
+def phonetic(name: str) -> str:
+    '''Russian Metaphone style code of a normalized name: Смирнов, Смирнова and Smirnov share one'''
+    if not name:
+        return ''
+    # Марья/Мария/Maria, Дарья/Darya, Наталья/Наталия/Natalia
+    name = SOFT_YA.sub('я', name).replace('ь', '').replace('ъ', '')
+    ending = ''
+    match = SURNAME_ENDINGS.search(name)
+    if match and match.start() >= 2:
+        ending = ENDING_CODES.get(match.group(0)[:2], '6')
+        name = name[:match.start()]
+    name = name.replace('тс', 'ц').replace('дс', 'ц')
+    return REPEATS.sub(r'\1', name.translate(VOWELS).translate(VOICED)) + ending
+
+def similarity(a: str, b: str, code_a: str, code_b: str) -> float:
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    if code_a == code_b:
+        return 0.85
+    return spelling_ratio(a, b) if a < b else spelling_ratio(b, a)
+
+@lru_cache(maxsize=65536)
+def spelling_ratio(a: str, b: str) -> float:
+    # Names repeat a lot within a tree, each distinct pair is compared once
+    return SequenceMatcher(None, a, b).ratio() * 0.8
+
+class Person:
+    __slots__ = ('index', 'id', 'key', 'first', 'first_code', 'surnames', 'middle', 'middle_code',
+                 'gender', 'birth_date', 'year', 'place', 'death_year', 'filled')
+
+    def __init__(self, index: int, row: tuple):
+        person_id, key, first_name, last_name, middle_name, maiden_name, gender, birth_date, birth_place, death_date = row
+        self.index = index
+        self.id = person_id
+        self.key = key
+        self.first = normalize(first_name)
+        self.first_code = phonetic(self.first)
+        # (normalized, code, is_maiden) for the current and the maiden surname
+        self.surnames = [(name, phonetic(name), is_maiden)
+                         for name, is_maiden in ((normalize(last_name), False), (normalize(maiden_name), True)) if name]
+        self.middle = normalize(middle_name)
+        self.middle_code = phonetic(self.middle)
+        self.gender = gender or ''
+        self.birth_date = (birth_date or '').strip()
+        year = YEAR.search(self.birth_date)
+        self.year = int(year.group(1)) if year else None
+        self.place = (birth_place or '').strip().lower()
+        death_year = YEAR.search(death_date or '')
+        self.death_year = int(death_year.group(1)) if death_year else None
+        self.filled = sum(1 for value in row[2:] if value)
+
+def blocking_keys(person: Person) -> Iterator[tuple]:
+    '''Each key leaves out one of surname, first name, patronymic and birth year, so a duplicate that differs
+    in any single one of them still shares a block with the original'''
+    first, middle, year = person.first_code, person.middle_code, person.year
+    # A maiden name is blocked like a surname, so a woman entered once under each name lands in one block
+    for _, surname, _ in person.surnames:
+        if first and year:
+            yield ('surname-first-year', surname, first, year)
+        if first and middle:
+            yield ('surname-first-middle', surname, first, middle)
+        if middle and year:
+            yield ('surname-middle-year', surname, middle, year)
+    if first and middle and year:
+        yield ('first-middle-year', first, middle, year)
+
+def pair_up(members: List[int], people: List[Person], pairs: Set[Tuple[int, int]],
+            only: Optional[Set[int]] = None) -> None:
+    '''All pairs of a small block, a sorted neighbourhood of an oversized one; with only, just pairs touching it'''
+    if len(members) <= MAX_BLOCK:
+        pairs.update((a, b) if a < b else (b, a) for i, a in enumerate(members) for b in members[i + 1:]
+                     if only is None or a in only or b in only)
+        return
+    # Likely duplicates sort next to each other
+    members = sorted(members, key=lambda i: (people[i].year or 0, people[i].middle_code, people[i].place))
+    years = [people[i].year or 0 for i in members]
+    for position, a in enumerate(members):
+        year = years[position]
+        end = bisect_right(years, year + 1, position + 1) if year else position + 1 + WINDOW
+        for b in members[position + 1:min(end, position + 1 + MAX_NEIGHBOURS)]:
+            if only is None or a in only or b in only:
+                pairs.add((a, b) if a < b else (b, a))
+
+def candidate_pairs(people: List[Person], min_score: float = MIN_SCORE) -> Set[Tuple[int, int]]:
+    blocks: Dict[tuple, List[int]] = defaultdict(list)
+    for person in people:
+        for key in set(blocking_keys(person)):
+            blocks[key].append(person.index)
+    # Two full birth dates in different months leave birth agreement at 0, and such a pair cannot reach min_score
+    split_by_month = min_score > 1 - WEIGHTS['birth']
+    pairs: Set[Tuple[int, int]] = set()
+    for members in blocks.values():
+        if len(members) < 2:
+            continue
+        if not split_by_month:
+            pair_up(members, people, pairs)
+            continue
+        months: Dict[str, List[int]] = defaultdict(list)
+        undated = set()
+        for i in members:
+            if len(people[i].birth_date) >= 7:
+                months[people[i].birth_date[:7]].append(i)
+            else:
+                undated.add(i)
+        for group in months.values():
+            if len(group) > 1:
+                pair_up(group, people, pairs)
+        if undated:
+            pair_up(members, people, pairs, only=undated)
+    return pairs
+
+def birth_agreement(a: Person, b: Person) -> float:
+    if not (a.year and b.year):
+        return 0.4
+    gap = abs(a.year - b.year)
+    if a.birth_date == b.birth_date:
+        return 1.0
+    if min(len(a.birth_date), len(b.birth_date)) <= 7:
+        # A year-only date agrees with a full one of the same year, and nearly with the next one
+        return 0.8 if gap == 0 else 0.5 if gap == 1 else 0.0
+    # Two different full dates: a typo in the day is plausible, anything else is another person
+    return 0.6 if a.birth_date[:7] == b.birth_date[:7] else 0.0
+
+def score_pair(a: Person, b: Person, relatives: List[Set[int]], min_score: float = 0.0,
+               reasons: Optional[List[str]] = None) -> float:
+    '''Weighted similarity in 0..1, 0 when the two cannot be the same person or cannot reach min_score.
+    Fills reasons when a list is passed'''
+    if a.gender and b.gender and a.gender != b.gender:
+        return 0.0
+    if a.year and b.year and abs(a.year - b.year) > MAX_YEAR_GAP:
+        return 0.0
+    if a.death_year and b.death_year and abs(a.death_year - b.death_year) > 1:
+        return 0.0
+
+    # Cheap comparisons first: most pairs in a block share the name and are told apart by dates and patronymic
+    birth = birth_agreement(a, b)
+    if a.middle and b.middle:
+        # Different fathers' names are strong evidence of two different people
+        middle = 1.0 if a.middle == b.middle else 0.85 if a.middle_code == b.middle_code else 0.0
+    else:
+        middle = 0.5
+    place = (1.0 if a.place == b.place else 0.0) if a.place and b.place else 0.5
+    score = WEIGHTS['birth'] * birth + WEIGHTS['middle'] * middle + WEIGHTS['place'] * place
+    if score + WEIGHTS['first'] + WEIGHTS['surname'] + RELATIVES_BONUS < min_score:
+        return 0.0
+
+    first = similarity(a.first, b.first, a.first_code, b.first_code)
+    if first < 0.5:
+        return 0.0
+    surname, cross = 0.0, False
+    for name_a, code_a, maiden_a in a.surnames:
+        for name_b, code_b, maiden_b in b.surnames:
+            value = similarity(name_a, name_b, code_a, code_b)
+            if value > surname:
+                surname, cross = value, maiden_a != maiden_b
+    score += WEIGHTS['first'] * first + WEIGHTS['surname'] * surname
+    # The same parents or spouse on both records is the strongest sign of one person entered twice
+    # (siblings share parents too, but are born years apart)
+    shared = bool(relatives[a.index] & relatives[b.index]) and birth >= 0.5
+    if shared:
+        score += RELATIVES_BONUS
+
+    if reasons is not None:
+        reasons.append('same first name' if first == 1.0 else 'similar first name')
+        if surname >= 0.85:
+            reasons.append('maiden and last name match' if cross else 'same surname' if surname == 1.0 else 'similar surname')
+        if middle >= 0.85:
+            reasons.append('same patronymic')
+        if birth >= 0.8:
+            reasons.append('same birth date' if birth == 1.0 else 'same birth year')
+        if place == 1.0:
+            reasons.append('same birth place')
+        if shared:
+            reasons.append('shared relatives')
+    return min(score, 1.0)
+
+def find_duplicates(persons: Iterable[tuple], relationships: Iterable[tuple],
+                    min_score: float = MIN_SCORE, limit: Optional[int] = None) -> List[Dict]:
+    people = [Person(i, row) for i, row in enumerate(persons)]
+    position = {person.id: person.index for person in people}
+    relatives: List[Set[int]] = [set() for _ in people]
+    linked: Set[Tuple[int, int]] = set()
+    for source, target, _ in relationships:
+        a, b = position.get(source), position.get(target)
+        if a is None or b is None:
+            continue
+        relatives[a].add(b)
+        relatives[b].add(a)
+        linked.add((a, b) if a < b else (b, a))
+
+    suggestions = []
+    for a, b in candidate_pairs(people, min_score):
+        # A parent, child or spouse of someone is not their duplicate
+        if (a, b) in linked:
+            continue
+        score = score_pair(people[a], people[b], relatives, min_score)
+        if score >= min_score:
+            reasons: List[str] = []
+            score_pair(people[a], people[b], relatives, reasons=reasons)
+            # The record with more fields filled in survives the merge
+            keep, remove = sorted((people[a], people[b]), key=lambda person: (-person.filled, person.id))
+            suggestions.append({'score': round(score, 4), 'keep': keep.key, 'remove': remove.key, 'reasons': reasons})
+    suggestions.sort(key=lambda suggestion: (-suggestion['score'], suggestion['keep'], suggestion['remove']))
+    return suggestions[:limit] if limit else suggestions
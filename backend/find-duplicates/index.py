@@ -0,0 +1,311 @@
+'''
+Business: Suggest persons entered twice in a family tree and merge confirmed duplicates
+Args: event - dict with httpMethod; GET queryStringParameters (tree_id, user_email, min_score, limit) lists ranked
+      merge suggestions, POST body (tree_id, user_email, merges - list of {keep, remove} person ids as in load-tree)
+      merges them: relationships of each removed person are moved to the kept one in bulk
+      context - object with request_id
+Returns: HTTP response with the suggestions, or the new tree version and merged/rewritten counts
+'''
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Tuple
+from psycopg2.extras import execute_values
+from db import discard_connection, get_connection, release_connection
+from dedupe import MIN_SCORE, find_duplicates
+
+SCHEMA = '"t_p57451291_family_tree_builder_"'
+
+# Suggestions of recently checked trees, recomputed when the tree version changes
+MAX_CACHED_TREES = int(os.environ.get('DUPLICATES_CACHE_TREES', '4'))
+# Suggestions are computed once down to this score, min_score only filters them; above 0.7 blocking may skip
+# pairs whose full birth dates fall in different months
+MIN_SCORE_FLOOR = 0.71
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+MAX_MERGES = 10000
+
+# Rows per multi-row VALUES statement in bulk writes
+BULK_PAGE_SIZE = 1000
+
+# Removed persons keep nothing of their own: empty fields of the kept person are filled from them first
+FILL_KEPT = f"""UPDATE {SCHEMA}.persons k SET
+    first_name = COALESCE(NULLIF(k.first_name, ''), r.first_name),
+    last_name = COALESCE(NULLIF(k.last_name, ''), r.last_name),
+    middle_name = COALESCE(NULLIF(k.middle_name, ''), r.middle_name),
+    maiden_name = COALESCE(NULLIF(k.maiden_name, ''), r.maiden_name),
+    gender = COALESCE(k.gender, r.gender),
+    birth_date = COALESCE(NULLIF(k.birth_date, ''), r.birth_date),
+    birth_place = COALESCE(NULLIF(k.birth_place, ''), r.birth_place),
+    death_date = COALESCE(NULLIF(k.death_date, ''), r.death_date),
+    death_place = COALESCE(NULLIF(k.death_place, ''), r.death_place),
+    occupation = COALESCE(NULLIF(k.occupation, ''), r.occupation),
+    bio = COALESCE(NULLIF(k.bio, ''), r.bio),
+    history_context = COALESCE(NULLIF(k.history_context, ''), r.history_context),
+    updated_at = CURRENT_TIMESTAMP
+FROM merge_map m JOIN {SCHEMA}.persons r ON r.id = m.remove_id
+WHERE k.id = m.keep_id"""
+
+# Every edge touching a removed person, re-pointed at the kept one; edges that would now link a person
+# to itself or repeat an existing edge (a spouse edge in either direction) are dropped
+REWRITE_RELATIONSHIPS = f"""INSERT INTO {SCHEMA}.relationships (tree_id, source_person_id, target_person_id, relationship_type)
+SELECT DISTINCT r.tree_id, COALESCE(ms.keep_id, r.source_person_id), COALESCE(mt.keep_id, r.target_person_id), r.relationship_type
+FROM {SCHEMA}.relationships r
+LEFT JOIN merge_map ms ON ms.remove_id = r.source_person_id
+LEFT JOIN merge_map mt ON mt.remove_id = r.target_person_id
+WHERE r.tree_id = %(tree_id)s AND (ms.remove_id IS NOT NULL OR mt.remove_id IS NOT NULL)
+AND COALESCE(ms.keep_id, r.source_person_id) <> COALESCE(mt.keep_id, r.target_person_id)
+AND NOT (r.relationship_type = 'spouse' AND EXISTS (
+    SELECT 1 FROM {SCHEMA}.relationships x
+    WHERE x.source_person_id = COALESCE(mt.keep_id, r.target_person_id)
+    AND x.target_person_id = COALESCE(ms.keep_id, r.source_person_id) AND x.relationship_type = 'spouse'
+))
+ON CONFLICT (source_person_id, target_person_id, relationship_type) DO NOTHING"""
+
+_lock = threading.Lock()
+_suggestions: 'OrderedDict[str, Tuple[int, List[Dict[str, Any]]]]' = OrderedDict()
+suggestion_stats = {'hits': 0, 'builds': 0}
+
+def response(status: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'isBase64Encoded': False,
+        'body': json.dumps(payload, ensure_ascii=False)
+    }
+
+def person_summary(row: tuple) -> Dict[str, str]:
+    _, key, first_name, last_name, middle_name, maiden_name, _, birth_date, birth_place, death_date = row
+    return {
+        'id': key,
+        'firstName': first_name or '',
+        'lastName': last_name or '',
+        'middleName': middle_name or '',
+        'maidenName': maiden_name or '',
+        'birthDate': birth_date or '',
+        'birthPlace': birth_place or '',
+        'deathDate': death_date or ''
+    }
+
+def build_suggestions(cursor, tree_id: str) -> List[Dict[str, Any]]:
+    '''Two narrow scans (name/date columns and edges), then blocking and scoring in memory'''
+    cursor.execute(
+        f"""SELECT id, COALESCE(client_id, id::text), first_name, last_name, middle_name, maiden_name,
+        gender, birth_date, birth_place, death_date
+        FROM {SCHEMA}.persons WHERE tree_id = %s""",
+        (tree_id,)
+    )
+    persons = cursor.fetchall()
+    cursor.execute(
+        f"""SELECT source_person_id, target_person_id, relationship_type
+        FROM {SCHEMA}.relationships WHERE tree_id = %s""",
+        (tree_id,)
+    )
+    suggestions = find_duplicates(persons, cursor.fetchall(), min_score=MIN_SCORE_FLOOR)
+    listed = {key for suggestion in suggestions for key in (suggestion['keep'], suggestion['remove'])}
+    summaries = {row[1]: person_summary(row) for row in persons if row[1] in listed}
+    for suggestion in suggestions:
+        suggestion['keep'] = summaries[suggestion['keep']]
+        suggestion['remove'] = summaries[suggestion['remove']]
+    return suggestions
+
+def get_suggestions(cursor, tree_id: str, version: int) -> List[Dict[str, Any]]:
+    with _lock:
+        cached = _suggestions.get(tree_id)
+        if cached and cached[0] == version:
+            _suggestions.move_to_end(tree_id)
+            suggestion_stats['hits'] += 1
+            return cached[1]
+    suggestions = build_suggestions(cursor, tree_id)
+    with _lock:
+        _suggestions[tree_id] = (version, suggestions)
+        _suggestions.move_to_end(tree_id)
+        while len(_suggestions) > MAX_CACHED_TREES:
+            _suggestions.popitem(last=False)
+        suggestion_stats['builds'] += 1
+    return suggestions
+
+def merge_map(cursor, tree_id: int, merges: List[Dict[str, Any]]) -> Dict[int, int]:
+    '''removed person id -> kept person id; chains like A->B, B->C resolve to the last kept person.
+    Raises ValueError for ids that are not in the tree'''
+    keys = {str(merge.get(field)) for merge in merges for field in ('keep', 'remove')}
+    cursor.execute(
+        f"""SELECT COALESCE(client_id, id::text), id FROM {SCHEMA}.persons
+        WHERE tree_id = %s AND COALESCE(client_id, id::text) = ANY(%s)""",
+        (tree_id, list(keys))
+    )
+    ids = dict(cursor.fetchall())
+    missing = sorted(keys - set(ids))
+    if missing:
+        raise ValueError(f"Persons not found in the tree: {', '.join(missing[:10])}")
+
+    parent: Dict[int, int] = {}
+
+    def find(person_id: int) -> int:
+        while parent.get(person_id, person_id) != person_id:
+            person_id = parent[person_id]
+        return person_id
+
+    for merge in merges:
+        keep, remove = find(ids[str(merge['keep'])]), find(ids[str(merge['remove'])])
+        if keep != remove:
+            parent[remove] = keep
+    return {person_id: find(person_id) for person_id in parent}
+
+def merge_persons(cursor, tree_id: int, mapping: Dict[int, int]) -> Tuple[int, int, int]:
+    '''Bulk merge through a temp mapping table; returns (persons removed, edges rewritten, edges removed)'''
+    cursor.execute("CREATE TEMP TABLE merge_map (remove_id INTEGER PRIMARY KEY, keep_id INTEGER NOT NULL) ON COMMIT DROP")
+    execute_values(cursor, "INSERT INTO merge_map (remove_id, keep_id) VALUES %s", list(mapping.items()), page_size=BULK_PAGE_SIZE)
+    cursor.execute(FILL_KEPT)
+    cursor.execute(REWRITE_RELATIONSHIPS, {'tree_id': tree_id})
+    rewritten = cursor.rowcount
+    cursor.execute(
+        f"""DELETE FROM {SCHEMA}.relationships r USING merge_map m
+        WHERE r.source_person_id = m.remove_id OR r.target_person_id = m.remove_id"""
+    )
+    removed_edges = cursor.rowcount
+    cursor.execute(f"DELETE FROM {SCHEMA}.persons p USING merge_map m WHERE p.id = m.remove_id AND p.tree_id = %s", (tree_id,))
+    return cursor.rowcount, rewritten, removed_edges
+
+def list_suggestions(params: Dict[str, str], user_email: str) -> Dict[str, Any]:
+    tree_id = params.get('tree_id')
+    if not tree_id or not tree_id.isdigit():
+        return response(400, {'error': 'tree_id is required'})
+    try:
+        min_score = float(params.get('min_score', MIN_SCORE))
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return response(400, {'error': 'min_score and limit must be numbers'})
+    if not (MIN_SCORE_FLOOR <= min_score <= 1 and 1 <= limit <= MAX_LIMIT):
+        return response(400, {'error': f'min_score must be between {MIN_SCORE_FLOOR} and 1, limit between 1 and {MAX_LIMIT}'})
+    tree_id = str(int(tree_id))
+
+    conn = get_connection(os.environ.get('DATABASE_URL'))
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""SELECT ft.version FROM {SCHEMA}.family_trees ft
+            WHERE ft.id = %s AND ft.user_id IN (SELECT id FROM {SCHEMA}.users WHERE email = %s)""",
+            (tree_id, user_email)
+        )
+        row = cursor.fetchone()
+        suggestions = get_suggestions(cursor, tree_id, row[0]) if row else None
+        conn.rollback()
+        cursor.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
+    if row is None:
+        return response(404, {'error': 'Tree not found or access denied'})
+
+    matching = [suggestion for suggestion in suggestions if suggestion['score'] >= min_score]
+    return response(200, {
+        'tree_id': int(tree_id),
+        'version': row[0],
+        'total': len(matching),
+        'suggestions': matching[:limit]
+    })
+
+def merge(body_data: Dict[str, Any], user_email: str) -> Dict[str, Any]:
+    try:
+        tree_id = int(body_data.get('tree_id') or 0)
+    except (ValueError, TypeError):
+        return response(400, {'error': 'tree_id must be a number'})
+    merges = body_data.get('merges')
+    if not tree_id:
+        return response(400, {'error': 'tree_id is required'})
+    if not isinstance(merges, list) or not merges or len(merges) > MAX_MERGES:
+        return response(400, {'error': f'merges must be a list of 1-{MAX_MERGES} {{keep, remove}} pairs'})
+    if not all(isinstance(item, dict) and item.get('keep') is not None and item.get('remove') is not None
+               and str(item['keep']) != str(item['remove']) for item in merges):
+        return response(400, {'error': 'Each merge needs different keep and remove person ids'})
+
+    conn = get_connection(os.environ.get('DATABASE_URL'))
+    try:
+        cursor = conn.cursor()
+        # Locks the tree row, so a concurrent save-tree waits instead of writing edges to removed persons
+        cursor.execute(
+            f"""UPDATE {SCHEMA}.family_trees SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND user_id IN (SELECT id FROM {SCHEMA}.users WHERE email = %s)
+            RETURNING version""",
+            (tree_id, user_email)
+        )
+        row = cursor.fetchone()
+        if not row:
+            conn.rollback()
+            cursor.close()
+            return response(404, {'error': 'Tree not found or access denied'})
+        version = row[0]
+
+        try:
+            mapping = merge_map(cursor, tree_id, merges)
+        except ValueError as e:
+            conn.rollback()
+            cursor.close()
+            return response(400, {'error': str(e)})
+
+        merged, rewritten, removed_edges = merge_persons(cursor, tree_id, mapping)
+        cursor.execute(
+            f"""UPDATE {SCHEMA}.family_trees
+            SET persons_count = persons_count - %s, relationships_count = relationships_count + %s - %s
+            WHERE id = %s""",
+            (merged, rewritten, removed_edges, tree_id)
+        )
+        # A cached load-tree body would still list the removed persons and their old edges
+        cursor.execute(f"DELETE FROM {SCHEMA}.tree_snapshots WHERE tree_id = %s", (tree_id,))
+
+        conn.commit()
+        cursor.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
+
+    return response(200, {
+        'tree_id': tree_id,
+        'version': version,
+        'message': 'Persons merged successfully',
+        'merged': merged,
+        'relationships_rewritten': rewritten,
+        'relationships_removed': removed_edges
+    })
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Email',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+
+    if method not in ('GET', 'POST'):
+        return response(405, {'error': 'Method not allowed'})
+
+    params = event.get('queryStringParameters', {}) or {}
+    headers = event.get('headers', {}) or {}
+
+    if method == 'GET':
+        user_email = params.get('user_email') or headers.get('X-User-Email')
+        if not user_email:
+            return response(400, {'error': 'user_email is required'})
+        return list_suggestions(params, user_email)
+
+    try:
+        body_data = json.loads(event.get('body') or '{}')
+    except ValueError:
+        return response(400, {'error': 'Body must be JSON'})
+    user_email = body_data.get('user_email') or headers.get('X-User-Email')
+    if not user_email:
+        return response(400, {'error': 'user_email is required'})
+    return merge(body_data, user_email)
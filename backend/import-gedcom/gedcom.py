@@ -0,0 +1,158 @@
+'''
+Business: Streaming GEDCOM 5.5.1 reader: one top-level record in memory at a time, INDI/FAM mapped to tree rows
+Args: stream - binary file-like object with the GEDCOM text (UTF-8, UTF-8 with BOM or Windows-1251)
+Returns: generators of records, persons rows (persons columns) and parent/spouse edges keyed by xref
+'''
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+LINE_PATTERN = re.compile(r'^\s*(\d+)\s+(?:(@[^@]+@)\s+)?(\S+)(?: (.*))?$')
+MONTHS = {
+    'JAN': 1, 'FEB': 2, 'MAR': 3, 'APR': 4, 'MAY': 5, 'JUN': 6,
+    'JUL': 7, 'AUG': 8, 'SEP': 9, 'OCT': 10, 'NOV': 11, 'DEC': 12
+}
+# Same order as the staging table columns in index.py
+PERSON_FIELDS = (
+    'client_id', 'first_name', 'last_name', 'middle_name', 'maiden_name', 'gender',
+    'birth_date', 'birth_place', 'death_date', 'death_place', 'is_alive', 'occupation', 'bio'
+)
+
+class Node:
+    '''One GEDCOM line with its subordinate lines'''
+    __slots__ = ('tag', 'value', 'xref', 'children')
+
+    def __init__(self, tag: str, value: str, xref: Optional[str] = None):
+        self.tag = tag
+        self.value = value
+        self.xref = xref
+        self.children: List['Node'] = []
+
+    def first(self, tag: str) -> Optional['Node']:
+        for child in self.children:
+            if child.tag == tag:
+                return child
+        return None
+
+    def all(self, tag: str) -> List['Node']:
+        return [child for child in self.children if child.tag == tag]
+
+    def get(self, *path: str) -> str:
+        '''Value at a tag path like get('BIRT', 'DATE'), empty string when missing'''
+        node: Optional[Node] = self
+        for tag in path:
+            node = node.first(tag) if node else None
+        return node.value if node else ''
+
+    def text(self) -> str:
+        '''Value with CONC/CONT continuation lines joined'''
+        parts = [self.value]
+        for child in self.children:
+            if child.tag == 'CONC':
+                parts.append(child.value)
+            elif child.tag == 'CONT':
+                parts.append('\n' + child.value)
+        return ''.join(parts)
+
+def decode_lines(stream) -> Iterator[str]:
+    '''Text lines of a binary stream; a line that is not valid UTF-8 is read as Windows-1251'''
+    first = True
+    for raw in stream:
+        if first:
+            raw = raw[3:] if raw.startswith(b'\xef\xbb\xbf') else raw
+            first = False
+        try:
+            line = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            line = raw.decode('cp1251', errors='replace')
+        yield line.rstrip('\r\n')
+
+def records(lines: Iterable[str], stats: Optional[dict] = None) -> Iterator[Node]:
+    '''Level-0 records with their subtrees, yielded as soon as the next record starts.
+    Lines that do not parse are counted in stats['skipped_lines'] and ignored'''
+    stack: List[Node] = []
+    for line in lines:
+        if not line.strip():
+            continue
+        match = LINE_PATTERN.match(line)
+        if not match:
+            if stats is not None:
+                stats['skipped_lines'] = stats.get('skipped_lines', 0) + 1
+            continue
+        level, xref, tag, value = int(match.group(1)), match.group(2), match.group(3), match.group(4) or ''
+        # A literal @ is written doubled in GEDCOM values
+        node = Node(tag.upper(), value.replace('@@', '@'), xref.strip('@') if xref else None)
+        if level == 0:
+            if stack:
+                yield stack[0]
+            stack = [node]
+            continue
+        if not stack or level > len(stack):
+            # A level jump without a parent line, nothing sensible to attach it to
+            if stats is not None:
+                stats['skipped_lines'] = stats.get('skipped_lines', 0) + 1
+            continue
+        del stack[level:]
+        stack[-1].children.append(node)
+        stack.append(node)
+    if stack:
+        yield stack[0]
+
+def iso_date(value: str) -> str:
+    '''"12 JAN 1850" -> "1850-01-12", "JAN 1850" -> "1850-01", "1850" -> "1850"; other dates are kept as written'''
+    parts = value.upper().split()
+    if len(parts) == 3 and parts[0].isdigit() and parts[1] in MONTHS and parts[2].isdigit():
+        return f'{int(parts[2]):04d}-{MONTHS[parts[1]]:02d}-{int(parts[0]):02d}'
+    if len(parts) == 2 and parts[0] in MONTHS and parts[1].isdigit():
+        return f'{int(parts[1]):04d}-{MONTHS[parts[0]]:02d}'
+    if len(parts) == 1 and parts[0].isdigit():
+        return parts[0]
+    return value.strip()
+
+def split_name(name: Node) -> Tuple[str, str, str]:
+    '''(given, patronymic or second given name, surname) of a NAME line like "Иван Петрович /Смирнов/"'''
+    value = name.value
+    surname = ''
+    if '/' in value:
+        before, _, rest = value.partition('/')
+        surname, _, after = rest.partition('/')
+        value = f'{before} {after}'
+    given = name.get('GIVN') or value
+    surname = name.get('SURN') or surname
+    words = given.split()
+    return (words[0] if words else ''), ' '.join(words[1:]), surname.strip()
+
+def person_row(record: Node) -> Tuple:
+    '''INDI record -> values in PERSON_FIELDS order'''
+    names = record.all('NAME')
+    first_name = middle_name = last_name = maiden_name = ''
+    if names:
+        # A name typed "married" is the current surname, the birth name then becomes the maiden name
+        married = next((name for name in names if name.get('TYPE').lower() == 'married'), None)
+        birth = next((name for name in names if name is not married), names[0])
+        first_name, middle_name, last_name = split_name(birth)
+        if married is not None:
+            maiden_name, last_name = last_name, split_name(married)[2] or last_name
+        elif record.get('_MARNM'):
+            maiden_name, last_name = last_name, record.get('_MARNM').strip('/ ')
+    sex = record.get('SEX').upper()
+    gender = 'male' if sex == 'M' else 'female' if sex == 'F' else None
+    death = record.first('DEAT')
+    notes = [note.text() for note in record.all('NOTE') if not note.value.startswith('@')]
+    return (
+        record.xref, first_name, last_name, middle_name, maiden_name, gender,
+        iso_date(record.get('BIRT', 'DATE')), record.get('BIRT', 'PLAC'),
+        iso_date(record.get('DEAT', 'DATE')), record.get('DEAT', 'PLAC'),
+        death is None, record.get('OCCU'), '\n\n'.join(notes)
+    )
+
+def family_edges(record: Node) -> List[Tuple[str, str, str]]:
+    '''FAM record -> (source xref, target xref, parent|spouse) like the edges save-tree writes'''
+    husband = record.get('HUSB').strip('@')
+    wife = record.get('WIFE').strip('@')
+    partners = [xref for xref in (husband, wife) if xref]
+    edges = [(husband, wife, 'spouse')] if len(partners) == 2 else []
+    for child in record.all('CHIL'):
+        child_xref = child.value.strip('@')
+        if child_xref:
+            edges.extend((parent, child_xref, 'parent') for parent in partners)
+    return edges
@@ -0,0 +1,334 @@
+'''
+Business: Import a GEDCOM 5.5.1 file into a new or existing family tree, streaming records into Postgres with COPY
+Args: event - dict with httpMethod, POST body - the GEDCOM file (may be base64 and/or Content-Encoding: gzip),
+      queryStringParameters (user_email, tree_id to import into an existing tree, title, import_id);
+      GET with import_id (and user_email) returns the progress of a running or finished import
+      context - object with request_id
+Returns: HTTP response with tree_id, version and imported persons/relationships counts
+'''
+import base64
+import binascii
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import time
+import uuid
+from typing import Dict, Any, BinaryIO, Iterator, List, Optional, Tuple
+from db import discard_connection, get_connection, release_connection
+from gedcom import PERSON_FIELDS, decode_lines, records, person_row, family_edges
+
+SCHEMA = '"t_p57451291_family_tree_builder_"'
+
+# Persons or edges buffered before one COPY round-trip; bounds the memory of an import
+CHUNK_ROWS = int(os.environ.get('GEDCOM_CHUNK_ROWS', '5000'))
+IMPORT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+# Hex digits of the file's SHA-256 in the client id prefix of its persons
+SOURCE_DIGEST_CHARS = 16
+
+# Import rows go to temporary tables first, so COPY never hits a constraint halfway through
+STAGING_TABLES = f"""CREATE TEMP TABLE gedcom_persons (
+    {', '.join(f'{field} TEXT' for field in PERSON_FIELDS if field != 'is_alive')}, is_alive BOOLEAN
+) ON COMMIT DROP;
+CREATE TEMP TABLE gedcom_edges (source_client_id TEXT, target_client_id TEXT, relationship_type TEXT) ON COMMIT DROP"""
+
+# Client ids are the file's xrefs under a prefix derived from the file content ('gedcom:<sha256 prefix>:I1'),
+# so importing the same file again updates its persons in place, while another file or a person created in the
+# editor that happens to use the same xref or numeric id is never overwritten
+MERGE_PERSONS = f"""INSERT INTO {SCHEMA}.persons (tree_id, client_id, first_name, last_name, middle_name, maiden_name,
+    gender, birth_date, birth_place, death_date, death_place, is_alive, occupation, bio)
+SELECT DISTINCT ON (client_id) %(tree_id)s, LEFT(%(prefix)s || client_id, 64), LEFT(first_name, 100), LEFT(last_name, 100),
+    LEFT(middle_name, 100), LEFT(maiden_name, 100), gender, LEFT(birth_date, 50), LEFT(birth_place, 255),
+    LEFT(death_date, 50), LEFT(death_place, 255), is_alive, LEFT(occupation, 255), bio
+FROM gedcom_persons
+ORDER BY client_id
+ON CONFLICT (tree_id, client_id) DO UPDATE SET
+    first_name = EXCLUDED.first_name, last_name = EXCLUDED.last_name,
+    middle_name = EXCLUDED.middle_name, maiden_name = EXCLUDED.maiden_name,
+    gender = EXCLUDED.gender, birth_date = EXCLUDED.birth_date,
+    birth_place = EXCLUDED.birth_place, death_date = EXCLUDED.death_date,
+    death_place = EXCLUDED.death_place, is_alive = EXCLUDED.is_alive,
+    occupation = EXCLUDED.occupation, bio = EXCLUDED.bio,
+    updated_at = CURRENT_TIMESTAMP"""
+
+MERGE_RELATIONSHIPS = f"""INSERT INTO {SCHEMA}.relationships (tree_id, source_person_id, target_person_id, relationship_type)
+SELECT DISTINCT %(tree_id)s, s.id, t.id, e.relationship_type
+FROM gedcom_edges e
+JOIN {SCHEMA}.persons s ON s.tree_id = %(tree_id)s AND s.client_id = LEFT(%(prefix)s || e.source_client_id, 64)
+JOIN {SCHEMA}.persons t ON t.tree_id = %(tree_id)s AND t.client_id = LEFT(%(prefix)s || e.target_client_id, 64)
+WHERE s.id <> t.id
+ON CONFLICT (source_person_id, target_person_id, relationship_type) DO NOTHING"""
+
+def copy_value(value: Any) -> str:
+    '''Field in COPY text format'''
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+def copy_rows(cursor, table: str, columns: Tuple[str, ...], rows: List[Tuple]) -> None:
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+class ImportProgress:
+    '''Progress row in gedcom_imports, written on its own connection so it is visible while the import runs'''
+
+    def __init__(self, database_url: str, import_id: str, tree_id: int, user_id: int):
+        self.import_id = import_id
+        self.user_id = user_id
+        self.counts = {'records': 0, 'persons': 0, 'relationships': 0}
+        self.conn = get_connection(database_url)
+        self.cursor = self.conn.cursor()
+        try:
+            self.cursor.execute(
+                f"""INSERT INTO {SCHEMA}.gedcom_imports (id, tree_id, user_id) VALUES (%s, %s, %s)
+                ON CONFLICT (id) DO UPDATE SET status = 'running', tree_id = EXCLUDED.tree_id, records = 0,
+                    persons = 0, relationships = 0, error = NULL, started_at = CURRENT_TIMESTAMP, finished_at = NULL
+                WHERE gedcom_imports.user_id = EXCLUDED.user_id
+                RETURNING id""",
+                (import_id, tree_id, user_id)
+            )
+            # No row: the import_id is taken by another user's import
+            self.claimed = self.cursor.fetchone() is not None
+            self.conn.commit()
+        except Exception:
+            discard_connection(self.conn)
+            raise
+
+    def update(self, counts: Optional[Dict[str, int]] = None, status: str = 'running', error: Optional[str] = None) -> None:
+        if counts is not None:
+            self.counts = {key: counts[key] for key in self.counts}
+        self.cursor.execute(
+            f"""UPDATE {SCHEMA}.gedcom_imports SET status = %s, records = %s, persons = %s, relationships = %s,
+                error = %s, updated_at = CURRENT_TIMESTAMP,
+                finished_at = CASE WHEN %s = 'running' THEN NULL ELSE CURRENT_TIMESTAMP END
+            WHERE id = %s AND user_id = %s""",
+            (status, self.counts['records'], self.counts['persons'], self.counts['relationships'], error, status,
+             self.import_id, self.user_id)
+        )
+        self.conn.commit()
+
+    def fail(self, error: str) -> None:
+        '''Mark the import failed; best effort, so it never hides the error that made the import fail'''
+        try:
+            self.update(status='failed', error=error)
+        except Exception as e:
+            print(f"GEDCOM import {self.import_id}: could not record the failure: {e}")
+            discard_connection(self.conn)
+
+    def close(self) -> None:
+        self.cursor.close()
+        release_connection(self.conn)
+
+def hashed(stream: BinaryIO, digest) -> Iterator[bytes]:
+    '''Lines of the stream, fed to digest on the way'''
+    for raw in stream:
+        digest.update(raw)
+        yield raw
+
+def import_stream(cursor, tree_id: int, stream: BinaryIO, progress: Optional[ImportProgress] = None) -> Dict[str, int]:
+    '''Parse the file record by record, COPY persons and edges in CHUNK_ROWS batches, then merge into the tree'''
+    cursor.execute(STAGING_TABLES)
+    stats: Dict[str, int] = {}
+    counts = {'records': 0, 'persons': 0, 'relationships': 0}
+    persons: List[Tuple] = []
+    edges: List[Tuple[str, str, str]] = []
+
+    def flush() -> None:
+        if persons:
+            copy_rows(cursor, 'gedcom_persons', PERSON_FIELDS, persons)
+            counts['persons'] += len(persons)
+            persons.clear()
+        if edges:
+            copy_rows(cursor, 'gedcom_edges', ('source_client_id', 'target_client_id', 'relationship_type'), edges)
+            counts['relationships'] += len(edges)
+            edges.clear()
+        if progress is not None:
+            progress.update(counts)
+        print(f"GEDCOM import tree {tree_id}: {counts['records']} records, {counts['persons']} persons, {counts['relationships']} edges")
+
+    digest = hashlib.sha256()
+    for record in records(decode_lines(hashed(stream, digest)), stats):
+        counts['records'] += 1
+        if record.tag == 'INDI' and record.xref:
+            persons.append(person_row(record))
+        elif record.tag == 'FAM':
+            edges.extend(family_edges(record))
+        if len(persons) >= CHUNK_ROWS or len(edges) >= CHUNK_ROWS:
+            flush()
+    flush()
+
+    # The whole file has been read by now, so the digest identifies it
+    source = {'tree_id': tree_id, 'prefix': f'gedcom:{digest.hexdigest()[:SOURCE_DIGEST_CHARS]}:'}
+    cursor.execute(MERGE_PERSONS, source)
+    merged_persons = cursor.rowcount
+    cursor.execute(MERGE_RELATIONSHIPS, source)
+    return {
+        'records': counts['records'],
+        'persons': merged_persons,
+        'relationships': cursor.rowcount,
+        'skipped_lines': stats.get('skipped_lines', 0)
+    }
+
+def body_stream(event: Dict[str, Any]) -> BinaryIO:
+    '''Request body as a binary stream, decompressed on the fly for Content-Encoding: gzip'''
+    body = event.get('body') or ''
+    headers = event.get('headers', {}) or {}
+    raw = base64.b64decode(body) if event.get('isBase64Encoded') else body.encode('utf-8')
+    content_encoding = (headers.get('Content-Encoding') or headers.get('content-encoding') or '').lower()
+    if content_encoding == 'gzip' or raw[:2] == b'\x1f\x8b':
+        return gzip.GzipFile(fileobj=io.BytesIO(raw))
+    return io.BytesIO(raw)
+
+def json_response(status: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'isBase64Encoded': False,
+        'body': json.dumps(payload, default=str)
+    }
+
+def get_progress(database_url: str, import_id: str, user_email: str) -> Dict[str, Any]:
+    conn = get_connection(database_url)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""SELECT i.id, i.tree_id, i.status, i.records, i.persons, i.relationships, i.error,
+                i.started_at, i.updated_at, i.finished_at
+            FROM {SCHEMA}.gedcom_imports i
+            JOIN {SCHEMA}.users u ON u.id = i.user_id
+            WHERE i.id = %s AND u.email = %s""",
+            (import_id, user_email)
+        )
+        row = cursor.fetchone()
+        columns = [column[0] for column in cursor.description]
+        cursor.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
+    if not row:
+        return json_response(404, {'error': 'Import not found'})
+    return json_response(200, dict(zip(columns, row)))
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'POST')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, Content-Encoding, X-User-Email',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+
+    if method not in ('GET', 'POST'):
+        return json_response(405, {'error': 'Method not allowed'})
+
+    params = event.get('queryStringParameters', {}) or {}
+    user_email = params.get('user_email') or (event.get('headers', {}) or {}).get('X-User-Email')
+    import_id = params.get('import_id')
+    tree_id = params.get('tree_id')
+
+    if not user_email:
+        return json_response(400, {'error': 'user_email is required'})
+    if import_id is not None and not IMPORT_ID_PATTERN.match(import_id):
+        return json_response(400, {'error': 'import_id must be 1-64 letters, digits, - or _'})
+    if tree_id is not None and not tree_id.isdigit():
+        return json_response(400, {'error': 'tree_id must be a number'})
+
+    database_url = os.environ.get('DATABASE_URL')
+
+    if method == 'GET':
+        if not import_id:
+            return json_response(400, {'error': 'import_id is required'})
+        return get_progress(database_url, import_id, user_email)
+
+    if not event.get('body'):
+        return json_response(400, {'error': 'GEDCOM file is required in the request body'})
+    import_id = import_id or uuid.uuid4().hex
+    title = params.get('title') or 'Импорт GEDCOM'
+    started = time.monotonic()
+
+    conn = get_connection(database_url)
+    cursor = conn.cursor()
+    progress: Optional[ImportProgress] = None
+    try:
+        cursor.execute(
+            f"INSERT INTO {SCHEMA}.users (email) VALUES (%s) ON CONFLICT (email) DO UPDATE SET updated_at = CURRENT_TIMESTAMP RETURNING id",
+            (user_email,)
+        )
+        user_id = cursor.fetchone()[0]
+
+        if tree_id:
+            cursor.execute(
+                f"""UPDATE {SCHEMA}.family_trees SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND user_id = %s RETURNING id, version""",
+                (tree_id, user_id)
+            )
+            row = cursor.fetchone()
+            if not row:
+                conn.rollback()
+                return json_response(404, {'error': 'Tree not found or access denied'})
+        else:
+            cursor.execute(
+                f"INSERT INTO {SCHEMA}.family_trees (user_id, title, description) VALUES (%s, %s, %s) RETURNING id, version",
+                (user_id, title, '')
+            )
+            row = cursor.fetchone()
+        saved_tree_id, version = row
+
+        progress = ImportProgress(database_url, import_id, saved_tree_id, user_id)
+        if not progress.claimed:
+            conn.rollback()
+            return json_response(409, {'error': 'import_id is already used by another import'})
+        result = import_stream(cursor, saved_tree_id, body_stream(event), progress)
+        cursor.execute(
+            f"""UPDATE {SCHEMA}.family_trees SET
+                persons_count = (SELECT COUNT(*) FROM {SCHEMA}.persons WHERE tree_id = %(tree_id)s),
+                relationships_count = (SELECT COUNT(*) FROM {SCHEMA}.relationships WHERE tree_id = %(tree_id)s)
+            WHERE id = %(tree_id)s""",
+            {'tree_id': saved_tree_id}
+        )
+        # load-tree may have cached this tree before the import added persons to it
+        cursor.execute(f"DELETE FROM {SCHEMA}.tree_snapshots WHERE tree_id = %s", (saved_tree_id,))
+        conn.commit()
+        progress.update(result, 'done')
+    except (OSError, EOFError, binascii.Error) as e:
+        # Broken gzip or base64 stream; nothing of the import is kept
+        conn.rollback()
+        if progress is not None:
+            progress.fail(f'Invalid upload: {e}')
+        return json_response(400, {'error': f'Invalid upload: {e}', 'import_id': import_id})
+    except Exception as e:
+        # Closing the connection aborts the transaction; it does not go back to the pool
+        discard_connection(conn)
+        if progress is not None:
+            progress.fail(str(e)[:1000])
+        raise
+    finally:
+        if progress is not None:
+            progress.close()
+        cursor.close()
+        release_connection(conn)
+
+    return json_response(200, {
+        'tree_id': saved_tree_id,
+        'version': version,
+        'import_id': import_id,
+        'message': 'GEDCOM imported successfully',
+        **result,
+        'elapsed_ms': round((time.monotonic() - started) * 1000)
+    })
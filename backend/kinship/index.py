@@ -0,0 +1,165 @@
+'''
+Business: Answer how two persons of a family tree are related without sending the tree to the client
+Args: event - dict with httpMethod, queryStringParameters (tree_id, user_email, query=relation|cousins,
+      a, b - person ids as in load-tree nodes, grade - cousin grade for query=cousins)
+      context - object with request_id
+Returns: HTTP response with the kinship degree, nearest common ancestors and path, or the list of cousins
+'''
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from db import discard_connection, get_connection, release_connection
+from kinship import KinshipIndex
+
+SCHEMA = '"t_p57451291_family_tree_builder_"'
+
+# Indexes of recently queried trees, rebuilt when the tree version changes
+MAX_CACHED_TREES = int(os.environ.get('KINSHIP_CACHE_TREES', '4'))
+MAX_COUSIN_GRADE = 8
+
+TREE_FILTER = f"""ft.id = %(tree_id)s AND (
+    %(user_email)s::text IS NULL
+    OR ft.user_id IN (SELECT id FROM {SCHEMA}.users WHERE email = %(user_email)s)
+)"""
+
+_lock = threading.Lock()
+_indexes: 'OrderedDict[str, Tuple[int, KinshipIndex]]' = OrderedDict()
+index_stats = {'hits': 0, 'builds': 0}
+
+def tree_version(cursor, tree_id: str, user_email: Optional[str]) -> Optional[int]:
+    cursor.execute(
+        f"SELECT ft.version FROM {SCHEMA}.family_trees ft WHERE {TREE_FILTER}",
+        {'tree_id': tree_id, 'user_email': user_email}
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def build_index(cursor, tree_id: str) -> KinshipIndex:
+    '''Two narrow scans (ids and edges only), persons keyed by the same id load-tree returns'''
+    cursor.execute(
+        f"SELECT id, COALESCE(client_id, id::text) FROM {SCHEMA}.persons WHERE tree_id = %s",
+        (tree_id,)
+    )
+    persons = cursor.fetchall()
+    cursor.execute(
+        f"""SELECT source_person_id, target_person_id, relationship_type
+        FROM {SCHEMA}.relationships WHERE tree_id = %s""",
+        (tree_id,)
+    )
+    return KinshipIndex.build(persons, cursor.fetchall())
+
+def get_index(cursor, tree_id: str, version: int) -> KinshipIndex:
+    with _lock:
+        cached = _indexes.get(tree_id)
+        if cached and cached[0] == version:
+            _indexes.move_to_end(tree_id)
+            index_stats['hits'] += 1
+            return cached[1]
+    index = build_index(cursor, tree_id)
+    with _lock:
+        _indexes[tree_id] = (version, index)
+        _indexes.move_to_end(tree_id)
+        while len(_indexes) > MAX_CACHED_TREES:
+            _indexes.popitem(last=False)
+        index_stats['builds'] += 1
+    return index
+
+def describe_relation(index: KinshipIndex, a: int, b: int) -> Dict[str, Any]:
+    path = index.relationship_path(a, b)
+    return {
+        'a': index.keys[a],
+        'b': index.keys[b],
+        'kinship': index.kinship(a, b),
+        'common_ancestors': [
+            {'id': index.keys[ancestor], 'generations_from_a': up, 'generations_from_b': down}
+            for ancestor, up, down in index.nearest_common_ancestors(a, b)
+        ],
+        # Each step says how the person relates to the previous one on the path
+        'path': [{'id': index.keys[person], 'step': step} for person, step in path] if path else None
+    }
+
+def error(status: int, message: str) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'error': message})
+    }
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Email',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+
+    if method != 'GET':
+        return error(405, 'Method not allowed')
+
+    params = event.get('queryStringParameters', {}) or {}
+    headers = event.get('headers', {}) or {}
+    tree_id = params.get('tree_id')
+    user_email = params.get('user_email') or headers.get('X-User-Email')
+    query = params.get('query', 'relation')
+
+    if not tree_id or not tree_id.isdigit():
+        return error(400, 'tree_id is required')
+    tree_id = str(int(tree_id))
+
+    if query not in ('relation', 'cousins'):
+        return error(400, 'query must be relation or cousins')
+    if not params.get('a') or (query == 'relation' and not params.get('b')):
+        return error(400, 'a and b are required' if query == 'relation' else 'a is required')
+    try:
+        grade = int(params.get('grade', '1'))
+    except ValueError:
+        return error(400, 'grade must be an integer')
+    if not 1 <= grade <= MAX_COUSIN_GRADE:
+        return error(400, f'grade must be between 1 and {MAX_COUSIN_GRADE}')
+
+    database_url = os.environ.get('DATABASE_URL')
+    conn = get_connection(database_url)
+    try:
+        cursor = conn.cursor()
+
+        version = tree_version(cursor, tree_id, user_email)
+        if version is None:
+            cursor.close()
+            return error(404, 'Tree not found or access denied')
+
+        index = get_index(cursor, tree_id, version)
+        cursor.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
+
+    a = index.position(params['a'])
+    b = index.position(params['b']) if query == 'relation' else None
+    if a is None or (query == 'relation' and b is None):
+        return error(404, 'Person not found')
+
+    if query == 'relation':
+        result = describe_relation(index, a, b)
+    else:
+        result = {'a': params['a'], 'grade': grade, 'cousins': [index.keys[person] for person in index.cousins(a, grade)]}
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json; charset=utf-8',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'isBase64Encoded': False,
+        'body': json.dumps({'tree_id': int(tree_id), 'persons': len(index), **result}, ensure_ascii=False)
+    }
@@ -0,0 +1,262 @@
+'''
+Business: Kinship engine over one tree: persons as dense integers, parents/children/spouses as CSR arrays
+Args: persons - (person id, client id) rows, relationships - (source id, target id, type) rows of the tree
+Returns: nearest common ancestors, shortest relationship path, degree of kinship and n-th cousins
+'''
+from array import array
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+ORDINALS = {1: '1st', 2: '2nd', 3: '3rd'}
+REMOVED = {1: 'once removed', 2: 'twice removed'}
+
+def _csr(count: int, sources: array, targets: array) -> Tuple[array, array]:
+    '''Compressed adjacency: neighbours of i are values[offsets[i]:offsets[i + 1]]'''
+    offsets = array('i', bytes(4 * (count + 1)))
+    for source in sources:
+        offsets[source + 1] += 1
+    for i in range(count):
+        offsets[i + 1] += offsets[i]
+    values = array('i', bytes(4 * len(sources)))
+    fill = offsets[:-1]
+    for source, target in zip(sources, targets):
+        values[fill[source]] = target
+        fill[source] += 1
+    return offsets, values
+
+def _ordinal(number: int) -> str:
+    return ORDINALS.get(number, f'{number}th')
+
+def _generations(word: str, generations: int, grand: bool = True) -> str:
+    '''parent, grandparent, great-grandparent, 2x great-grandparent; aunt/uncle, great-aunt/uncle without grand'''
+    if generations <= 1:
+        return word
+    if grand:
+        word, generations = f'grand{word}', generations - 1
+    greats = generations - 1
+    if greats == 0:
+        return word
+    return f'great-{word}' if greats == 1 else f'{greats}x great-{word}'
+
+class KinshipIndex:
+    '''Persons of one tree numbered 0..n-1 with parent, child and spouse adjacency in flat int arrays'''
+
+    def __init__(self, keys: List[str], parent_edges: Tuple[array, array], spouse_edges: Tuple[array, array]):
+        self.keys = keys
+        self.positions = {key: i for i, key in enumerate(keys)}
+        parents, children = parent_edges
+        count = len(keys)
+        # parent edge: parents[k] is a parent of children[k]
+        self.parent_offsets, self.parents = _csr(count, children, parents)
+        self.child_offsets, self.children = _csr(count, parents, children)
+        spouses_a, spouses_b = spouse_edges
+        self.spouse_offsets, self.spouses = _csr(count, spouses_a + spouses_b, spouses_b + spouses_a)
+
+    @classmethod
+    def build(cls, persons: Iterable[Tuple[int, str]], relationships: Iterable[Tuple[int, int, str]]) -> 'KinshipIndex':
+        '''Index from database rows; edges to persons outside the tree are skipped'''
+        keys: List[str] = []
+        dense: Dict[int, int] = {}
+        for person_id, key in persons:
+            dense[person_id] = len(keys)
+            keys.append(key)
+        parent_edges = (array('i'), array('i'))
+        spouse_edges = (array('i'), array('i'))
+        for source_id, target_id, relationship_type in relationships:
+            source, target = dense.get(source_id), dense.get(target_id)
+            if source is None or target is None or source == target:
+                continue
+            edges = spouse_edges if relationship_type == 'spouse' else parent_edges
+            edges[0].append(source)
+            edges[1].append(target)
+        return cls(keys, parent_edges, spouse_edges)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def position(self, key: str) -> Optional[int]:
+        return self.positions.get(key)
+
+    def parents_of(self, i: int) -> array:
+        return self.parents[self.parent_offsets[i]:self.parent_offsets[i + 1]]
+
+    def children_of(self, i: int) -> array:
+        return self.children[self.child_offsets[i]:self.child_offsets[i + 1]]
+
+    def spouses_of(self, i: int) -> array:
+        return self.spouses[self.spouse_offsets[i]:self.spouse_offsets[i + 1]]
+
+    def ancestor_depths(self, i: int, max_depth: Optional[int] = None) -> Dict[int, int]:
+        '''Generations up to every ancestor (the person itself at 0), shortest line when lines merge'''
+        depths = {i: 0}
+        level = [i]
+        depth = 0
+        while level and (max_depth is None or depth < max_depth):
+            depth += 1
+            next_level = []
+            for person in level:
+                for parent in self.parents_of(person):
+                    if parent not in depths:
+                        depths[parent] = depth
+                        next_level.append(parent)
+            level = next_level
+        return depths
+
+    def branch_child(self, i: int, generations: int, ancestor: int) -> Optional[int]:
+        '''The child of ancestor that i descends from, i's ancestor that many generations up (i itself at 0)'''
+        for person, depth in self.ancestor_depths(i, generations).items():
+            if depth == generations and ancestor in self.parents_of(person):
+                return person
+        return None
+
+    def nearest_common_ancestors(self, a: int, b: int,
+                                 depths_a: Optional[Dict[int, int]] = None) -> List[Tuple[int, int, int]]:
+        '''(ancestor, generations from a, generations from b) with the smallest total, usually a couple.
+        Walks up from b one generation at a time and stops once no closer match is possible'''
+        if depths_a is None:
+            depths_a = self.ancestor_depths(a)
+        best_total: Optional[int] = None
+        found: List[Tuple[int, int, int]] = []
+        seen = {b}
+        level = [b]
+        depth_b = 0
+        while level and (best_total is None or depth_b <= best_total):
+            for person in level:
+                depth_a = depths_a.get(person)
+                if depth_a is None:
+                    continue
+                total = depth_a + depth_b
+                if best_total is None or total < best_total:
+                    best_total, found = total, []
+                if total == best_total:
+                    found.append((person, depth_a, depth_b))
+            depth_b += 1
+            next_level = []
+            for person in level:
+                if person in depths_a:
+                    # Ancestors of a common ancestor are never nearer
+                    continue
+                for parent in self.parents_of(person):
+                    if parent not in seen:
+                        seen.add(parent)
+                        next_level.append(parent)
+            level = next_level
+        return found
+
+    def relationship_path(self, a: int, b: int) -> Optional[List[Tuple[int, str]]]:
+        '''Shortest chain of parent/child/spouse steps from a to b, None if they are not connected.
+        Bidirectional BFS: each round expands the smaller frontier by one whole level'''
+        if a == b:
+            return [(a, 'self')]
+        inverse = {'parent': 'child', 'child': 'parent', 'spouse': 'spouse'}
+        # person -> (previous person on its side, how the person relates to it, distance from the side's start)
+        from_a: Dict[int, Tuple[int, str, int]] = {a: (-1, 'self', 0)}
+        from_b: Dict[int, Tuple[int, str, int]] = {b: (-1, 'self', 0)}
+        frontier_a, frontier_b = [a], [b]
+        best: Optional[Tuple[int, int, int, str]] = None
+        while frontier_a and frontier_b and best is None:
+            forward = len(frontier_a) <= len(frontier_b)
+            frontier, visited, other = (frontier_a, from_a, from_b) if forward else (frontier_b, from_b, from_a)
+            next_frontier = []
+            for person in frontier:
+                distance = visited[person][2] + 1
+                for step, neighbours in (('parent', self.parents_of(person)),
+                                         ('child', self.children_of(person)),
+                                         ('spouse', self.spouses_of(person))):
+                    for neighbour in neighbours:
+                        if neighbour in other:
+                            # Link person -> neighbour joins the two searches; keep the shortest of this level
+                            total = distance + other[neighbour][2]
+                            if best is None or total < best[0]:
+                                link = (person, neighbour, step) if forward else (neighbour, person, inverse[step])
+                                best = (total, *link)
+                        if neighbour not in visited:
+                            visited[neighbour] = (person, step, distance)
+                            next_frontier.append(neighbour)
+            if forward:
+                frontier_a = next_frontier
+            else:
+                frontier_b = next_frontier
+        if best is None:
+            return None
+
+        _, last_a, first_b, step = best
+        path: List[Tuple[int, str]] = []
+        person = last_a
+        while person != -1:
+            previous, relation, _ = from_a[person]
+            path.append((person, relation))
+            person = previous
+        path.reverse()
+        path.append((first_b, step))
+        # Steps recorded from b's side point towards b and are inverted on the way there
+        person = first_b
+        while person != b:
+            following, relation, _ = from_b[person]
+            path.append((following, inverse[relation]))
+            person = following
+        return path
+
+    def kinship(self, a: int, b: int) -> Dict[str, Any]:
+        '''How b is related to a: blood relation from the nearest common ancestors, otherwise by marriage'''
+        if a == b:
+            return {'relation': 'self', 'degree': 0, 'label': 'self'}
+        common = self.nearest_common_ancestors(a, b)
+        if not common:
+            if b in self.spouses_of(a):
+                return {'relation': 'spouse', 'degree': None, 'label': 'spouse'}
+            path = self.relationship_path(a, b)
+            if path is None:
+                return {'relation': 'none', 'degree': None, 'label': 'not related'}
+            return {'relation': 'in_law', 'degree': None, 'steps': len(path) - 1, 'label': 'related by marriage'}
+
+        ancestor, up, down = common[0]
+        half: Optional[bool] = False
+        if len(common) == 1 and up > 0 and down > 0:
+            # Full siblings and cousins descend from both members of a couple. With one common ancestor the
+            # branches are half-siblings only if both have two recorded parents; otherwise a parent may just be missing
+            branches = (self.branch_child(a, up - 1, ancestor), self.branch_child(b, down - 1, ancestor))
+            known = all(person is not None and len(set(self.parents_of(person))) == 2 for person in branches)
+            half = True if known else None
+        result: Dict[str, Any] = {'degree': up + down, 'generations_up': up, 'generations_down': down, 'half': half}
+        if up == 0:
+            result.update(relation='descendant', label=_generations('child', down))
+        elif down == 0:
+            result.update(relation='ancestor', label=_generations('parent', up))
+        elif up == 1 and down == 1:
+            result.update(relation='sibling', label='sibling')
+        elif up == 1:
+            result.update(relation='niece_nephew', label=_generations('niece/nephew', down - 1, grand=False))
+        elif down == 1:
+            result.update(relation='aunt_uncle', label=_generations('aunt/uncle', up - 1, grand=False))
+        else:
+            grade, removed = min(up, down) - 1, abs(up - down)
+            label = f'{_ordinal(grade)} cousin'
+            if removed:
+                label += ' ' + REMOVED.get(removed, f'{removed} times removed')
+            result.update(relation='cousin', cousin_grade=grade, removed=removed, label=label)
+        if half:
+            result['label'] = f"half-{result['label']}"
+        return result
+
+    def cousins(self, i: int, grade: int) -> List[int]:
+        '''Everyone whose nearest common ancestors with i are exactly grade + 1 generations up on both sides'''
+        generations = grade + 1
+        depths = self.ancestor_depths(i, generations)
+        # Lines through i's nearer ancestors lead to closer relatives (siblings, nearer cousins)
+        closer = {person for person, depth in depths.items() if depth < generations}
+        level = [person for person, depth in depths.items() if depth == generations]
+        seen = set(level)
+        for _ in range(generations):
+            next_level = []
+            for person in level:
+                for child in self.children_of(person):
+                    if child not in closer and child not in seen:
+                        seen.add(child)
+                        next_level.append(child)
+            level = next_level
+        # Pedigree collapse can make a candidate a closer relative through another line
+        return [
+            person for person in level
+            if all(up == generations and down == generations
+                   for _, up, down in self.nearest_common_ancestors(i, person, depths))
+        ]
@@ -0,0 +1,148 @@
+'''
+Business: Compute an automatic layout for a whole family tree on the server and store the positions
+Args: event - dict with httpMethod, body (tree_id, user_email, x_step, y_step)
+      context - object with request_id
+Returns: HTTP response with the new tree version, persons moved and number of generations
+'''
+import json
+import os
+from typing import Dict, Any, Tuple
+
+import numpy as np
+from psycopg2.extras import execute_values
+from db import discard_connection, get_connection, release_connection
+from layout import X_STEP, Y_STEP, layout_tree
+
+SCHEMA = '"t_p57451291_family_tree_builder_"'
+
+# Rows per multi-row VALUES statement in bulk writes
+BULK_PAGE_SIZE = 1000
+# Largest value persons.position_x/position_y (DECIMAL(10,2)) can hold
+MAX_POSITION = 99999999.99
+
+def load_graph(cursor, tree_id: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''Person ids (sorted) and the parent/spouse edges as positions in that array'''
+    cursor.execute(f"SELECT id FROM {SCHEMA}.persons WHERE tree_id = %s ORDER BY id", (tree_id,))
+    person_ids = np.array([row[0] for row in cursor.fetchall()], dtype=np.int64)
+    cursor.execute(
+        f"""SELECT source_person_id, target_person_id, relationship_type = 'spouse'
+        FROM {SCHEMA}.relationships WHERE tree_id = %s""",
+        (tree_id,)
+    )
+    rows = cursor.fetchall()
+    edges = np.array([(source, target) for source, target, _ in rows], dtype=np.int64).reshape(-1, 2)
+    spouse = np.array([is_spouse for _, _, is_spouse in rows], dtype=bool)
+    # Edges pointing outside the tree are dropped
+    positions = np.searchsorted(person_ids, edges).clip(max=max(len(person_ids) - 1, 0))
+    valid = (person_ids[positions] == edges).all(axis=1) if len(person_ids) else np.zeros(len(edges), dtype=bool)
+    return person_ids, positions[valid & ~spouse], positions[valid & spouse]
+
+def store_positions(cursor, tree_id: int, person_ids: np.ndarray, x: np.ndarray, y: np.ndarray) -> int:
+    '''One UPDATE ... FROM (VALUES ...) per BULK_PAGE_SIZE persons'''
+    rows = list(zip(person_ids.tolist(), np.round(x, 2).tolist(), np.round(y, 2).tolist()))
+    execute_values(
+        cursor,
+        f"""UPDATE {SCHEMA}.persons p
+        SET position_x = v.x, position_y = v.y, updated_at = CURRENT_TIMESTAMP
+        FROM (VALUES %s) AS v (id, x, y)
+        WHERE p.id = v.id AND p.tree_id = {int(tree_id)}""",
+        rows,
+        template='(%s, %s::numeric, %s::numeric)',
+        page_size=BULK_PAGE_SIZE
+    )
+    return len(rows)
+
+def error(status: int, message: str) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'error': message})
+    }
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'POST')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Email',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+
+    if method != 'POST':
+        return error(405, 'Method not allowed')
+
+    try:
+        body_data = json.loads(event.get('body') or '{}')
+        tree_id = int(body_data.get('tree_id') or 0)
+        x_step = float(body_data.get('x_step', X_STEP))
+        y_step = float(body_data.get('y_step', Y_STEP))
+    except (ValueError, TypeError):
+        return error(400, 'tree_id, x_step and y_step must be numbers')
+    user_email = body_data.get('user_email') or (event.get('headers', {}) or {}).get('X-User-Email')
+
+    if not tree_id:
+        return error(400, 'tree_id is required')
+    if not user_email:
+        return error(400, 'user_email is required')
+    if not (0 < x_step <= 10000 and 0 < y_step <= 10000):
+        return error(400, 'x_step and y_step must be between 0 and 10000')
+
+    database_url = os.environ.get('DATABASE_URL')
+    conn = get_connection(database_url)
+    try:
+        cursor = conn.cursor()
+
+        # Locks the tree row, so a concurrent save-tree waits instead of mixing old and new positions
+        cursor.execute(
+            f"""UPDATE {SCHEMA}.family_trees SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND user_id IN (SELECT id FROM {SCHEMA}.users WHERE email = %s)
+            RETURNING version""",
+            (tree_id, user_email)
+        )
+        row = cursor.fetchone()
+        if not row:
+            conn.rollback()
+            cursor.close()
+            return error(404, 'Tree not found or access denied')
+        version = row[0]
+
+        person_ids, parent_edges, spouse_edges = load_graph(cursor, tree_id)
+        x, y, layers = layout_tree(
+            len(person_ids), parent_edges[:, 0], parent_edges[:, 1], spouse_edges[:, 0], spouse_edges[:, 1],
+            x_step=x_step, y_step=y_step
+        )
+        if len(person_ids) and max(np.abs(np.round(x, 2)).max(), np.abs(np.round(y, 2)).max()) > MAX_POSITION:
+            conn.rollback()
+            cursor.close()
+            return error(400, 'The layout does not fit the position range with this x_step and y_step, use smaller steps')
+        updated = store_positions(cursor, tree_id, person_ids, x, y)
+        # Every node moved, so a cached load-tree body would still draw the old layout
+        cursor.execute(f"DELETE FROM {SCHEMA}.tree_snapshots WHERE tree_id = %s", (tree_id,))
+
+        conn.commit()
+        cursor.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
+
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'isBase64Encoded': False,
+        'body': json.dumps({
+            'tree_id': tree_id,
+            'version': version,
+            'message': 'Tree laid out successfully',
+            'updated': updated,
+            'layers': int(layers.max()) + 1 if len(layers) else 0,
+            'width': round(float(x.max()), 2) if len(x) else 0
+        })
+    }
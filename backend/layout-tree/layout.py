@@ -0,0 +1,213 @@
+'''
+Business: Layered auto-layout of a family tree in vectorized NumPy passes: generations, spouses side by side, few crossings
+Args: count - persons numbered 0..count-1, parents/children and spouses_a/spouses_b - edge endpoint arrays
+Returns: x, y coordinates and the generation (layer) of every person
+'''
+from typing import Tuple
+
+import numpy as np
+
+X_STEP = 220.0
+Y_STEP = 180.0
+# Rounds of layering fix-ups (spouses on one layer, parentless persons next to their children)
+MAX_LAYER_PASSES = 8
+# Down+up barycenter sweeps ordering each layer
+ORDER_SWEEPS = 4
+# Rounds pulling each couple towards its parents and children before separating overlaps
+COORDINATE_ROUNDS = 8
+
+def _csr(count: int, sources: np.ndarray, targets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    '''Targets grouped by source: neighbours of i are values[offsets[i]:offsets[i + 1]]'''
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=count), out=offsets[1:])
+    return offsets, targets[np.argsort(sources, kind='stable')]
+
+def _gather(offsets: np.ndarray, values: np.ndarray, nodes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    '''All (node, neighbour) pairs of the given nodes without a Python loop'''
+    starts = offsets[nodes]
+    lengths = offsets[nodes + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return nodes[:0], values[:0]
+    firsts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    positions = np.repeat(starts, lengths) + np.arange(total) - firsts
+    return np.repeat(nodes, lengths), values[positions]
+
+def longest_path_layers(count: int, parents: np.ndarray, children: np.ndarray, lower: np.ndarray) -> np.ndarray:
+    '''Every person at least at `lower` and below all of their parents; Kahn's algorithm, one generation per step.
+    Persons on a parent cycle (broken data) keep their lower bound'''
+    layers = lower.copy()
+    pending = np.bincount(children, minlength=count)
+    offsets, values = _csr(count, parents, children)
+    frontier = np.flatnonzero(pending == 0)
+    while frontier.size:
+        sources, targets = _gather(offsets, values, frontier)
+        if not targets.size:
+            break
+        np.maximum.at(layers, targets, layers[sources] + 1)
+        pending -= np.bincount(targets, minlength=count)
+        reached = np.unique(targets)
+        frontier = reached[pending[reached] == 0]
+    return layers
+
+def assign_layers(count: int, parents: np.ndarray, children: np.ndarray,
+                  spouses_a: np.ndarray, spouses_b: np.ndarray) -> np.ndarray:
+    '''Longest-path layering over parent edges, then spouses moved onto one layer and persons without
+    parents in the tree (married-in, founders) moved right above their children; repeated until stable'''
+    has_parents = np.bincount(children, minlength=count) > 0
+    no_child = np.iinfo(np.int64).max
+    lower = np.zeros(count, dtype=np.int64)
+    for _ in range(MAX_LAYER_PASSES):
+        layers = longest_path_layers(count, parents, children, lower)
+        first_child = np.full(count, no_child, dtype=np.int64)
+        np.minimum.at(first_child, parents, layers[children])
+        movable = ~has_parents & (first_child != no_child)
+        layers[movable] = np.maximum(layers[movable], first_child[movable] - 1)
+        aligned = layers.copy()
+        np.maximum.at(aligned, spouses_a, layers[spouses_b])
+        np.maximum.at(aligned, spouses_b, layers[spouses_a])
+        if np.array_equal(aligned, lower):
+            break
+        lower = aligned
+    else:
+        # Not settled: keep parents above children, a spouse may end up one layer off
+        lower = longest_path_layers(count, parents, children, lower)
+    return lower - (lower.min() if count else 0)
+
+def couple_units(count: int, spouses_a: np.ndarray, spouses_b: np.ndarray, layers: np.ndarray) -> np.ndarray:
+    '''Unit number of every person: spouses on the same layer (and their other spouses) form one unit'''
+    same_layer = layers[spouses_a] == layers[spouses_b]
+    a, b = spouses_a[same_layer], spouses_b[same_layer]
+    labels = np.arange(count)
+    while True:
+        # Min-label propagation with pointer jumping, converges in a few steps for marriage chains
+        low = np.minimum(labels[a], labels[b])
+        updated = labels.copy()
+        np.minimum.at(updated, a, low)
+        np.minimum.at(updated, b, low)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    return np.unique(labels, return_inverse=True)[1]
+
+class Layout:
+    '''Working state: persons grouped into couple units, units ordered within their layer'''
+
+    def __init__(self, count: int, parents: np.ndarray, children: np.ndarray,
+                 spouses_a: np.ndarray, spouses_b: np.ndarray):
+        self.count = count
+        self.parents, self.children = parents, children
+        self.layers = assign_layers(count, parents, children, spouses_a, spouses_b)
+        self.unit = couple_units(count, spouses_a, spouses_b, self.layers)
+        units = int(self.unit.max()) + 1 if count else 0
+        self.unit_size = np.bincount(self.unit, minlength=units)
+        self.unit_layer = np.zeros(units, dtype=np.int64)
+        self.unit_layer[self.unit] = self.layers
+        # Place of every person inside its unit, in person order
+        by_unit = np.lexsort((np.arange(count), self.unit))
+        unit_first = np.cumsum(self.unit_size) - self.unit_size
+        self.member = np.empty(count, dtype=np.int64)
+        self.member[by_unit] = np.arange(count) - unit_first[self.unit[by_unit]]
+        layer_count = int(self.layers.max()) + 1 if count else 0
+        self.layer_units = [np.flatnonzero(self.unit_layer == layer) for layer in range(layer_count)]
+        by_layer = np.argsort(self.layers, kind='stable')
+        self.layer_members = np.split(by_layer, np.searchsorted(self.layers[by_layer], np.arange(1, layer_count)))
+        self.slot_start = np.zeros(units, dtype=np.int64)
+        # Initial order within each layer: unit number, i.e. roughly the order persons were added
+        self.rank = np.zeros(units, dtype=np.float64)
+        for layer_units in self.layer_units:
+            self.rank[layer_units] = np.arange(layer_units.size)
+
+    def place_layer(self, layer: int, positions: np.ndarray) -> None:
+        '''Relative horizontal place (0..1) of the layer's persons from the current unit order'''
+        layer_units = self.layer_units[layer]
+        ordered = layer_units[np.argsort(self.rank[layer_units], kind='stable')]
+        sizes = self.unit_size[ordered]
+        self.slot_start[ordered] = np.cumsum(sizes) - sizes
+        members = self.layer_members[layer]
+        positions[members] = (self.slot_start[self.unit[members]] + self.member[members] + 0.5) / max(int(sizes.sum()), 1)
+
+    def node_positions(self) -> np.ndarray:
+        positions = np.zeros(self.count, dtype=np.float64)
+        for layer in range(len(self.layer_units)):
+            self.place_layer(layer, positions)
+        return positions
+
+    def sweep(self, upward: bool) -> None:
+        '''Barycenter ordering layer by layer: units sorted by the mean place of their members' parents
+        (downward) or children (upward); units without such relatives keep their place'''
+        fixed, moving = (self.children, self.parents) if upward else (self.parents, self.children)
+        edge_layer = self.layers[moving]
+        order = np.argsort(edge_layer, kind='stable')
+        bounds = np.searchsorted(edge_layer[order], np.arange(len(self.layer_units) + 1))
+        layer_range = range(len(self.layer_units) - 1, -1, -1) if upward else range(len(self.layer_units))
+        positions = self.node_positions()
+        for layer in layer_range:
+            layer_units = self.layer_units[layer]
+            if layer_units.size < 2:
+                continue
+            edges = order[bounds[layer]:bounds[layer + 1]]
+            local = np.searchsorted(layer_units, self.unit[moving[edges]])
+            sums = np.bincount(local, weights=positions[fixed[edges]], minlength=layer_units.size)
+            counts = np.bincount(local, minlength=layer_units.size)
+            current = self.rank[layer_units] / layer_units.size
+            barycenter = np.where(counts > 0, sums / np.maximum(counts, 1), current)
+            self.rank[layer_units[np.lexsort((current, barycenter))]] = np.arange(layer_units.size)
+            # The next layer sees this one's new order
+            self.place_layer(layer, positions)
+
+    def coordinates(self, x_step: float, y_step: float) -> Tuple[np.ndarray, np.ndarray]:
+        '''Unit centres pulled towards the couples they descend from and lead to, overlaps removed by
+        averaging a left-packed and a right-packed placement that both keep the order and spacing'''
+        order = np.lexsort((self.rank, self.unit_layer))
+        segment = self.unit_layer[order]
+        half_width = self.unit_size[order] * x_step / 2
+        starts = np.r_[True, segment[1:] != segment[:-1]] if order.size else np.zeros(0, dtype=bool)
+        gaps = np.where(starts, 0.0, half_width + np.roll(half_width, 1))
+        offsets = np.cumsum(gaps)
+        offsets -= np.maximum.accumulate(np.where(starts, offsets, 0.0))
+        gaps_next = np.r_[gaps[1:], 0.0]
+
+        def pack(values: np.ndarray, segment_ids: np.ndarray, spacing: np.ndarray) -> np.ndarray:
+            # x[j] >= x[j-1] + gap[j] inside a layer: running maximum of x - cumulative gaps
+            shifted = values - spacing
+            lift = (np.ptp(shifted) + 1.0) * segment_ids
+            return np.maximum.accumulate(shifted + lift) - lift + spacing
+
+        reverse_offsets = np.cumsum(gaps_next[::-1])
+        reverse_starts = np.r_[True, segment[::-1][1:] != segment[::-1][:-1]] if order.size else starts
+        reverse_offsets -= np.maximum.accumulate(np.where(reverse_starts, reverse_offsets, 0.0))
+
+        def separate(values: np.ndarray) -> np.ndarray:
+            right = pack(values, segment, offsets)
+            left = -pack(-values[::-1], segment.max(initial=0) - segment[::-1], reverse_offsets)[::-1]
+            return (left + right) / 2
+
+        centre = np.zeros(self.unit_size.size, dtype=np.float64)
+        centre[order] = offsets - np.bincount(segment, weights=offsets)[segment] / np.bincount(segment)[segment]
+        linked_a = np.r_[self.unit[self.parents], self.unit[self.children]]
+        linked_b = np.r_[self.unit[self.children], self.unit[self.parents]]
+        link_count = np.bincount(linked_a, minlength=centre.size)
+        for _ in range(COORDINATE_ROUNDS):
+            pulled = np.bincount(linked_a, weights=centre[linked_b], minlength=centre.size)
+            desired = np.where(link_count > 0, pulled / np.maximum(link_count, 1), centre)
+            centre[order] = separate(desired[order])
+
+        x = centre[self.unit] + (self.member - (self.unit_size[self.unit] - 1) / 2) * x_step
+        x -= x.min(initial=0.0)
+        return x, self.layers * y_step
+
+def layout_tree(count: int, parents: np.ndarray, children: np.ndarray,
+                spouses_a: np.ndarray, spouses_b: np.ndarray,
+                x_step: float = X_STEP, y_step: float = Y_STEP) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''x, y and layer of every person; parent edge k links parents[k] to children[k]'''
+    if count == 0:
+        empty = np.zeros(0)
+        return empty, empty, np.zeros(0, dtype=np.int64)
+    layout = Layout(count, parents, children, spouses_a, spouses_b)
+    for _ in range(ORDER_SWEEPS):
+        layout.sweep(upward=False)
+        layout.sweep(upward=True)
+    x, y = layout.coordinates(x_step, y_step)
+    return x, y, layout.layers
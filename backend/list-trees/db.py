@@ -0,0 +1,103 @@
+'''
+Business: Warm Postgres connection reuse across invocations of the same function instance
+Args: database_url - DSN of the database (DATABASE_URL by default)
+Returns: pooled psycopg2 connections and pool hit/miss/reconnect counters
+'''
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+import psycopg2
+import psycopg2.extensions
+
+# Idle connections kept per DSN; a function instance serves few concurrent requests
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+# Connections idle longer than this are pinged before reuse
+HEALTHCHECK_IDLE_SECONDS = float(os.environ.get('DB_HEALTHCHECK_IDLE_SECONDS', '30'))
+
+_lock = threading.Lock()
+_idle: Dict[str, List[Tuple[Any, float]]] = {}
+_stats = {'hits': 0, 'misses': 0, 'reconnects': 0, 'discarded': 0}
+
+class PooledConnection(psycopg2.extensions.connection):
+    '''Connection that remembers the DSN it was opened with (conn.dsn hides the password)'''
+    pool_key: str = ''
+
+def _is_alive(conn, idle_seconds: float) -> bool:
+    if conn.closed:
+        return False
+    if idle_seconds < HEALTHCHECK_IDLE_SECONDS:
+        return True
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+        cursor.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def get_connection(database_url: Optional[str] = None):
+    '''Take a warm connection from the pool or open a new one'''
+    dsn = database_url or os.environ.get('DATABASE_URL')
+    while True:
+        with _lock:
+            idle = _idle.get(dsn)
+            conn, released_at = idle.pop() if idle else (None, 0.0)
+            if conn is None:
+                _stats['misses'] += 1
+        if conn is None:
+            break
+        alive = _is_alive(conn, time.monotonic() - released_at)
+        with _lock:
+            _stats['hits' if alive else 'reconnects'] += 1
+        if alive:
+            return conn
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+    conn = psycopg2.connect(dsn, connection_factory=PooledConnection)
+    conn.pool_key = dsn
+    return conn
+
+def release_connection(conn) -> None:
+    '''Return a connection to the pool, rolling back anything left uncommitted'''
+    if conn.closed:
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        conn.close()
+        with _lock:
+            _stats['discarded'] += 1
+        return
+    with _lock:
+        idle = _idle.setdefault(conn.pool_key, [])
+        if len(idle) < POOL_SIZE:
+            idle.append((conn, time.monotonic()))
+            return
+        _stats['discarded'] += 1
+    conn.close()
+
+def discard_connection(conn) -> None:
+    '''Close a connection that must not go back to the pool (e.g. after a server error)'''
+    if not conn.closed:
+        conn.close()
+    with _lock:
+        _stats['discarded'] += 1
+
+def pool_stats() -> Dict[str, int]:
+    with _lock:
+        return {**_stats, 'idle': sum(len(idle) for idle in _idle.values())}
+
+def close_all() -> None:
+    with _lock:
+        idle_lists = list(_idle.values())
+        _idle.clear()
+    for idle in idle_lists:
+        for conn, _ in idle:
+            if not conn.closed:
+                conn.close()
@@ -1,14 +1,53 @@
 '''
-Business: List all family trees for a user
-Args: event - dict with httpMethod, queryStringParameters (user_email)
+Business: List family trees for a user, newest first, one page at a time
+Args: event - dict with httpMethod, queryStringParameters (user_email, limit, cursor)
       context - object with request_id
-Returns: HTTP response with array of trees
+Returns: HTTP response with a page of trees and next_cursor for the following page
 '''
+import base64
+import binascii
 import json
 import os
-from typing import Dict, Any
-import psycopg2
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
 from psycopg2.extras import RealDictCursor
+from db import discard_connection, get_connection, release_connection
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Keyset pagination: the cursor is the (updated_at, id) of the last tree on the previous page,
+# so every page is a range scan of idx_family_trees_user_updated instead of OFFSET
+TREES_PAGE_QUERY = """SELECT ft.id, ft.title, ft.description, ft.created_at, ft.updated_at,
+    ft.persons_count, ft.relationships_count
+    FROM "t_p57451291_family_tree_builder_".family_trees ft
+    WHERE ft.user_id = %(user_id)s
+    AND (%(after_id)s::integer IS NULL OR (ft.updated_at, ft.id) < (%(after_updated_at)s::timestamp, %(after_id)s::integer))
+    ORDER BY ft.updated_at DESC, ft.id DESC
+    LIMIT %(limit)s"""
+
+def encode_cursor(updated_at: datetime, tree_id: int) -> str:
+    '''Opaque page token for the tree a page ends with'''
+    raw = json.dumps([updated_at.isoformat(), tree_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor_param: str) -> Tuple[datetime, int]:
+    '''Inverse of encode_cursor, raises ValueError for tokens it did not produce'''
+    try:
+        raw = base64.urlsafe_b64decode(cursor_param + '=' * (-len(cursor_param) % 4))
+        updated_at, tree_id = json.loads(raw)
+        return datetime.fromisoformat(updated_at), int(tree_id)
+    except (binascii.Error, TypeError, UnicodeDecodeError) as e:
+        raise ValueError(str(e))
+
+def parse_limit(limit_param: Optional[str]) -> int:
+    '''Page size from the query string, capped at MAX_PAGE_SIZE'''
+    if limit_param is None:
+        return DEFAULT_PAGE_SIZE
+    limit = int(limit_param)
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, MAX_PAGE_SIZE)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -42,25 +81,50 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'user_email is required'})
         }
     
-    database_url = os.environ.get('DATABASE_URL')
-    
-    conn = psycopg2.connect(database_url)
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        limit = parse_limit(params.get('limit'))
+        after_updated_at, after_id = decode_cursor(params['cursor']) if params.get('cursor') else (None, None)
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'limit must be a positive integer and cursor a next_cursor value'})
+        }
     
-    cursor.execute(
-        """SELECT ft.id, ft.title, ft.description, ft.created_at, ft.updated_at,
-        (SELECT COUNT(*) FROM "t_p57451291_family_tree_builder_".persons WHERE tree_id = ft.id) as persons_count
-        FROM "t_p57451291_family_tree_builder_".family_trees ft
-        JOIN "t_p57451291_family_tree_builder_".users u ON ft.user_id = u.id
-        WHERE u.email = %s
-        ORDER BY ft.updated_at DESC""",
-        (user_email,)
-    )
+    database_url = os.environ.get('DATABASE_URL')
     
-    trees = cursor.fetchall()
+    conn = get_connection(database_url)
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        
+        cursor.execute(
+            'SELECT id FROM "t_p57451291_family_tree_builder_".users WHERE email = %s',
+            (user_email,)
+        )
+        user = cursor.fetchone()
+        
+        trees = []
+        if user:
+            # One extra row tells whether another page exists
+            cursor.execute(TREES_PAGE_QUERY, {
+                'user_id': user['id'],
+                'after_updated_at': after_updated_at,
+                'after_id': after_id,
+                'limit': limit + 1
+            })
+            trees = cursor.fetchall()
+        
+        cursor.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
     
-    cursor.close()
-    conn.close()
+    next_cursor = None
+    if len(trees) > limit:
+        trees = trees[:limit]
+        next_cursor = encode_cursor(trees[-1]['updated_at'], trees[-1]['id'])
     
     trees_list = []
     for tree in trees:
@@ -69,6 +133,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'title': tree['title'],
             'description': tree['description'],
             'persons_count': tree['persons_count'],
+            'relationships_count': tree['relationships_count'],
             'created_at': tree['created_at'].isoformat() if tree['created_at'] else None,
             'updated_at': tree['updated_at'].isoformat() if tree['updated_at'] else None
         })
@@ -79,6 +144,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'isBase64Encoded': False,
         'body': json.dumps({
             'trees': trees_list,
-            'count': len(trees_list)
+            'count': len(trees_list),
+            'next_cursor': next_cursor
         })
     }
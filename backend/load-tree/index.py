@@ -1,106 +1,340 @@
 '''
 Business: Load family tree from database
-Args: event - dict with httpMethod, queryStringParameters (tree_id, user_email)
+Args: event - dict with httpMethod, queryStringParameters (tree_id, user_email, assembly,
+      view=full|window|outline|focus, min_x, min_y, max_x, max_y, margin for window,
+      focus, up, down for focus)
       context - object with request_id
 Returns: HTTP response with tree data (nodes, edges, title)
 '''
+import base64
+import gzip
 import json
+import math
 import os
-from typing import Dict, Any
-import psycopg2
+from typing import Dict, Any, Optional, Tuple
 from psycopg2.extras import RealDictCursor
+from db import discard_connection, get_connection, release_connection
+from snapshot_cache import get_snapshot, store_snapshot
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Email',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    if method != 'GET':
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
-    
-    params = event.get('queryStringParameters', {}) or {}
-    tree_id = params.get('tree_id')
-    user_email = params.get('user_email') or event.get('headers', {}).get('X-User-Email')
-    
-    if not tree_id:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'tree_id is required'})
-        }
-    
-    database_url = os.environ.get('DATABASE_URL')
-    
-    conn = psycopg2.connect(database_url)
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
-    if user_email:
-        cursor.execute(
-            """SELECT ft.id, ft.title, ft.description, ft.created_at, ft.updated_at
-            FROM "t_p57451291_family_tree_builder_".family_trees ft
-            JOIN "t_p57451291_family_tree_builder_".users u ON ft.user_id = u.id
-            WHERE ft.id = %s AND u.email = %s""",
-            (tree_id, user_email)
-        )
-    else:
-        cursor.execute(
-            """SELECT id, title, description, created_at, updated_at
-            FROM "t_p57451291_family_tree_builder_".family_trees
-            WHERE id = %s""",
-            (tree_id,)
-        )
-    
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SCHEMA = '"t_p57451291_family_tree_builder_"'
+
+# Bodies smaller than this are sent uncompressed, the base64 overhead would eat the gain
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '2048'))
+# Extra canvas space loaded around a window so small pans do not need a new request
+DEFAULT_WINDOW_MARGIN = 400.0
+# Generations loaded around a focus person by default and at most
+DEFAULT_FOCUS_GENERATIONS = 2
+MAX_FOCUS_GENERATIONS = 12
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+
+TREE_FILTER = f"""ft.id = %(tree_id)s AND (
+    %(user_email)s::text IS NULL
+    OR ft.user_id IN (SELECT id FROM {SCHEMA}.users WHERE email = %(user_email)s)
+)"""
+
+def sql_json_string(expr: str) -> str:
+    '''SQL producing the json.dumps(..., ensure_ascii=False) text of a nullable string'''
+    return f"COALESCE(to_json({expr})::text, 'null')"
+
+def sql_json_coordinate(expr: str) -> str:
+    '''SQL matching `float(value) if value else 0` as serialized by json.dumps'''
+    return f"""CASE WHEN COALESCE({expr}, 0) = 0 THEN '0'
+        ELSE regexp_replace(({expr})::float8::text, '^(-?[0-9]+)$', '\\1.0') END"""
+
+def sql_json_timestamp(expr: str) -> str:
+    '''SQL matching json.dumps of datetime.isoformat() (microseconds only when non-zero)'''
+    return f"""CASE WHEN {expr} IS NULL THEN 'null' ELSE '"' || to_char({expr}, 'YYYY-MM-DD"T"HH24:MI:SS')
+        || CASE WHEN EXTRACT(MICROSECONDS FROM {expr})::bigint %% 1000000 <> 0 THEN '.' || to_char({expr}, 'US') ELSE '' END
+        || '"' END"""
+
+NODE_JSON = f"""'{{"id": ' || to_json(COALESCE(p.client_id, p.id::text))::text
+    || ', "x": ' || {sql_json_coordinate('p.position_x')}
+    || ', "y": ' || {sql_json_coordinate('p.position_y')}
+    || ', "firstName": ' || to_json(COALESCE(p.first_name, ''))::text
+    || ', "lastName": ' || to_json(COALESCE(p.last_name, ''))::text
+    || ', "middleName": ' || to_json(COALESCE(p.middle_name, ''))::text
+    || ', "maidenName": ' || to_json(COALESCE(p.maiden_name, ''))::text
+    || ', "gender": ' || to_json(COALESCE(NULLIF(p.gender, ''), 'male'))::text
+    || ', "birthDate": ' || to_json(COALESCE(p.birth_date, ''))::text
+    || ', "birthPlace": ' || to_json(COALESCE(p.birth_place, ''))::text
+    || ', "deathDate": ' || to_json(COALESCE(p.death_date, ''))::text
+    || ', "deathPlace": ' || to_json(COALESCE(p.death_place, ''))::text
+    || ', "isAlive": ' || CASE WHEN p.is_alive IS FALSE THEN 'false' ELSE 'true' END
+    || ', "occupation": ' || to_json(COALESCE(p.occupation, ''))::text
+    || ', "relation": ""'
+    || ', "bio": ' || to_json(COALESCE(p.bio, ''))::text
+    || ', "historyContext": ' || to_json(COALESCE(p.history_context, ''))::text
+    || '}}'"""
+
+EDGE_JSON = """'{"id": "e-' || r.id || '"'
+    || ', "source": ' || to_json(COALESCE(s.client_id, s.id::text))::text
+    || ', "target": ' || to_json(COALESCE(t.client_id, t.id::text))::text
+    || CASE WHEN r.relationship_type = 'spouse' THEN ', "type": "spouse"' ELSE '' END
+    || '}'"""
+
+# Whole response body assembled in Postgres, byte-identical to the Python assembly below
+TREE_JSON_QUERY = f"""SELECT ft.version, '{{"tree_id": ' || ft.id
+    || ', "title": ' || {sql_json_string('ft.title')}
+    || ', "description": ' || {sql_json_string('ft.description')}
+    || ', "nodes": ' || COALESCE((
+        SELECT '[' || string_agg({NODE_JSON}, ', ' ORDER BY p.id) || ']'
+        FROM {SCHEMA}.persons p
+        WHERE p.tree_id = ft.id
+    ), '[]')
+    || ', "edges": ' || COALESCE((
+        SELECT '[' || string_agg({EDGE_JSON}, ', ' ORDER BY r.id) || ']'
+        FROM {SCHEMA}.relationships r
+        JOIN {SCHEMA}.persons s ON s.id = r.source_person_id
+        JOIN {SCHEMA}.persons t ON t.id = r.target_person_id
+        WHERE r.tree_id = ft.id
+    ), '[]')
+    || ', "created_at": ' || {sql_json_timestamp('ft.created_at')}
+    || ', "updated_at": ' || {sql_json_timestamp('ft.updated_at')}
+    || '}}' AS body
+FROM {SCHEMA}.family_trees ft
+WHERE {TREE_FILTER}"""
+
+WINDOW_JSON_QUERY = f"""WITH window_persons AS (
+    SELECT p.* FROM {SCHEMA}.persons p
+    WHERE p.tree_id = %(tree_id)s
+    AND p.position_x BETWEEN %(min_x)s AND %(max_x)s
+    AND p.position_y BETWEEN %(min_y)s AND %(max_y)s
+), window_edges AS (
+    SELECT r.* FROM {SCHEMA}.relationships r WHERE r.source_person_id IN (SELECT id FROM window_persons)
+    UNION
+    SELECT r.* FROM {SCHEMA}.relationships r WHERE r.target_person_id IN (SELECT id FROM window_persons)
+)
+SELECT '{{"tree_id": ' || %(tree_id)s::int
+    || ', "view": "window", "bbox": ' || %(bbox)s
+    || ', "nodes": ' || COALESCE((
+        SELECT '[' || string_agg({NODE_JSON}, ', ' ORDER BY p.id) || ']' FROM window_persons p
+    ), '[]')
+    || ', "edges": ' || COALESCE((
+        SELECT '[' || string_agg({EDGE_JSON}, ', ' ORDER BY r.id) || ']'
+        FROM window_edges r
+        JOIN {SCHEMA}.persons s ON s.id = r.source_person_id
+        JOIN {SCHEMA}.persons t ON t.id = r.target_person_id
+    ), '[]')
+    || '}}' AS body"""
+
+# Ids and coordinates only, served from idx_persons_tree_position
+OUTLINE_JSON_QUERY = f"""SELECT '{{"tree_id": ' || %(tree_id)s::int
+    || ', "view": "outline", "nodes": ' || COALESCE('[' || string_agg(
+        '[' || to_json(COALESCE(p.client_id, p.id::text))::text
+        || ', ' || {sql_json_coordinate('p.position_x')}
+        || ', ' || {sql_json_coordinate('p.position_y')} || ']',
+        ', ' ORDER BY p.id
+    ) || ']', '[]')
+    || '}}' AS body
+FROM {SCHEMA}.persons p
+WHERE p.tree_id = %(tree_id)s"""
+
+# Ancestors and descendants of the focus person within up/down generations, plus their spouses.
+# Frontier members still have relatives outside the loaded set, the client expands them on demand.
+FOCUS_JSON_QUERY = f"""WITH RECURSIVE focus AS (
+    SELECT id FROM {SCHEMA}.persons WHERE tree_id = %(tree_id)s AND client_id = %(focus)s
+), ancestors(id, depth) AS (
+    SELECT id, 0 FROM focus
+    UNION
+    SELECT r.source_person_id, a.depth + 1
+    FROM ancestors a
+    JOIN {SCHEMA}.relationships r ON r.target_person_id = a.id AND r.relationship_type = 'parent'
+    WHERE a.depth < %(up)s
+), descendants(id, depth) AS (
+    SELECT id, 0 FROM focus
+    UNION
+    SELECT r.target_person_id, d.depth + 1
+    FROM descendants d
+    JOIN {SCHEMA}.relationships r ON r.source_person_id = d.id AND r.relationship_type = 'parent'
+    WHERE d.depth < %(down)s
+), core AS (
+    SELECT id FROM ancestors UNION SELECT id FROM descendants
+), members AS (
+    SELECT id FROM core
+    UNION
+    SELECT r.target_person_id FROM {SCHEMA}.relationships r JOIN core c ON r.source_person_id = c.id
+    WHERE r.relationship_type = 'spouse'
+    UNION
+    SELECT r.source_person_id FROM {SCHEMA}.relationships r JOIN core c ON r.target_person_id = c.id
+    WHERE r.relationship_type = 'spouse'
+), member_edges AS (
+    SELECT r.* FROM {SCHEMA}.relationships r
+    JOIN members m ON r.source_person_id = m.id
+    WHERE r.target_person_id IN (SELECT id FROM members)
+), frontier AS (
+    SELECT m.id FROM members m
+    WHERE EXISTS (
+        SELECT 1 FROM {SCHEMA}.relationships r
+        WHERE r.source_person_id = m.id AND r.target_person_id NOT IN (SELECT id FROM members)
+    ) OR EXISTS (
+        SELECT 1 FROM {SCHEMA}.relationships r
+        WHERE r.target_person_id = m.id AND r.source_person_id NOT IN (SELECT id FROM members)
+    )
+)
+SELECT (SELECT COUNT(*) FROM focus) AS found, '{{"tree_id": ' || %(tree_id)s::int
+    || ', "view": "focus", "focus": ' || to_json(%(focus)s::text)::text
+    || ', "up": ' || %(up)s || ', "down": ' || %(down)s
+    || ', "nodes": ' || COALESCE((
+        SELECT '[' || string_agg({NODE_JSON}, ', ' ORDER BY p.id) || ']'
+        FROM {SCHEMA}.persons p JOIN members m ON m.id = p.id
+    ), '[]')
+    || ', "edges": ' || COALESCE((
+        SELECT '[' || string_agg({EDGE_JSON}, ', ' ORDER BY r.id) || ']'
+        FROM member_edges r
+        JOIN {SCHEMA}.persons s ON s.id = r.source_person_id
+        JOIN {SCHEMA}.persons t ON t.id = r.target_person_id
+    ), '[]')
+    || ', "frontier": ' || COALESCE((
+        SELECT '[' || string_agg(to_json(COALESCE(p.client_id, p.id::text))::text, ', ' ORDER BY p.id) || ']'
+        FROM {SCHEMA}.persons p JOIN frontier f ON f.id = p.id
+    ), '[]')
+    || '}}' AS body"""
+
+def parse_focus(params: Dict[str, str]) -> Dict[str, Any]:
+    '''Focus person id and generation radius, raises ValueError'''
+    focus = params.get('focus')
+    if not focus:
+        raise ValueError('focus is required for view=focus')
+    try:
+        up = int(params.get('up', DEFAULT_FOCUS_GENERATIONS))
+        down = int(params.get('down', DEFAULT_FOCUS_GENERATIONS))
+    except ValueError:
+        raise ValueError('up and down must be integers')
+    if not (0 <= up <= MAX_FOCUS_GENERATIONS and 0 <= down <= MAX_FOCUS_GENERATIONS):
+        raise ValueError(f'up and down must be between 0 and {MAX_FOCUS_GENERATIONS}')
+    return {'focus': focus, 'up': up, 'down': down}
+
+def load_focus(cursor, tree_id: str, focus: Dict[str, Any]) -> Optional[str]:
+    '''Generations around the focus person, None when the person is not in the tree'''
+    cursor.execute(FOCUS_JSON_QUERY, {'tree_id': tree_id, **focus})
+    row = cursor.fetchone()
+    return row['body'] if row['found'] else None
+
+def parse_window(params: Dict[str, str]) -> Dict[str, float]:
+    '''Bounding box from min_x/min_y/max_x/max_y widened by margin, raises ValueError'''
+    try:
+        min_x, min_y, max_x, max_y = (float(params[key]) for key in ('min_x', 'min_y', 'max_x', 'max_y'))
+        margin = float(params.get('margin', DEFAULT_WINDOW_MARGIN))
+    except (KeyError, TypeError):
+        raise ValueError('min_x, min_y, max_x and max_y are required for view=window')
+    # float() accepts nan and inf, which would pass the comparisons below and end up in the JSON body
+    if not all(math.isfinite(value) for value in (min_x, min_y, max_x, max_y, margin)):
+        raise ValueError('Window bounds and margin must be finite numbers')
+    if min_x > max_x or min_y > max_y or margin < 0:
+        raise ValueError('Invalid window bounds')
+    return {
+        'min_x': min_x - margin, 'min_y': min_y - margin,
+        'max_x': max_x + margin, 'max_y': max_y + margin
+    }
+
+def load_window(cursor, tree_id: str, bbox: Dict[str, float]) -> str:
+    '''Persons inside the bounding box and every edge touching them'''
+    cursor.execute(WINDOW_JSON_QUERY, {'tree_id': tree_id, 'bbox': json.dumps(bbox), **bbox})
+    return cursor.fetchone()['body']
+
+def load_outline(cursor, tree_id: str) -> str:
+    '''[id, x, y] triples of all persons for the minimap'''
+    cursor.execute(OUTLINE_JSON_QUERY, {'tree_id': tree_id})
+    return cursor.fetchone()['body']
+
+def tree_version(cursor, tree_id: str, user_email: Optional[str]) -> Optional[int]:
+    '''Current version of the tree, a primary key lookup that never touches persons'''
+    cursor.execute(
+        f"SELECT ft.version FROM {SCHEMA}.family_trees ft WHERE {TREE_FILTER}",
+        {'tree_id': tree_id, 'user_email': user_email}
+    )
+    row = cursor.fetchone()
+    return row['version'] if row else None
+
+def make_etag(tree_id: str, version: int) -> str:
+    # Weak, so the identity, gzip and br representations of one version share a validator
+    return f'W/"{tree_id}-{version}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    opaque_tag = etag[2:] if etag.startswith('W/') else etag
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or any((tag[2:] if tag.startswith('W/') else tag) == opaque_tag for tag in candidates)
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    '''Pick br or gzip from an Accept-Encoding header, None for identity'''
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(','):
+        token, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token.strip().lower()] = quality
+    wildcard = accepted.get('*', 0.0)
+    if brotli is not None and accepted.get('br', wildcard) > 0:
+        return 'br'
+    if accepted.get('gzip', wildcard) > 0:
+        return 'gzip'
+    return None
+
+def compress_body(body: str, encoding: str) -> bytes:
+    data = body.encode('utf-8')
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+def load_tree_json(cursor, tree_id: str, user_email: Optional[str]) -> Optional[Tuple[str, int]]:
+    '''Response body built by Postgres in one round-trip, with the tree version'''
+    cursor.execute(TREE_JSON_QUERY, {'tree_id': tree_id, 'user_email': user_email})
+    row = cursor.fetchone()
+    return (row['body'], row['version']) if row else None
+
+def load_tree_python(cursor, tree_id: str, user_email: Optional[str]) -> Optional[Tuple[str, int]]:
+    '''Response body built in Python from separate tree, persons and relationships queries'''
+    cursor.execute(
+        f"""SELECT ft.id, ft.title, ft.description, ft.created_at, ft.updated_at, ft.version
+        FROM {SCHEMA}.family_trees ft
+        WHERE {TREE_FILTER}""",
+        {'tree_id': tree_id, 'user_email': user_email}
+    )
     tree = cursor.fetchone()
-    
     if not tree:
-        cursor.close()
-        conn.close()
-        return {
-            'statusCode': 404,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Tree not found or access denied'})
-        }
-    
+        return None
+
     cursor.execute(
-        """SELECT id, first_name, last_name, middle_name, maiden_name, gender, 
-        birth_date, birth_place, death_date, death_place, is_alive, occupation, 
+        f"""SELECT id, COALESCE(client_id, id::text) AS node_id, first_name, last_name, middle_name, maiden_name, gender,
+        birth_date, birth_place, death_date, death_place, is_alive, occupation,
         bio, history_context, position_x, position_y
-        FROM "t_p57451291_family_tree_builder_".persons
+        FROM {SCHEMA}.persons
         WHERE tree_id = %s
         ORDER BY id""",
         (tree_id,)
     )
     persons = cursor.fetchall()
-    
+
     cursor.execute(
-        """SELECT id, source_person_id, target_person_id, relationship_type
-        FROM "t_p57451291_family_tree_builder_".relationships
-        WHERE tree_id = %s""",
+        f"""SELECT r.id, COALESCE(s.client_id, s.id::text) AS source_node_id,
+        COALESCE(t.client_id, t.id::text) AS target_node_id, r.relationship_type
+        FROM {SCHEMA}.relationships r
+        JOIN {SCHEMA}.persons s ON s.id = r.source_person_id
+        JOIN {SCHEMA}.persons t ON t.id = r.target_person_id
+        WHERE r.tree_id = %s
+        ORDER BY r.id""",
         (tree_id,)
     )
     relationships = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
-    
+
     nodes = []
     for person in persons:
         nodes.append({
-            'id': str(person['id']),
+            'id': person['node_id'],
             'x': float(person['position_x']) if person['position_x'] else 0,
             'y': float(person['position_y']) if person['position_y'] else 0,
             'firstName': person['first_name'] or '',
@@ -118,28 +352,183 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'bio': person['bio'] or '',
             'historyContext': person['history_context'] or ''
         })
-    
+
     edges = []
     for rel in relationships:
         edge_type = 'spouse' if rel['relationship_type'] == 'spouse' else None
         edges.append({
             'id': f"e-{rel['id']}",
-            'source': str(rel['source_person_id']),
-            'target': str(rel['target_person_id']),
+            'source': rel['source_node_id'],
+            'target': rel['target_node_id'],
             **(({'type': edge_type}) if edge_type else {})
         })
-    
+
+    body = json.dumps({
+        'tree_id': tree['id'],
+        'title': tree['title'],
+        'description': tree['description'],
+        'nodes': nodes,
+        'edges': edges,
+        'created_at': tree['created_at'].isoformat() if tree['created_at'] else None,
+        'updated_at': tree['updated_at'].isoformat() if tree['updated_at'] else None
+    }, ensure_ascii=False)
+    return body, tree['version']
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Email, If-None-Match',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'})
+        }
+
+    params = event.get('queryStringParameters', {}) or {}
+    headers = event.get('headers', {}) or {}
+    tree_id = params.get('tree_id')
+    user_email = params.get('user_email') or headers.get('X-User-Email')
+    if_none_match = headers.get('If-None-Match') or headers.get('if-none-match')
+    accept_encoding = headers.get('Accept-Encoding') or headers.get('accept-encoding')
+    assembly = params.get('assembly', 'db')
+    view = params.get('view', 'full')
+
+    if not tree_id or not tree_id.isdigit():
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'tree_id is required'})
+        }
+    tree_id = str(int(tree_id))
+
+    if assembly not in ('db', 'python'):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'assembly must be db or python'})
+        }
+
+    if view not in ('full', 'window', 'outline', 'focus'):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'view must be full, window, outline or focus'})
+        }
+
+    bbox = None
+    focus = None
+    if view in ('window', 'focus'):
+        try:
+            if view == 'window':
+                bbox = parse_window(params)
+            else:
+                focus = parse_focus(params)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)})
+            }
+
+    database_url = os.environ.get('DATABASE_URL')
+
+    conn = get_connection(database_url)
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+        version = tree_version(cursor, tree_id, user_email)
+
+        if version is None:
+            cursor.close()
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Tree not found or access denied'})
+            }
+
+        if etag_matches(if_none_match, make_etag(tree_id, version)):
+            cursor.close()
+            return {
+                'statusCode': 304,
+                'headers': {
+                    'ETag': make_etag(tree_id, version),
+                    'Cache-Control': 'private, no-cache',
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Expose-Headers': 'ETag'
+                },
+                'body': ''
+            }
+
+        if view == 'window':
+            body = load_window(cursor, tree_id, bbox)
+            cache_status = 'bypass'
+        elif view == 'outline':
+            body = load_outline(cursor, tree_id)
+            cache_status = 'bypass'
+        elif view == 'focus':
+            body = load_focus(cursor, tree_id, focus)
+            cache_status = 'bypass'
+            if body is None:
+                cursor.close()
+                return {
+                    'statusCode': 404,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Focus person not found'})
+                }
+        elif assembly == 'python':
+            # Comparison mode, always rebuilt from the tables
+            body, version = load_tree_python(cursor, tree_id, user_email)
+            cache_status = 'bypass'
+        else:
+            body, cache_status = get_snapshot(cursor, tree_id, version)
+            if body is None:
+                # The body query reads its own version, so a concurrent save cannot mislabel the snapshot
+                body, version = load_tree_json(cursor, tree_id, user_email)
+                store_snapshot(cursor, tree_id, version, body)
+                conn.commit()
+
+        cursor.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
+
+    response_headers = {
+        'Content-Type': 'application/json; charset=utf-8',
+        'ETag': make_etag(tree_id, version),
+        'Cache-Control': 'private, no-cache',
+        'Vary': 'Accept-Encoding',
+        'X-Cache': cache_status,
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag, X-Cache'
+    }
+
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding and len(body) >= COMPRESSION_MIN_BYTES:
+        response_headers['Content-Encoding'] = encoding
+        return {
+            'statusCode': 200,
+            'headers': response_headers,
+            'isBase64Encoded': True,
+            'body': base64.b64encode(compress_body(body, encoding)).decode('ascii')
+        }
+
     return {
         'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'headers': response_headers,
         'isBase64Encoded': False,
-        'body': json.dumps({
-            'tree_id': tree['id'],
-            'title': tree['title'],
-            'description': tree['description'],
-            'nodes': nodes,
-            'edges': edges,
-            'created_at': tree['created_at'].isoformat() if tree['created_at'] else None,
-            'updated_at': tree['updated_at'].isoformat() if tree['updated_at'] else None
-        })
+        'body': body
     }
@@ -0,0 +1,107 @@
+'''
+Business: Serialized load-tree responses cached per tree version, in process memory and in tree_snapshots
+Args: tree_id and version of the tree, body - serialized response
+Returns: cached body or None, hit/miss/eviction counters
+'''
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+SCHEMA = '"t_p57451291_family_tree_builder_"'
+
+# Memory budget of the in-process cache, bodies above a quarter of it are not kept in memory
+MAX_BYTES = int(os.environ.get('SNAPSHOT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+class SnapshotLRU:
+    '''LRU of serialized trees bounded by total body size, one entry (latest version) per tree'''
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: 'OrderedDict[str, Tuple[int, str, int]]' = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'snapshot_hits': 0, 'misses': 0, 'evictions': 0, 'stale': 0}
+
+    def get(self, tree_id: str, version: int) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(tree_id)
+            if entry is None:
+                return None
+            cached_version, body, size = entry
+            if cached_version != version:
+                del self.entries[tree_id]
+                self.bytes -= size
+                self.stats['stale'] += 1
+                return None
+            self.entries.move_to_end(tree_id)
+            return body
+
+    def put(self, tree_id: str, version: int, body: str) -> None:
+        size = sys.getsizeof(body)
+        if size > self.max_bytes // 4:
+            return
+        with self.lock:
+            previous = self.entries.pop(tree_id, None)
+            if previous is not None:
+                self.bytes -= previous[2]
+            self.entries[tree_id] = (version, body, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes and self.entries:
+                _, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.stats['evictions'] += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.stats['memory_hits'] + self.stats['snapshot_hits'] + self.stats['misses']
+            hits = self.stats['memory_hits'] + self.stats['snapshot_hits']
+            return {
+                **self.stats,
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0
+            }
+
+memory_cache = SnapshotLRU(MAX_BYTES)
+
+def get_snapshot(cursor, tree_id: str, version: int) -> Tuple[Optional[str], str]:
+    '''Cached body for this tree version and where it came from: memory, snapshot or miss'''
+    body = memory_cache.get(tree_id, version)
+    if body is not None:
+        memory_cache.stats['memory_hits'] += 1
+        return body, 'memory'
+
+    cursor.execute(
+        f"SELECT body FROM {SCHEMA}.tree_snapshots WHERE tree_id = %s AND version = %s",
+        (tree_id, version)
+    )
+    row = cursor.fetchone()
+    if row:
+        memory_cache.stats['snapshot_hits'] += 1
+        memory_cache.put(tree_id, version, row['body'])
+        return row['body'], 'snapshot'
+
+    memory_cache.stats['misses'] += 1
+    return None, 'miss'
+
+def store_snapshot(cursor, tree_id: str, version: int, body: str) -> None:
+    '''Remember a freshly built body; never replaces a snapshot of a newer version'''
+    memory_cache.put(tree_id, version, body)
+    cursor.execute(
+        f"""INSERT INTO {SCHEMA}.tree_snapshots AS ts (tree_id, version, body)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (tree_id) DO UPDATE SET version = EXCLUDED.version, body = EXCLUDED.body,
+        created_at = CURRENT_TIMESTAMP
+        WHERE ts.version < EXCLUDED.version""",
+        (tree_id, version, body)
+    )
+
+def cache_stats() -> Dict[str, Any]:
+    return memory_cache.snapshot_stats()
@@ -1,14 +1,242 @@
 import json
 import os
-from typing import Dict, Any
-from datetime import datetime, timedelta
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Optional, Tuple
+from datetime import date, datetime, timedelta
 import urllib.request
 import urllib.error
+import psycopg2
+from db import discard_connection, get_connection, release_connection
+from rollup import GRANULARITIES, MAX_RANGE_DAYS, MUTABLE_DAYS, days_to_fetch, sync, aggregate
+
+METRIKA_COUNTER_ID = os.environ.get('METRIKA_COUNTER_ID', '101026698')
+METRIKA_API_URL = os.environ.get('METRIKA_API_URL', 'https://api-metrika.yandex.net')
+FETCH_TIMEOUT_SECONDS = float(os.environ.get('METRIKA_TIMEOUT_SECONDS', '5'))
+# Свежий ответ отдаём из кэша без запроса к Метрике
+CACHE_TTL_SECONDS = float(os.environ.get('METRIKA_CACHE_TTL_SECONDS', '300'))
+# Устаревший ответ отдаём сразу, а обновляем в фоне (stale-while-revalidate)
+STALE_WHILE_REVALIDATE_SECONDS = float(os.environ.get('METRIKA_STALE_WHILE_REVALIDATE_SECONDS', '3600'))
+# Если Метрика недоступна, отдаём последний ответ не старше суток с флагом stale
+STALE_IF_ERROR_SECONDS = float(os.environ.get('METRIKA_STALE_IF_ERROR_SECONDS', '86400'))
+
+# Запросы итогов и целей идут параллельно; пул живёт между вызовами тёплого инстанса
+executor = ThreadPoolExecutor(max_workers=4)
+cache_lock = threading.Lock()
+cache: Dict[Tuple[str, str], Tuple[float, Dict[str, Any]]] = {}
+refreshing: set = set()
+cache_stats = {'fresh_hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'upstream_errors': 0, 'served_stale_on_error': 0}
+
+def fetch_json(url: str, metrika_token: str) -> Dict[str, Any]:
+    '''GET к API Метрики с таймаутом'''
+    request = urllib.request.Request(url, headers={'Authorization': f'OAuth {metrika_token}'})
+    with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT_SECONDS) as response:
+        return json.loads(response.read().decode())
+
+def parse_goals(goals_response: Dict[str, Any]) -> Dict[str, Any]:
+    '''Достижения целей по названию цели'''
+    goals_data = {}
+    for item in goals_response.get('data', []):
+        dimensions = item.get('dimensions', [])
+        metrics = item.get('metrics', [])
+        if dimensions and metrics:
+            goals_data[dimensions[0].get('name', '')] = metrics[0]
+    return goals_data
+
+def fetch_stats(metrika_token: str, counter_id: str, date_start: str, date_end: str) -> Dict[str, Any]:
+    '''Итоги и цели за период: оба запроса одновременно, ошибка целей не ломает ответ'''
+    stats_url = f'{METRIKA_API_URL}/stat/v1/data?ids={counter_id}&metrics=ym:s:visits,ym:s:users,ym:s:pageviews&date1={date_start}&date2={date_end}&accuracy=full'
+    goals_url = f'{METRIKA_API_URL}/stat/v1/data?ids={counter_id}&metrics=ym:s:goal{counter_id}reaches&dimensions=ym:s:goalDimension&date1={date_start}&date2={date_end}&accuracy=full'
+    
+    stats_future = executor.submit(fetch_json, stats_url, metrika_token)
+    goals_future = executor.submit(fetch_json, goals_url, metrika_token)
+    
+    goals_data = {}
+    try:
+        goals_data = parse_goals(goals_future.result())
+    except Exception as e:
+        print(f"Error fetching goals: {e}")
+    
+    stats_data = stats_future.result()
+    totals = stats_data.get('totals', [0, 0, 0])
+    
+    return {
+        'visits': totals[0],
+        'users': totals[1],
+        'pageviews': totals[2],
+        'period': {
+            'start': date_start,
+            'end': date_end
+        },
+        'goals': goals_data,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def fetch_daily(metrika_token: str, counter_id: str, date_start: str, date_end: str) -> Dict[str, Dict[str, float]]:
+    '''Посуточные итоги и цели за период: {'YYYY-MM-DD': {'visits': .., 'goal:<имя>': ..}}'''
+    totals_url = f'{METRIKA_API_URL}/stat/v1/data?ids={counter_id}&metrics=ym:s:visits,ym:s:users,ym:s:pageviews&dimensions=ym:s:date&date1={date_start}&date2={date_end}&accuracy=full&limit=100000'
+    goals_url = f'{METRIKA_API_URL}/stat/v1/data?ids={counter_id}&metrics=ym:s:goal{counter_id}reaches&dimensions=ym:s:date,ym:s:goalDimension&date1={date_start}&date2={date_end}&accuracy=full&limit=100000'
+    
+    totals_future = executor.submit(fetch_json, totals_url, metrika_token)
+    goals_future = executor.submit(fetch_json, goals_url, metrika_token)
+    
+    # Здесь ошибка целей не игнорируется: иначе сутки сохранились бы без целей как загруженные
+    days: Dict[str, Dict[str, float]] = {}
+    for item in totals_future.result().get('data', []):
+        visits, users, pageviews = item['metrics'][:3]
+        days.setdefault(item['dimensions'][0]['name'], {}).update(visits=visits, users=users, pageviews=pageviews)
+    for item in goals_future.result().get('data', []):
+        day, goal = item['dimensions'][0]['name'], item['dimensions'][1].get('name', '')
+        days.setdefault(day, {})[f'goal:{goal}'] = item['metrics'][0]
+    return days
+
+def parse_period(params: Dict[str, str]) -> Tuple[date, date, str]:
+    '''date1/date2 (по умолчанию последние 7 дней) и гранулярность из параметров запроса'''
+    date2 = date.fromisoformat(params['date2']) if params.get('date2') else date.today()
+    date1 = date.fromisoformat(params['date1']) if params.get('date1') else date2 - timedelta(days=7)
+    granularity = params.get('granularity', 'total')
+    if date1 > date2 or (date2 - date1).days >= MAX_RANGE_DAYS:
+        raise ValueError(f'date1 must not be after date2 and the range must be under {MAX_RANGE_DAYS} days')
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    return date1, date2, granularity
+
+def sync_mutable_days(database_url: str, metrika_token: str, counter_id: str) -> None:
+    '''Перезагрузка последних METRIKA_MUTABLE_DAYS суток, загруженных раньше CACHE_TTL_SECONDS назад'''
+    conn = get_connection(database_url)
+    try:
+        sync(conn, counter_id, date.today() - timedelta(days=MUTABLE_DAYS), date.today(), CACHE_TTL_SECONDS,
+             lambda start, end: fetch_daily(metrika_token, counter_id, start, end))
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
+
+def get_rollup_stats(database_url: str, metrika_token: str, counter_id: str,
+                     date1: date, date2: date, granularity: str) -> Dict[str, Any]:
+    '''Догружаем сутки, которых ещё нет, и считаем период одним агрегатным запросом по локальной таблице;
+    устаревшие последние сутки отдаём сразу и обновляем в фоне'''
+    conn = get_connection(database_url)
+    stale = False
+    days_fetched = 0
+    try:
+        try:
+            report = sync(conn, counter_id, date1, date2, None,
+                          lambda start, end: fetch_daily(metrika_token, counter_id, start, end))
+            days_fetched = report['days_fetched']
+        except (urllib.error.URLError, OSError, ValueError, KeyError, psycopg2.Error) as e:
+            # Метрика недоступна или догрузка не удалась: отвечаем тем, что уже загружено
+            conn.rollback()
+            stale = True
+            print(f"Rollup sync failed: {e}")
+        
+        cursor = conn.cursor()
+        buckets = aggregate(cursor, counter_id, date1, date2, granularity)
+        expired = not stale and bool(days_to_fetch(cursor, counter_id, date1, date2, CACHE_TTL_SECONDS))
+        cursor.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
+    
+    if expired:
+        stale = True
+        refresh_in_background(('rollup', counter_id),
+                              lambda: sync_mutable_days(database_url, metrika_token, counter_id))
+    
+    goals: Dict[str, float] = {}
+    for bucket in buckets:
+        for goal, reaches in bucket['goals'].items():
+            goals[goal] = goals.get(goal, 0) + reaches
+    
+    result = {
+        # users — сумма посуточных посетителей, а не уникальные за период
+        'visits': sum(bucket['visits'] for bucket in buckets),
+        'users': sum(bucket['users'] for bucket in buckets),
+        'pageviews': sum(bucket['pageviews'] for bucket in buckets),
+        'period': {
+            'start': date1.isoformat(),
+            'end': date2.isoformat()
+        },
+        'goals': goals,
+        'granularity': granularity,
+        'timestamp': datetime.now().isoformat(),
+        'cached': days_fetched == 0,
+        'stale': stale
+    }
+    if granularity != 'total':
+        result['series'] = buckets
+    return result
+
+def cached_result(key: Tuple[str, str]) -> Optional[Tuple[float, Dict[str, Any]]]:
+    '''Возраст в секундах и закэшированный ответ за период'''
+    with cache_lock:
+        entry = cache.get(key)
+    if entry is None:
+        return None
+    fetched_at, result = entry
+    return time.monotonic() - fetched_at, result
+
+def refresh(metrika_token: str, counter_id: str, key: Tuple[str, str]) -> Dict[str, Any]:
+    '''Запрос к Метрике и запись в кэш'''
+    result = fetch_stats(metrika_token, counter_id, *key)
+    with cache_lock:
+        cache[key] = (time.monotonic(), result)
+        cache_stats['refreshes'] += 1
+    return result
+
+def refresh_in_background(key: Tuple[str, str], update: Callable[[], Any]) -> None:
+    '''Одно фоновое обновление на ключ; завершится в этом или следующем тёплом вызове'''
+    with cache_lock:
+        if key in refreshing:
+            return
+        refreshing.add(key)
+    
+    def run() -> None:
+        try:
+            update()
+        except Exception as e:
+            with cache_lock:
+                cache_stats['upstream_errors'] += 1
+            print(f"Background refresh failed: {e}")
+        finally:
+            with cache_lock:
+                refreshing.discard(key)
+    
+    threading.Thread(target=run, daemon=True).start()
+
+def get_stats(metrika_token: str, counter_id: str, date_start: str, date_end: str) -> Dict[str, Any]:
+    '''Ответ из кэша, с фоновым обновлением или из Метрики; при сбое Метрики — последний ответ с stale'''
+    key = (date_start, date_end)
+    cached = cached_result(key)
+    
+    if cached and cached[0] < CACHE_TTL_SECONDS:
+        cache_stats['fresh_hits'] += 1
+        return {**cached[1], 'cached': True, 'stale': False}
+    
+    if cached and cached[0] < CACHE_TTL_SECONDS + STALE_WHILE_REVALIDATE_SECONDS:
+        cache_stats['stale_hits'] += 1
+        refresh_in_background(key, lambda: refresh(metrika_token, counter_id, key))
+        return {**cached[1], 'cached': True, 'stale': True}
+    
+    cache_stats['misses'] += 1
+    try:
+        return {**refresh(metrika_token, counter_id, key), 'cached': False, 'stale': False}
+    except Exception:
+        cache_stats['upstream_errors'] += 1
+        if cached and cached[0] < STALE_IF_ERROR_SECONDS:
+            cache_stats['served_stale_on_error'] += 1
+            return {**cached[1], 'cached': True, 'stale': True}
+        raise
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Получение статистики из Яндекс.Метрики для админ-панели
-    Args: event - HTTP запрос с методом GET
+    Args: event - HTTP запрос GET, queryStringParameters: date1, date2 (YYYY-MM-DD),
+                  granularity (day|week|month|total), action=sync - только догрузить сутки
           context - контекст функции
     Returns: JSON с метриками: визиты, посетители, конверсии по целям
     '''
@@ -43,63 +271,42 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Metrika token not configured'})
         }
     
-    counter_id = '101026698'
-    
-    # Получаем данные за последние 7 дней
-    date_end = datetime.now().strftime('%Y-%m-%d')
-    date_start = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
+    counter_id = METRIKA_COUNTER_ID
+    params = event.get('queryStringParameters') or {}
+    database_url = os.environ.get('DATABASE_URL')
     
     try:
-        # Запрос общей статистики
-        stats_url = f'https://api-metrika.yandex.net/stat/v1/data?ids={counter_id}&metrics=ym:s:visits,ym:s:users,ym:s:pageviews&date1={date_start}&date2={date_end}&accuracy=full'
-        
-        stats_request = urllib.request.Request(
-            stats_url,
-            headers={'Authorization': f'OAuth {metrika_token}'}
-        )
-        
-        with urllib.request.urlopen(stats_request) as response:
-            stats_data = json.loads(response.read().decode())
-        
-        # Запрос данных по целям
-        goals_url = f'https://api-metrika.yandex.net/stat/v1/data?ids={counter_id}&metrics=ym:s:goal{counter_id}reaches&dimensions=ym:s:goalDimension&date1={date_start}&date2={date_end}&accuracy=full'
-        
-        goals_request = urllib.request.Request(
-            goals_url,
-            headers={'Authorization': f'OAuth {metrika_token}'}
-        )
-        
-        goals_data = {}
-        try:
-            with urllib.request.urlopen(goals_request) as response:
-                goals_response = json.loads(response.read().decode())
-                
-                # Парсим данные по целям
-                if 'data' in goals_response:
-                    for item in goals_response['data']:
-                        dimensions = item.get('dimensions', [])
-                        metrics = item.get('metrics', [])
-                        if dimensions and metrics:
-                            goal_name = dimensions[0].get('name', '')
-                            goal_reaches = metrics[0]
-                            goals_data[goal_name] = goal_reaches
-        except Exception as e:
-            print(f"Error fetching goals: {e}")
-        
-        # Формируем ответ
-        totals = stats_data.get('totals', [0, 0, 0])
-        
-        result = {
-            'visits': totals[0],
-            'users': totals[1],
-            'pageviews': totals[2],
-            'period': {
-                'start': date_start,
-                'end': date_end
-            },
-            'goals': goals_data,
-            'timestamp': datetime.now().isoformat()
+        date1, date2, granularity = parse_period(params)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)})
         }
+    
+    if not database_url and granularity != 'total':
+        return {
+            'statusCode': 400,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'granularity requires the rollup database'})
+        }
+    
+    try:
+        if params.get('action') == 'sync' and database_url:
+            # Отдельный запуск задачи догрузки, например по расписанию
+            conn = get_connection(database_url)
+            try:
+                result = sync(conn, counter_id, date1, date2, CACHE_TTL_SECONDS,
+                              lambda start, end: fetch_daily(metrika_token, counter_id, start, end))
+            except Exception:
+                discard_connection(conn)
+                raise
+            finally:
+                release_connection(conn)
+        elif database_url:
+            result = get_rollup_stats(database_url, metrika_token, counter_id, date1, date2, granularity)
+        else:
+            result = get_stats(metrika_token, counter_id, date1.isoformat(), date2.isoformat())
         
         return {
             'statusCode': 200,
@@ -0,0 +1,116 @@
+'''
+Business: Daily rollup of Metrika metrics in Postgres, filled incrementally and aggregated per day/week/month/total
+Args: cursor, counter_id, date range, fetch_days - callable loading per-day metrics for a date range from Metrika
+Returns: days still missing, rows stored per sync, aggregated buckets
+'''
+import os
+from datetime import date, timedelta
+from typing import Callable, Dict, Any, List, Optional, Tuple
+from psycopg2.extras import execute_values
+
+SCHEMA = '"t_p57451291_family_tree_builder_"'
+
+# Metrika keeps adjusting the last days (late hits, robots filtering), those are refetched
+MUTABLE_DAYS = int(os.environ.get('METRIKA_MUTABLE_DAYS', '2'))
+MAX_RANGE_DAYS = int(os.environ.get('METRIKA_MAX_RANGE_DAYS', '1100'))
+GRANULARITIES = ('day', 'week', 'month', 'total')
+
+# Bucket start per granularity; whitelisted SQL, never built from the request
+BUCKET_EXPRESSIONS = {
+    'day': 'day',
+    'week': "date_trunc('week', day)::date",
+    'month': "date_trunc('month', day)::date",
+    'total': '%(date1)s::date'
+}
+
+def days_to_fetch(cursor, counter_id: str, date1: date, date2: date,
+                  refresh_after_seconds: Optional[float]) -> List[date]:
+    '''Days of the range never stored, plus recent days stored longer ago than refresh_after_seconds
+    (None leaves stored days alone)'''
+    # fetched_at is written and compared in the database's own clock, whatever the session time zone
+    cursor.execute(
+        f"""SELECT day, fetched_at < LOCALTIMESTAMP - %s * INTERVAL '1 second' FROM {SCHEMA}.analytics_rollup_days
+        WHERE counter_id = %s AND day BETWEEN %s AND %s""",
+        (refresh_after_seconds or 0, counter_id, date1, date2)
+    )
+    expired = {row[0]: row[1] for row in cursor.fetchall()}
+    mutable_from = date.today() - timedelta(days=MUTABLE_DAYS)
+    missing = []
+    for offset in range((date2 - date1).days + 1):
+        day = date1 + timedelta(days=offset)
+        if day not in expired or (refresh_after_seconds is not None and day >= mutable_from and expired[day]):
+            missing.append(day)
+    return missing
+
+def contiguous_ranges(days: List[date]) -> List[Tuple[date, date]]:
+    '''Sorted days grouped into [start, end] runs, one Metrika query pair per run'''
+    ranges: List[Tuple[date, date]] = []
+    for day in sorted(days):
+        if ranges and day == ranges[-1][1] + timedelta(days=1):
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+def store_range(cursor, counter_id: str, start: date, end: date, values: Dict[str, Dict[str, float]]) -> int:
+    '''Replace the stored metrics of [start, end] and mark every day of it as fetched'''
+    cursor.execute(
+        f"DELETE FROM {SCHEMA}.analytics_daily WHERE counter_id = %s AND day BETWEEN %s AND %s",
+        (counter_id, start, end)
+    )
+    rows = [
+        (counter_id, day, metric, value)
+        for day, metrics in values.items()
+        if start.isoformat() <= day <= end.isoformat()
+        for metric, value in metrics.items()
+    ]
+    if rows:
+        execute_values(
+            cursor,
+            # Another instance syncing the same days may have stored them in the meantime
+            f"""INSERT INTO {SCHEMA}.analytics_daily (counter_id, day, metric, value) VALUES %s
+            ON CONFLICT (counter_id, day, metric) DO UPDATE SET value = EXCLUDED.value""",
+            rows,
+            page_size=1000
+        )
+    execute_values(
+        cursor,
+        f"""INSERT INTO {SCHEMA}.analytics_rollup_days (counter_id, day) VALUES %s
+        ON CONFLICT (counter_id, day) DO UPDATE SET fetched_at = CURRENT_TIMESTAMP""",
+        [(counter_id, start + timedelta(days=offset)) for offset in range((end - start).days + 1)],
+        page_size=1000
+    )
+    return len(rows)
+
+def sync(conn, counter_id: str, date1: date, date2: date, refresh_after_seconds: Optional[float],
+         fetch_days: Callable[[str, str], Dict[str, Dict[str, float]]]) -> Dict[str, Any]:
+    '''Fetch only the days the store lacks (or that may still change), committing run by run'''
+    cursor = conn.cursor()
+    missing = days_to_fetch(cursor, counter_id, date1, date2, refresh_after_seconds)
+    ranges = contiguous_ranges(missing)
+    rows = 0
+    for start, end in ranges:
+        values = fetch_days(start.isoformat(), end.isoformat())
+        rows += store_range(cursor, counter_id, start, end, values)
+        conn.commit()
+    cursor.close()
+    return {'days_fetched': len(missing), 'upstream_ranges': len(ranges), 'rows_stored': rows}
+
+def aggregate(cursor, counter_id: str, date1: date, date2: date, granularity: str) -> List[Dict[str, Any]]:
+    '''One range scan of the primary key: per bucket visits, users, pageviews and goal reaches'''
+    cursor.execute(
+        f"""SELECT {BUCKET_EXPRESSIONS[granularity]} AS bucket, metric, SUM(value) AS value
+        FROM {SCHEMA}.analytics_daily
+        WHERE counter_id = %(counter_id)s AND day BETWEEN %(date1)s AND %(date2)s
+        GROUP BY 1, 2
+        ORDER BY 1""",
+        {'counter_id': counter_id, 'date1': date1, 'date2': date2}
+    )
+    buckets: Dict[date, Dict[str, Any]] = {}
+    for bucket, metric, value in cursor.fetchall():
+        entry = buckets.setdefault(bucket, {'start': bucket.isoformat(), 'visits': 0, 'users': 0, 'pageviews': 0, 'goals': {}})
+        if metric.startswith('goal:'):
+            entry['goals'][metric[len('goal:'):]] = value
+        else:
+            entry[metric] = value
+    return list(buckets.values())
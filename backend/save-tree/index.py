@@ -1,154 +1,334 @@
 '''
 Business: Save family tree to database
 Args: event - dict with httpMethod, body (tree_id, user_email, nodes, edges, title)
+      or body (tree_id, user_email, patch) for incremental saves
       context - object with request_id
 Returns: HTTP response with saved tree_id
 '''
+import base64
 import json
 import os
-from typing import Dict, Any, List
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import zlib
+from typing import Dict, Any, List, Tuple
+from psycopg2.extras import RealDictCursor, execute_values
+from db import discard_connection, get_connection, release_connection
+
+SCHEMA = '"t_p57451291_family_tree_builder_"'
+
+PERSON_COLUMNS = (
+    'first_name, last_name, middle_name, maiden_name, gender, birth_date, birth_place, '
+    'death_date, death_place, is_alive, occupation, bio, history_context, position_x, position_y'
+)
+
+# Rows per multi-row VALUES statement in bulk writes
+BULK_PAGE_SIZE = 1000
+
+# Upper bound for a decompressed request body, guards against gzip bombs
+MAX_BODY_BYTES = int(os.environ.get('MAX_BODY_BYTES', str(64 * 1024 * 1024)))
+
+def read_body(event: Dict[str, Any]) -> str:
+    '''Request body as text, decoding base64 and Content-Encoding: gzip when present'''
+    body = event.get('body') or '{}'
+    headers = event.get('headers', {}) or {}
+    content_encoding = (headers.get('Content-Encoding') or headers.get('content-encoding') or '').lower()
+    if not event.get('isBase64Encoded') and content_encoding != 'gzip':
+        return body
+
+    raw = base64.b64decode(body) if event.get('isBase64Encoded') else body.encode('latin-1')
+    if content_encoding == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        raw = decompressor.decompress(raw, MAX_BODY_BYTES)
+        if decompressor.unconsumed_tail:
+            raise ValueError('Request body is too large')
+    return raw.decode('utf-8')
+
+def person_values(node: Dict) -> Tuple:
+    '''Column values of a persons row for a frontend node, in PERSON_COLUMNS order'''
+    return (
+        node.get('firstName'), node.get('lastName'),
+        node.get('middleName'), node.get('maidenName'), node.get('gender'),
+        node.get('birthDate'), node.get('birthPlace'), node.get('deathDate'),
+        node.get('deathPlace'), node.get('isAlive', True), node.get('occupation'),
+        node.get('bio'), node.get('historyContext'), node.get('x', 0), node.get('y', 0)
+    )
+
+def edge_type(edge: Dict) -> str:
+    return 'spouse' if edge.get('type') == 'spouse' else 'parent'
+
+def insert_persons(cursor, tree_id: int, nodes: List[Dict], upsert: bool = False) -> Tuple[Dict[str, int], int]:
+    '''Write persons with multi-row INSERTs, returns client id -> db id and how many rows were new'''
+    if not nodes:
+        return {}, 0
+    # A statement may not touch the same (tree_id, client_id) twice, the last copy wins
+    unique_nodes = {str(node['id']): node for node in nodes}
+    conflict_clause = ''
+    if upsert:
+        conflict_clause = """ON CONFLICT (tree_id, client_id) DO UPDATE SET
+            first_name = EXCLUDED.first_name, last_name = EXCLUDED.last_name,
+            middle_name = EXCLUDED.middle_name, maiden_name = EXCLUDED.maiden_name,
+            gender = EXCLUDED.gender, birth_date = EXCLUDED.birth_date,
+            birth_place = EXCLUDED.birth_place, death_date = EXCLUDED.death_date,
+            death_place = EXCLUDED.death_place, is_alive = EXCLUDED.is_alive,
+            occupation = EXCLUDED.occupation, bio = EXCLUDED.bio,
+            history_context = EXCLUDED.history_context,
+            position_x = EXCLUDED.position_x, position_y = EXCLUDED.position_y,
+            updated_at = CURRENT_TIMESTAMP"""
+    rows = execute_values(
+        cursor,
+        f"""INSERT INTO {SCHEMA}.persons (tree_id, client_id, {PERSON_COLUMNS})
+        VALUES %s {conflict_clause}
+        RETURNING id, client_id, (xmax = 0) AS inserted""",
+        [(tree_id, client_id) + person_values(node) for client_id, node in unique_nodes.items()],
+        page_size=BULK_PAGE_SIZE,
+        fetch=True
+    )
+    return {row['client_id']: row['id'] for row in rows}, sum(1 for row in rows if row['inserted'])
+
+def insert_relationships(cursor, tree_id: int, edges: List[Dict], node_id_map: Dict[str, int]) -> int:
+    '''Write relationships with multi-row INSERTs, skipping edges with unknown endpoints; returns rows inserted'''
+    rows = []
+    for edge in edges:
+        source_db_id = node_id_map.get(str(edge['source']))
+        target_db_id = node_id_map.get(str(edge['target']))
+        if source_db_id and target_db_id:
+            rows.append((tree_id, source_db_id, target_db_id, edge_type(edge)))
+    if not rows:
+        return 0
+    inserted = execute_values(
+        cursor,
+        f"""INSERT INTO {SCHEMA}.relationships
+        (tree_id, source_person_id, target_person_id, relationship_type)
+        VALUES %s
+        ON CONFLICT (source_person_id, target_person_id, relationship_type) DO NOTHING
+        RETURNING id""",
+        rows,
+        page_size=BULK_PAGE_SIZE,
+        fetch=True
+    )
+    return len(inserted)
+
+def save_full(cursor, tree_id: int, nodes: List[Dict], edges: List[Dict]) -> Tuple[int, int]:
+    '''Replace all persons and relationships of the tree, returns the new persons and relationships counts'''
+    cursor.execute(
+        f"DELETE FROM {SCHEMA}.relationships WHERE tree_id = %s",
+        (tree_id,)
+    )
+    cursor.execute(
+        f"DELETE FROM {SCHEMA}.persons WHERE tree_id = %s",
+        (tree_id,)
+    )
+
+    node_id_map, persons_count = insert_persons(cursor, tree_id, nodes)
+    relationships_count = insert_relationships(cursor, tree_id, edges, node_id_map)
+    return persons_count, relationships_count
+
+def apply_patch(cursor, tree_id: int, patch: Dict) -> Tuple[Dict[str, int], int, int]:
+    '''Apply added/changed/removed nodes and edges, keyed by client person ids.
+    Returns the response counts and the change in persons and relationships rows'''
+    upsert_nodes: List[Dict] = patch.get('upsert_nodes', [])
+    delete_nodes: List[str] = [str(node_id) for node_id in patch.get('delete_nodes', [])]
+    upsert_edges: List[Dict] = patch.get('upsert_edges', [])
+    delete_edges: List[Dict] = patch.get('delete_edges', [])
+    persons_delta = 0
+    relationships_delta = 0
+
+    if delete_edges:
+        deleted = execute_values(
+            cursor,
+            f"""DELETE FROM {SCHEMA}.relationships r
+            USING {SCHEMA}.persons s, {SCHEMA}.persons t,
+            (VALUES %s) AS d (source_client_id, target_client_id, relationship_type)
+            WHERE r.tree_id = {int(tree_id)} AND r.relationship_type = d.relationship_type
+            AND s.id = r.source_person_id AND s.tree_id = r.tree_id AND s.client_id = d.source_client_id
+            AND t.id = r.target_person_id AND t.tree_id = r.tree_id AND t.client_id = d.target_client_id
+            RETURNING r.id""",
+            [(str(edge['source']), str(edge['target']), edge_type(edge)) for edge in delete_edges],
+            page_size=BULK_PAGE_SIZE,
+            fetch=True
+        )
+        relationships_delta -= len(deleted)
+
+    if delete_nodes:
+        cursor.execute(
+            f"""DELETE FROM {SCHEMA}.relationships
+            WHERE tree_id = %s AND (
+                source_person_id IN (SELECT id FROM {SCHEMA}.persons WHERE tree_id = %s AND client_id = ANY(%s))
+                OR target_person_id IN (SELECT id FROM {SCHEMA}.persons WHERE tree_id = %s AND client_id = ANY(%s))
+            )""",
+            (tree_id, tree_id, delete_nodes, tree_id, delete_nodes)
+        )
+        relationships_delta -= cursor.rowcount
+        cursor.execute(
+            f"DELETE FROM {SCHEMA}.persons WHERE tree_id = %s AND client_id = ANY(%s)",
+            (tree_id, delete_nodes)
+        )
+        persons_delta -= cursor.rowcount
+
+    node_id_map, inserted_persons = insert_persons(cursor, tree_id, upsert_nodes, upsert=True)
+    persons_delta += inserted_persons
+
+    if upsert_edges:
+        missing_ids = list({
+            str(edge[key]) for edge in upsert_edges for key in ('source', 'target')
+        } - node_id_map.keys())
+        if missing_ids:
+            cursor.execute(
+                f"SELECT id, client_id FROM {SCHEMA}.persons WHERE tree_id = %s AND client_id = ANY(%s)",
+                (tree_id, missing_ids)
+            )
+            node_id_map.update({row['client_id']: row['id'] for row in cursor.fetchall()})
+        relationships_delta += insert_relationships(cursor, tree_id, upsert_edges, node_id_map)
+
+    counts = {
+        'upserted_nodes': len(upsert_nodes),
+        'deleted_nodes': len(delete_nodes),
+        'upserted_edges': len(upsert_edges),
+        'deleted_edges': len(delete_edges)
+    }
+    return counts, persons_delta, relationships_delta
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
-    
+
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Email',
+                'Access-Control-Allow-Headers': 'Content-Type, Content-Encoding, X-User-Email',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
-    
+
     if method != 'POST':
         return {
             'statusCode': 405,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'body': json.dumps({'error': 'Method not allowed'})
         }
-    
-    body_data = json.loads(event.get('body', '{}'))
+
+    try:
+        body_data = json.loads(read_body(event))
+    except (ValueError, zlib.error) as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f'Invalid request body: {e}'})
+        }
     user_email = body_data.get('user_email') or event.get('headers', {}).get('X-User-Email')
-    
+
     if not user_email:
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'body': json.dumps({'error': 'user_email is required'})
         }
-    
+
     tree_id = body_data.get('tree_id')
+    patch = body_data.get('patch')
     nodes: List[Dict] = body_data.get('nodes', [])
     edges: List[Dict] = body_data.get('edges', [])
     title: str = body_data.get('title', 'Моё семейное древо')
     description: str = body_data.get('description', '')
-    
+
+    if patch is not None and not tree_id:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'tree_id is required for patch saves'})
+        }
+
     database_url = os.environ.get('DATABASE_URL')
-    
-    conn = psycopg2.connect(database_url)
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
-    cursor.execute(
-        "INSERT INTO \"t_p57451291_family_tree_builder_\".users (email) VALUES (%s) ON CONFLICT (email) DO UPDATE SET updated_at = CURRENT_TIMESTAMP RETURNING id",
-        (user_email,)
-    )
-    user_result = cursor.fetchone()
-    user_id = user_result['id']
-    
-    if tree_id:
-        cursor.execute(
-            "UPDATE \"t_p57451291_family_tree_builder_\".family_trees SET title = %s, description = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s AND user_id = %s RETURNING id",
-            (title, description, tree_id, user_id)
-        )
-        result = cursor.fetchone()
-        if result:
-            saved_tree_id = result['id']
-        else:
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Tree not found or access denied'})
-            }
-    else:
+
+    conn = get_connection(database_url)
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+
         cursor.execute(
-            "INSERT INTO \"t_p57451291_family_tree_builder_\".family_trees (user_id, title, description) VALUES (%s, %s, %s) RETURNING id",
-            (user_id, title, description)
+            f"INSERT INTO {SCHEMA}.users (email) VALUES (%s) ON CONFLICT (email) DO UPDATE SET updated_at = CURRENT_TIMESTAMP RETURNING id",
+            (user_email,)
         )
-        result = cursor.fetchone()
-        saved_tree_id = result['id']
-    
-    cursor.execute(
-        "DELETE FROM \"t_p57451291_family_tree_builder_\".persons WHERE tree_id = %s",
-        (saved_tree_id,)
-    )
-    
-    for node in nodes:
-        cursor.execute(
-            """INSERT INTO "t_p57451291_family_tree_builder_".persons 
-            (tree_id, first_name, last_name, middle_name, maiden_name, gender, birth_date, birth_place, 
-            death_date, death_place, is_alive, occupation, bio, history_context, position_x, position_y)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-            (
-                saved_tree_id, node.get('firstName'), node.get('lastName'), 
-                node.get('middleName'), node.get('maidenName'), node.get('gender'),
-                node.get('birthDate'), node.get('birthPlace'), node.get('deathDate'),
-                node.get('deathPlace'), node.get('isAlive', True), node.get('occupation'),
-                node.get('bio'), node.get('historyContext'), node.get('x', 0), node.get('y', 0)
+        user_result = cursor.fetchone()
+        user_id = user_result['id']
+
+        if tree_id:
+            cursor.execute(
+                f"UPDATE {SCHEMA}.family_trees SET title = %s, description = %s, version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = %s AND user_id = %s RETURNING id, version",
+                (title, description, tree_id, user_id)
             )
-        )
-    
-    cursor.execute(
-        "DELETE FROM \"t_p57451291_family_tree_builder_\".relationships WHERE tree_id = %s",
-        (saved_tree_id,)
-    )
-    
-    cursor.execute(
-        "SELECT id, first_name, last_name FROM \"t_p57451291_family_tree_builder_\".persons WHERE tree_id = %s",
-        (saved_tree_id,)
-    )
-    saved_persons = cursor.fetchall()
-    
-    node_id_map = {}
-    for i, node in enumerate(nodes):
-        if i < len(saved_persons):
-            node_id_map[node['id']] = saved_persons[i]['id']
-    
-    for edge in edges:
-        source_db_id = node_id_map.get(edge['source'])
-        target_db_id = node_id_map.get(edge['target'])
-        
-        if source_db_id and target_db_id:
-            rel_type = edge.get('type', 'parent')
-            if rel_type == 'spouse':
-                rel_type_str = 'spouse'
+            result = cursor.fetchone()
+            if result:
+                saved_tree_id = result['id']
+                saved_version = result['version']
             else:
-                rel_type_str = 'parent'
-            
+                conn.rollback()
+                cursor.close()
+                return {
+                    'statusCode': 404,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Tree not found or access denied'})
+                }
+        else:
             cursor.execute(
-                """INSERT INTO "t_p57451291_family_tree_builder_".relationships 
-                (tree_id, source_person_id, target_person_id, relationship_type)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (source_person_id, target_person_id, relationship_type) DO NOTHING""",
-                (saved_tree_id, source_db_id, target_db_id, rel_type_str)
+                f"INSERT INTO {SCHEMA}.family_trees (user_id, title, description) VALUES (%s, %s, %s) RETURNING id, version",
+                (user_id, title, description)
             )
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
-    
-    return {
-        'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'isBase64Encoded': False,
-        'body': json.dumps({
+            result = cursor.fetchone()
+            saved_tree_id = result['id']
+            saved_version = result['version']
+
+        if tree_id:
+            # The serialized load-tree snapshot of the previous version is no longer valid
+            cursor.execute(
+                f"DELETE FROM {SCHEMA}.tree_snapshots WHERE tree_id = %s",
+                (saved_tree_id,)
+            )
+
+        # list-trees reads these counters instead of counting rows per tree
+        if patch is not None:
+            patch_counts, persons_delta, relationships_delta = apply_patch(cursor, saved_tree_id, patch)
+            cursor.execute(
+                f"""UPDATE {SCHEMA}.family_trees
+                SET persons_count = persons_count + %s, relationships_count = relationships_count + %s
+                WHERE id = %s""",
+                (persons_delta, relationships_delta, saved_tree_id)
+            )
+        else:
+            persons_count, relationships_count = save_full(cursor, saved_tree_id, nodes, edges)
+            cursor.execute(
+                f"UPDATE {SCHEMA}.family_trees SET persons_count = %s, relationships_count = %s WHERE id = %s",
+                (persons_count, relationships_count, saved_tree_id)
+            )
+
+        conn.commit()
+        cursor.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
+
+    if patch is not None:
+        response_body = {
+            'tree_id': saved_tree_id,
+            'version': saved_version,
+            'message': 'Tree patched successfully',
+            **patch_counts
+        }
+    else:
+        response_body = {
             'tree_id': saved_tree_id,
+            'version': saved_version,
             'message': 'Tree saved successfully',
             'nodes_count': len(nodes),
             'edges_count': len(edges)
-        })
+        }
+
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'isBase64Encoded': False,
+        'body': json.dumps(response_body)
     }
@@ -0,0 +1,161 @@
+'''
+Business: Search persons by name, place or occupation across all family trees of a user
+Args: event - dict with httpMethod, queryStringParameters (q, user_email, tree_id to search one tree, limit, cursor)
+      context - object with request_id
+Returns: HTTP response with a ranked page of matching persons and next_cursor for the following page
+'''
+import base64
+import binascii
+import json
+import os
+from typing import Dict, Any, Optional, Tuple
+from psycopg2.extras import RealDictCursor
+from db import discard_connection, get_connection, release_connection
+from search import SCHEMA, search_sql, tsquery, variants, words
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+MIN_QUERY_CHARS = 2
+# Matches taken from each index before ranking; bounds the work for very common names
+SEARCH_CANDIDATES = int(os.environ.get('SEARCH_CANDIDATES', '1000'))
+# pg_trgm word_similarity cut-off for typo matches (0..1, higher is stricter)
+TRIGRAM_THRESHOLD = os.environ.get('SEARCH_TRIGRAM_THRESHOLD', '0.5')
+
+def encode_cursor(score: float, person_id: int) -> str:
+    '''Opaque page token for the match a page ends with'''
+    raw = json.dumps([score, person_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor_param: str) -> Tuple[float, int]:
+    '''Inverse of encode_cursor, raises ValueError for tokens it did not produce'''
+    try:
+        raw = base64.urlsafe_b64decode(cursor_param + '=' * (-len(cursor_param) % 4))
+        score, person_id = json.loads(raw)
+        return float(score), int(person_id)
+    except (binascii.Error, TypeError, UnicodeDecodeError) as e:
+        raise ValueError(str(e))
+
+def parse_limit(limit_param: Optional[str]) -> int:
+    '''Page size from the query string, capped at MAX_PAGE_SIZE'''
+    if limit_param is None:
+        return DEFAULT_PAGE_SIZE
+    limit = int(limit_param)
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, MAX_PAGE_SIZE)
+
+def error(status: int, message: str) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'error': message})
+    }
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Email',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+
+    if method != 'GET':
+        return error(405, 'Method not allowed')
+
+    params = event.get('queryStringParameters', {}) or {}
+    user_email = params.get('user_email') or (event.get('headers', {}) or {}).get('X-User-Email')
+    text = params.get('q') or ''
+    tree_id = params.get('tree_id')
+
+    if not user_email:
+        return error(400, 'user_email is required')
+    if len(''.join(words(text))) < MIN_QUERY_CHARS:
+        return error(400, f'q must contain at least {MIN_QUERY_CHARS} letters or digits')
+    if tree_id is not None and not tree_id.isdigit():
+        return error(400, 'tree_id must be a number')
+    try:
+        limit = parse_limit(params.get('limit'))
+        after_score, after_id = decode_cursor(params['cursor']) if params.get('cursor') else (None, None)
+    except ValueError:
+        return error(400, 'limit must be a positive integer and cursor a next_cursor value')
+
+    database_url = os.environ.get('DATABASE_URL')
+    conn = get_connection(database_url)
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+        cursor.execute(
+            f"""SELECT ft.id, ft.title FROM {SCHEMA}.family_trees ft
+            WHERE ft.user_id IN (SELECT id FROM {SCHEMA}.users WHERE email = %s)
+            AND (%s::integer IS NULL OR ft.id = %s::integer)""",
+            (user_email, tree_id, tree_id)
+        )
+        tree_titles = {row['id']: row['title'] for row in cursor.fetchall()}
+
+        rows = []
+        if tree_titles:
+            query_variants = variants(text)
+            # pg_trgm may live in the app schema or in public, depending on where it was installed
+            cursor.execute(
+                "SELECT set_config('search_path', %s, true), set_config('pg_trgm.word_similarity_threshold', %s, true)",
+                (f'{SCHEMA}, public', TRIGRAM_THRESHOLD)
+            )
+            # One extra row tells whether another page exists
+            cursor.execute(search_sql(len(query_variants)), {
+                'tsquery': tsquery(query_variants),
+                **{f'v{i}': variant for i, variant in enumerate(query_variants)},
+                'tree_ids': list(tree_titles),
+                'candidates': SEARCH_CANDIDATES,
+                'after_score': after_score,
+                'after_id': after_id,
+                'limit': limit + 1
+            })
+            rows = cursor.fetchall()
+
+        conn.rollback()
+        cursor.close()
+    except Exception:
+        discard_connection(conn)
+        raise
+    finally:
+        release_connection(conn)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['score'], rows[-1]['id'])
+
+    results = [{
+        'id': row['node_id'],
+        'tree_id': row['tree_id'],
+        'tree_title': tree_titles[row['tree_id']],
+        'firstName': row['first_name'] or '',
+        'lastName': row['last_name'] or '',
+        'middleName': row['middle_name'] or '',
+        'maidenName': row['maiden_name'] or '',
+        'gender': row['gender'] or 'male',
+        'birthDate': row['birth_date'] or '',
+        'birthPlace': row['birth_place'] or '',
+        'deathDate': row['death_date'] or '',
+        'deathPlace': row['death_place'] or '',
+        'occupation': row['occupation'] or '',
+        'score': round(row['score'], 4)
+    } for row in rows]
+
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'isBase64Encoded': False,
+        'body': json.dumps({
+            'results': results,
+            'count': len(results),
+            'next_cursor': next_cursor
+        }, ensure_ascii=False)
+    }
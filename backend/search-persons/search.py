@@ -0,0 +1,81 @@
+'''
+Business: Person search query building: words, Cyrillic/Latin transliteration variants, tsquery text and ranked SQL
+Args: text - the user's search string
+Returns: query variants, to_tsquery input and the SQL for one ranked page of matches
+'''
+import re
+from typing import List
+
+SCHEMA = '"t_p57451291_family_tree_builder_"'
+
+MAX_WORDS = 6
+MAX_WORD_CHARS = 40
+
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '',
+    'э': 'e', 'ю': 'yu', 'я': 'ya'
+}
+# Longest spellings first, so "shch" is read as one letter and not as "sh" + "ch"
+LATIN_TO_CYRILLIC = [
+    ('shch', 'щ'), ('sch', 'щ'), ('zh', 'ж'), ('kh', 'х'), ('ts', 'ц'), ('ch', 'ч'), ('sh', 'ш'),
+    ('yu', 'ю'), ('ya', 'я'), ('yo', 'ё'), ('ju', 'ю'), ('ja', 'я'),
+    ('a', 'а'), ('b', 'б'), ('v', 'в'), ('w', 'в'), ('g', 'г'), ('d', 'д'), ('e', 'е'), ('z', 'з'),
+    ('i', 'и'), ('j', 'й'), ('k', 'к'), ('c', 'к'), ('q', 'к'), ('l', 'л'), ('m', 'м'), ('n', 'н'),
+    ('o', 'о'), ('p', 'п'), ('r', 'р'), ('s', 'с'), ('t', 'т'), ('u', 'у'), ('f', 'ф'), ('h', 'х'),
+    ('x', 'кс'), ('y', 'ы')
+]
+LATIN_PATTERN = re.compile('|'.join(latin for latin, _ in LATIN_TO_CYRILLIC))
+LATIN_LETTERS = dict(LATIN_TO_CYRILLIC)
+
+def words(text: str) -> List[str]:
+    '''Lower-case words of the query (letters and digits only), at most MAX_WORDS of them'''
+    return [word[:MAX_WORD_CHARS] for word in re.findall(r'[^\W_]+', text.lower())][:MAX_WORDS]
+
+def to_latin(text: str) -> str:
+    return ''.join(CYRILLIC_TO_LATIN.get(char, char) for char in text)
+
+def to_cyrillic(text: str) -> str:
+    result = LATIN_PATTERN.sub(lambda match: LATIN_LETTERS[match.group(0)], text)
+    # "y" after a vowel is й, not ы: "Andrey" -> "Андрей"
+    return re.sub(r'(?<=[аеёиоуыэюя])ы', 'й', result)
+
+def variants(text: str) -> List[str]:
+    '''The query as typed plus its transliteration into the other alphabet, duplicates removed'''
+    typed = ' '.join(words(text))
+    result = []
+    for variant in (typed, to_latin(typed), to_cyrillic(typed)):
+        if variant and variant not in result:
+            result.append(variant)
+    return result
+
+def tsquery(query_variants: List[str]) -> str:
+    '''to_tsquery input: every word as a prefix, words ANDed, variants ORed'''
+    groups = [' & '.join(f'{word}:*' for word in variant.split()) for variant in query_variants]
+    return ' | '.join(f'({group})' for group in groups if group)
+
+def search_sql(variant_count: int) -> str:
+    '''Full-text and trigram candidates (each capped at %(candidates)s), ranked and cut to one keyset page'''
+    similar = ' OR '.join(f'%(v{i})s <%% p.search_name' for i in range(variant_count))
+    similarity = ', '.join(f'word_similarity(%(v{i})s, p.search_name)' for i in range(variant_count))
+    return f"""WITH query AS (
+    SELECT to_tsquery('russian', %(tsquery)s) AS q
+), matches AS (
+    (SELECT p.id FROM {SCHEMA}.persons p, query
+    WHERE p.tree_id = ANY(%(tree_ids)s) AND p.search_vector @@ query.q
+    LIMIT %(candidates)s)
+    UNION
+    (SELECT p.id FROM {SCHEMA}.persons p
+    WHERE p.tree_id = ANY(%(tree_ids)s) AND ({similar})
+    LIMIT %(candidates)s)
+), ranked AS (
+    SELECT p.*, (ts_rank(p.search_vector, query.q) + GREATEST({similarity}))::real AS score
+    FROM matches m JOIN {SCHEMA}.persons p ON p.id = m.id, query
+)
+SELECT id, COALESCE(client_id, id::text) AS node_id, tree_id, first_name, last_name, middle_name, maiden_name,
+    gender, birth_date, birth_place, death_date, death_place, occupation, score
+FROM ranked
+WHERE %(after_id)s::integer IS NULL OR score < %(after_score)s::real OR (score = %(after_score)s::real AND id > %(after_id)s::integer)
+ORDER BY score DESC, id
+LIMIT %(limit)s"""
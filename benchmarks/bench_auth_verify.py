@@ -0,0 +1,80 @@
+'''
+Business: auth verify throughput with the session cache cold (every call hits Postgres) and warm
+Args: --requests - verify calls per mode, --users - distinct sessions cycled through,
+      --token-format - opaque (auth_sessions lookup) or signed (HMAC tokens), --output - results file
+Returns: prints a table with cache stats and writes benchmarks/results/auth_verify.json
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, Any, List
+
+import common
+
+def register_sessions(auth, users: int) -> List[str]:
+    tokens = []
+    for index in range(users):
+        event = {
+            'httpMethod': 'POST',
+            'queryStringParameters': {'action': 'register'},
+            'body': json.dumps({'email': f'verify{index}@example.com', 'password': 'password123'})
+        }
+        tokens.append(json.loads(common.call(auth, event, 'auth')['body'])['session_token'])
+    return tokens
+
+def run(requests: int, users: int, token_format: str) -> List[Dict[str, Any]]:
+    common.prepare_database()
+    if token_format == 'signed':
+        os.environ['SESSION_TOKEN_FORMAT'] = 'signed'
+        os.environ.setdefault('SESSION_SIGNING_KEYS', 'bench:bench-secret')
+    auth = common.load_handler('auth')
+    cache = sys.modules[auth.get_verified.__module__]
+    tokens = register_sessions(auth, users)
+    # Random tokens nobody issued, answered by the negative cache when warm
+    unknown = [f'unknown-{index}' for index in range(users)]
+
+    results = []
+    for mode in ('cold', 'warm', 'unknown-cold', 'unknown-warm'):
+        cache.session_cache = cache.SessionCache(cache.MAX_ENTRIES)
+        session_tokens = unknown if mode.startswith('unknown') else tokens
+        timings = []
+        started = time.perf_counter()
+        for index in range(requests):
+            if mode.endswith('cold'):
+                cache.session_cache.clear()
+            event = {
+                'httpMethod': 'GET',
+                'queryStringParameters': {'action': 'verify'},
+                'headers': {'X-Session-Token': session_tokens[index % len(session_tokens)]}
+            }
+            _, elapsed = common.timed(common.call, auth, event, 'auth')
+            timings.append(elapsed)
+        total_seconds = time.perf_counter() - started
+        stats = cache.cache_stats()
+        results.append({
+            'operation': 'auth-verify',
+            'cache': mode,
+            'tokens': token_format,
+            'sessions': users,
+            **common.percentiles(timings),
+            'requests_per_second': round(requests / total_seconds, 1),
+            **{key: stats[key] for key in ('hits', 'negative_hits', 'misses', 'hit_rate')}
+        })
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--token-format', choices=['opaque', 'signed'], default='opaque')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.requests, args.users, args.token_format)
+    common.print_table(results, ['tokens', 'cache', 'p50_ms', 'p95_ms', 'requests_per_second', 'hits', 'negative_hits', 'misses', 'hit_rate'])
+    print(f"Results written to {common.write_results('auth_verify', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+'''
+Business: load-tree response size, compression ratio and CPU per request for identity, gzip and br
+Args: --sizes - tree sizes in persons, --bio-chars - length of bio texts, --repeat - loads per encoding
+Returns: prints a table and writes benchmarks/results/compression.json
+'''
+import argparse
+import base64
+import json
+import time
+from typing import Dict, Any, List
+
+import common
+import treegen
+
+def run(sizes: List[int], bio_chars: int, repeat: int) -> List[Dict[str, Any]]:
+    common.prepare_database()
+    save_tree = common.load_handler('save-tree')
+    load_tree = common.load_handler('load-tree')
+    encodings = ['identity', 'gzip'] + (['br'] if load_tree.brotli is not None else [])
+    if load_tree.brotli is None:
+        print('brotli is not installed, br is skipped')
+    results = []
+    for size in sizes:
+        tree = treegen.generate_tree(size, bio_chars=bio_chars)
+        response = common.call(save_tree, {'httpMethod': 'POST', 'body': json.dumps({'user_email': 'gzip@example.com', **tree})}, 'save-tree')
+        tree_id = json.loads(response['body'])['tree_id']
+
+        identity_bytes = None
+        for encoding in encodings:
+            event = {
+                'httpMethod': 'GET',
+                'queryStringParameters': {'tree_id': str(tree_id)},
+                'headers': {'Accept-Encoding': encoding}
+            }
+            # First call warms the snapshot cache so the timings isolate compression
+            common.call(load_tree, event, 'load-tree')
+            timings, cpu_timings = [], []
+            for _ in range(repeat):
+                cpu_started = time.process_time()
+                response, elapsed = common.timed(common.call, load_tree, event, 'load-tree')
+                cpu_timings.append((time.process_time() - cpu_started) * 1000)
+                timings.append(elapsed)
+
+            if response.get('isBase64Encoded'):
+                wire_bytes = len(base64.b64decode(response['body']))
+            else:
+                wire_bytes = len(response['body'].encode())
+            identity_bytes = identity_bytes or wire_bytes
+            results.append({
+                'operation': 'load-tree',
+                'mode': encoding,
+                'persons': size,
+                **common.percentiles(timings),
+                'cpu_p50_ms': common.percentiles(cpu_timings)['p50_ms'],
+                'response_bytes': wire_bytes,
+                'function_body_bytes': len(response['body']),
+                'compression_ratio': round(identity_bytes / wire_bytes, 2)
+            })
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--bio-chars', type=int, default=1500)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.bio_chars, args.repeat)
+    common.print_table(results, ['persons', 'mode', 'p50_ms', 'cpu_p50_ms', 'response_bytes', 'function_body_bytes', 'compression_ratio'])
+    print(f"Results written to {common.write_results('compression', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
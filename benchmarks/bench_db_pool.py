@@ -0,0 +1,51 @@
+'''
+Business: Latency of small requests with a fresh connection per call versus warm pooled connections
+Args: --requests - calls per function, --output - results file
+Returns: prints a table and writes benchmarks/results/db_pool.json
+'''
+import argparse
+import json
+import sys
+from typing import Dict, Any, List
+
+import common
+import treegen
+
+def run(requests: int) -> List[Dict[str, Any]]:
+    common.prepare_database()
+    save_tree = common.load_handler('save-tree')
+    tree = treegen.generate_tree(50)
+    response = common.call(save_tree, {'httpMethod': 'POST', 'body': json.dumps({'user_email': 'pool@example.com', **tree})}, 'save-tree')
+    tree_id = json.loads(response['body'])['tree_id']
+
+    events = {
+        'list-trees': {'httpMethod': 'GET', 'queryStringParameters': {'user_email': 'pool@example.com'}},
+        'load-tree': {'httpMethod': 'GET', 'queryStringParameters': {'tree_id': str(tree_id)}}
+    }
+    results = []
+    for function_name, event in events.items():
+        for pooled in (False, True):
+            module = common.load_handler(function_name)
+            db = sys.modules[module.get_connection.__module__]
+            db.POOL_SIZE = 2 if pooled else 0
+            samples = [common.timed(common.call, module, event, function_name)[1] for _ in range(requests)]
+            results.append({
+                'function': function_name,
+                'pooled': pooled,
+                **common.percentiles(samples),
+                **db.pool_stats()
+            })
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.requests)
+    common.print_table(results, ['function', 'pooled', 'p50_ms', 'p95_ms', 'p99_ms', 'hits', 'misses', 'reconnects'])
+    print(f"Results written to {common.write_results('db_pool', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+'''
+Business: find-duplicates on 10k-100k person trees with injected duplicates (typos, Latin spellings, maiden/married
+          surname swaps, shifted or missing birth dates): detection time, pairs scored vs all pairs, precision and
+          recall, and the endpoint with the bulk merge of the suggestions
+Args: --sizes - tree sizes in persons, --duplicate-rate - share of persons entered twice,
+      --engine-only - skip Postgres and time blocking and scoring alone
+Returns: prints a table and writes benchmarks/results/duplicates.json
+'''
+import argparse
+import json
+import random
+import sys
+from typing import Dict, Any, List, Set, Tuple
+
+import common
+import treegen
+
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '',
+    'э': 'e', 'ю': 'yu', 'я': 'ya'
+}
+
+def latin(name: str) -> str:
+    return ''.join(CYRILLIC_TO_LATIN.get(char, char) for char in name.lower()).capitalize()
+
+def typo(rng: random.Random, name: str) -> str:
+    if len(name) < 4:
+        return name
+    i = rng.randrange(1, len(name) - 1)
+    return name[:i] + name[i + 1:] if rng.random() < 0.5 else name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+def inject_duplicates(tree: Dict[str, List[Dict[str, Any]]], rate: float, seed: int = 11) -> Set[Tuple[str, str]]:
+    '''Append a noisy copy of rate * persons, attached to one parent of the original; returns the true pairs'''
+    rng = random.Random(seed)
+    parents: Dict[str, str] = {}
+    for edge in tree['edges']:
+        if edge.get('type') != 'spouse':
+            parents.setdefault(edge['target'], edge['source'])
+    originals = rng.sample(tree['nodes'], int(len(tree['nodes']) * rate))
+    next_id = max(int(node['id']) for node in tree['nodes']) + 1
+    truth = set()
+    for original in originals:
+        copy = dict(original, id=str(next_id), bio='')
+        next_id += 1
+        change = rng.choice(['typo', 'latin', 'maiden', 'year', 'sparse'])
+        if change == 'typo':
+            copy['lastName'] = typo(rng, copy['lastName'])
+        elif change == 'latin':
+            copy['firstName'], copy['lastName'] = latin(copy['firstName']), latin(copy['lastName'])
+            copy['middleName'] = latin(copy['middleName'])
+        elif change == 'maiden' and copy['maidenName']:
+            # Entered again under her maiden name only
+            copy['lastName'], copy['maidenName'] = copy['maidenName'], ''
+        elif change == 'year':
+            year = int(copy['birthDate'][:4]) + rng.choice([-1, 1])
+            copy['birthDate'] = str(year)
+        else:
+            copy['middleName'] = copy['birthPlace'] = copy['occupation'] = ''
+            copy['birthDate'] = copy['birthDate'][:4]
+        tree['nodes'].append(copy)
+        if original['id'] in parents:
+            tree['edges'].append({'id': f"e-dup-{copy['id']}", 'source': parents[original['id']], 'target': copy['id']})
+        truth.add(tuple(sorted((original['id'], copy['id']))))
+    return truth
+
+def person_rows(tree: Dict[str, List[Dict[str, Any]]]):
+    '''The rows find-duplicates reads from persons and relationships'''
+    persons = [(int(node['id']), node['id'], node['firstName'], node['lastName'], node['middleName'], node['maidenName'],
+                node['gender'], node['birthDate'], node['birthPlace'], node['deathDate']) for node in tree['nodes']]
+    relationships = [(int(edge['source']), int(edge['target']), edge.get('type', 'parent')) for edge in tree['edges']]
+    return persons, relationships
+
+def quality(suggestions: List[Dict[str, Any]], truth: Set[Tuple[str, str]]) -> Dict[str, Any]:
+    found = {tuple(sorted((suggestion['keep'], suggestion['remove']))) for suggestion in suggestions}
+    hits = len(found & truth)
+    return {
+        'suggestions': len(found),
+        'precision': round(hits / len(found), 3) if found else 0.0,
+        'recall': round(hits / len(truth), 3) if truth else 0.0
+    }
+
+def time_engine(dedupe, tree, truth) -> Dict[str, Any]:
+    persons, relationships = person_rows(tree)
+    people = [dedupe.Person(i, row) for i, row in enumerate(persons)]
+    pairs = len(dedupe.candidate_pairs(people))
+    suggestions, elapsed = common.timed(dedupe.find_duplicates, persons, relationships)
+    return {
+        'mode': 'engine', 'p50_ms': round(elapsed, 1), 'pairs_scored': pairs,
+        'all_pairs': len(persons) * (len(persons) - 1) // 2, **quality(suggestions, truth)
+    }
+
+def time_endpoint(handler_module, save_tree, tree, truth) -> List[Dict[str, Any]]:
+    response = common.call(save_tree, {'httpMethod': 'POST', 'body': json.dumps({'user_email': 'dedupe@example.com', **tree})}, 'save-tree')
+    tree_id = json.loads(response['body'])['tree_id']
+    event = {'httpMethod': 'GET', 'queryStringParameters': {'tree_id': str(tree_id), 'user_email': 'dedupe@example.com', 'limit': '1000'}}
+    results = []
+    for mode in ('endpoint-cold', 'endpoint-warm'):
+        response, elapsed = common.timed(common.call, handler_module, event, 'find-duplicates')
+        payload = json.loads(response['body'])
+        suggestions = [{'keep': s['keep']['id'], 'remove': s['remove']['id']} for s in payload['suggestions']]
+        results.append({'mode': mode, 'p50_ms': round(elapsed, 1), 'total': payload['total'], **quality(suggestions, truth)})
+
+    merges = [{'keep': s['keep'], 'remove': s['remove']} for s in suggestions]
+    response, elapsed = common.timed(common.call, handler_module, {
+        'httpMethod': 'POST', 'body': json.dumps({'tree_id': tree_id, 'user_email': 'dedupe@example.com', 'merges': merges})
+    }, 'find-duplicates')
+    payload = json.loads(response['body'])
+    results.append({
+        'mode': 'merge', 'p50_ms': round(elapsed, 1), 'merged': payload['merged'],
+        'rewritten': payload['relationships_rewritten']
+    })
+    return results
+
+def run(sizes: List[int], rate: float, engine_only: bool) -> List[Dict[str, Any]]:
+    if not engine_only:
+        common.prepare_database()
+        save_tree = common.load_handler('save-tree')
+    handler_module = common.load_handler('find-duplicates')
+    dedupe = sys.modules[handler_module.find_duplicates.__module__]
+    results = []
+    for size in sizes:
+        tree = treegen.generate_tree(size)
+        truth = inject_duplicates(tree, rate)
+        size_results = [time_engine(dedupe, tree, truth)]
+        if not engine_only:
+            size_results += time_endpoint(handler_module, save_tree, tree, truth)
+        results += [{'operation': 'find-duplicates', 'persons': len(tree['nodes']), 'injected': len(truth), **result}
+                    for result in size_results]
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 100000])
+    parser.add_argument('--duplicate-rate', type=float, default=0.02)
+    parser.add_argument('--engine-only', action='store_true')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.duplicate_rate, args.engine_only)
+    common.print_table(results, ['persons', 'mode', 'p50_ms', 'pairs_scored', 'injected', 'suggestions', 'precision', 'recall', 'merged'])
+    print(f"Results written to {common.write_results('duplicates', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
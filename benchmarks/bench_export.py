@@ -0,0 +1,82 @@
+'''
+Business: export-tree on 10k-100k person trees: time and peak RSS of streaming GEDCOM/NDJSON exports (to a file and
+          through the endpoint) against load-tree's fetchall assembly of the same tree
+Args: --sizes - tree sizes in persons, --batch-rows - rows per server-side cursor FETCH
+Returns: prints a table and writes benchmarks/results/export.json
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List
+
+import common
+import treegen
+
+USER_EMAIL = 'export@example.com'
+MODES = ['load-tree', 'gedcom-file', 'ndjson-file', 'gedcom-gzip-file', 'endpoint-gedcom-gzip']
+
+def measure(mode: str, tree_id: int, batch_rows: int) -> Dict[str, Any]:
+    '''Runs in a fresh process so ru_maxrss is the peak of this one export'''
+    os.environ['EXPORT_BATCH_ROWS'] = str(batch_rows)
+    params = {'tree_id': str(tree_id), 'user_email': USER_EMAIL}
+    started = time.perf_counter()
+    if mode == 'load-tree':
+        response = common.call(common.load_handler('load-tree'), {
+            'httpMethod': 'GET', 'queryStringParameters': {**params, 'assembly': 'python'}
+        }, 'load-tree')
+        output_bytes, persons = len(response['body'].encode('utf-8')), len(json.loads(response['body'])['nodes'])
+    elif mode.endswith('-file'):
+        sys.path.insert(0, str(common.BACKEND_DIR / 'export-tree'))
+        import export
+        conn = common.connect()
+        with tempfile.TemporaryFile() as out:
+            counts = export.export_tree(conn, {'id': tree_id, 'title': 'bench'}, mode.split('-')[0], out, compress='gzip' in mode)
+            output_bytes, persons = out.tell(), counts['persons']
+        conn.close()
+    else:
+        response = common.call(common.load_handler('export-tree'), {
+            'httpMethod': 'GET', 'queryStringParameters': {**params, 'format': 'gedcom', 'compress': 'gzip'}
+        }, 'export-tree')
+        output_bytes, persons = len(response['body']) * 3 // 4, int(response['headers']['X-Export-Persons'])
+    return {
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        'output_mb': round(output_bytes / 1024 / 1024, 2),
+        'persons_out': persons,
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+def run(sizes: List[int], batch_rows: int) -> List[Dict[str, Any]]:
+    common.prepare_database()
+    save_tree = common.load_handler('save-tree')
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for size in sizes:
+        tree = treegen.generate_tree(size)
+        response = common.call(save_tree, {'httpMethod': 'POST', 'body': json.dumps({'user_email': USER_EMAIL, **tree})}, 'save-tree')
+        tree_id = json.loads(response['body'])['tree_id']
+        del tree
+        for mode in MODES:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(measure, mode, tree_id, batch_rows).result()
+            results.append({'operation': 'export-tree', 'persons': size, 'mode': mode, **result})
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 100000])
+    parser.add_argument('--batch-rows', type=int, default=2000)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.batch_rows)
+    common.print_table(results, ['persons', 'mode', 'elapsed_ms', 'output_mb', 'persons_out', 'peak_rss_mb'])
+    print(f"Results written to {common.write_results('export', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+'''
+Business: load-tree focus view (recursive ancestors/descendants around one person) on large trees
+Args: --sizes - tree sizes in persons, --generations - radius values to try, --repeat - loads per radius
+Returns: prints a table and writes benchmarks/results/focus.json
+'''
+import argparse
+import json
+from typing import Dict, Any, List
+
+import common
+import treegen
+
+def run(sizes: List[int], generations: List[int], repeat: int) -> List[Dict[str, Any]]:
+    common.prepare_database()
+    save_tree = common.load_handler('save-tree')
+    load_tree = common.load_handler('load-tree')
+    results = []
+    for size in sizes:
+        tree = treegen.generate_tree(size)
+        response = common.call(save_tree, {'httpMethod': 'POST', 'body': json.dumps({'user_email': 'focus@example.com', **tree})}, 'save-tree')
+        tree_id = json.loads(response['body'])['tree_id']
+
+        # Someone from a middle generation has both ancestors and descendants
+        rows = sorted({node['y'] for node in tree['nodes']})
+        middle_row = rows[len(rows) // 2]
+        focus_id = next(node['id'] for node in tree['nodes'] if node['y'] == middle_row)
+
+        for radius in generations:
+            event = {
+                'httpMethod': 'GET',
+                'queryStringParameters': {'tree_id': str(tree_id), 'view': 'focus', 'focus': focus_id, 'up': str(radius), 'down': str(radius)}
+            }
+            timings = []
+            for _ in range(repeat):
+                response, elapsed = common.timed(common.call, load_tree, event, 'load-tree')
+                timings.append(elapsed)
+            payload = json.loads(response['body'])
+            results.append({
+                'operation': 'load-tree',
+                'mode': f'focus-{radius}',
+                'persons': size,
+                **common.percentiles(timings),
+                'nodes_returned': len(payload['nodes']),
+                'frontier': len(payload['frontier']),
+                'response_bytes': len(response['body'].encode())
+            })
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--generations', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.generations, args.repeat)
+    common.print_table(results, ['persons', 'mode', 'p50_ms', 'p95_ms', 'nodes_returned', 'frontier', 'response_bytes'])
+    print(f"Results written to {common.write_results('focus', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+'''
+Business: import-gedcom throughput and memory on synthetic GEDCOM files of 50k-500k individuals:
+          parsing/mapping alone and the endpoint end to end (COPY into staging tables, merge into the tree)
+Args: --sizes - individuals per file, --engine-only - skip Postgres and measure the parser alone
+Returns: prints a table (records per second, peak RSS) and writes benchmarks/results/gedcom_import.json
+'''
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List
+
+import common
+import treegen
+
+MONTHS = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+
+def write_gedcom(path: Path, size: int, seed: int = 7) -> None:
+    '''Stream a multi-generation GEDCOM file to disk; only the current generation's couples are kept in memory'''
+    rng = random.Random(seed)
+    next_person, next_family = 1, 1
+    with open(path, 'w', encoding='utf-8') as out:
+        out.write('0 HEAD\n1 SOUR BENCH\n1 GEDC\n2 VERS 5.5.1\n2 FORM LINEAGE-LINKED\n1 CHAR UTF-8\n')
+
+        def person(sex: str, surname: str, year: int, married_name: str = '') -> str:
+            nonlocal next_person
+            xref = f'I{next_person}'
+            next_person += 1
+            given = rng.choice(treegen.MALE_NAMES if sex == 'M' else treegen.FEMALE_NAMES)
+            patronymic = rng.choice(treegen.MALE_NAMES) + ('ович' if sex == 'M' else 'овна')
+            out.write(f'0 @{xref}@ INDI\n1 NAME {given} {patronymic} /{surname}/\n2 GIVN {given} {patronymic}\n2 SURN {surname}\n')
+            if married_name:
+                out.write(f'1 NAME {given} /{married_name}/\n2 TYPE married\n')
+            out.write(f'1 SEX {sex}\n1 BIRT\n2 DATE {rng.randint(1, 28)} {rng.choice(MONTHS)} {year}\n2 PLAC {rng.choice(treegen.PLACES)}\n')
+            if year < 1940:
+                out.write(f'1 DEAT\n2 DATE {year + rng.randint(40, 90)}\n')
+            out.write(f'1 OCCU {rng.choice(treegen.OCCUPATIONS)}\n1 NOTE Биография {xref}\n2 CONT Записано по воспоминаниям родственников\n')
+            return xref
+
+        couples = []
+        for _ in range(max(1, size // 2000)):
+            surname = rng.choice(treegen.LAST_NAMES)
+            year = 1750 + rng.randint(0, 20)
+            couples.append((person('M', surname, year), person('F', rng.choice(treegen.LAST_NAMES), year, treegen.feminine(surname)), surname, year))
+        while next_person <= size and couples:
+            next_couples = []
+            for husband, wife, surname, year in couples:
+                children = []
+                for _ in range(rng.randint(1, 5)):
+                    if next_person > size:
+                        break
+                    sex = rng.choice('MF')
+                    child_year = year + treegen.GENERATION_YEARS + rng.randint(-4, 10)
+                    children.append(person(sex, surname if sex == 'M' else treegen.feminine(surname), child_year))
+                    if sex == 'M' and next_person <= size and rng.random() < 0.75:
+                        wife_of_child = person('F', rng.choice(treegen.LAST_NAMES), child_year, treegen.feminine(surname))
+                        next_couples.append((children[-1], wife_of_child, surname, child_year))
+                out.write(f'0 @F{next_family}@ FAM\n1 HUSB @{husband}@\n1 WIFE @{wife}@\n')
+                out.writelines(f'1 CHIL @{child}@\n' for child in children)
+                next_family += 1
+            couples = next_couples or couples
+        out.write('0 TRLR\n')
+
+def measure(mode: str, path: str) -> Dict[str, Any]:
+    '''Runs in a fresh process so ru_maxrss is the peak of this one import'''
+    started = time.perf_counter()
+    if mode == 'parse':
+        sys.path.insert(0, str(common.BACKEND_DIR / 'import-gedcom'))
+        import gedcom
+        counts = {'records': 0, 'persons': 0, 'relationships': 0}
+        with open(path, 'rb') as stream:
+            for record in gedcom.records(gedcom.decode_lines(stream)):
+                counts['records'] += 1
+                if record.tag == 'INDI':
+                    gedcom.person_row(record)
+                    counts['persons'] += 1
+                elif record.tag == 'FAM':
+                    counts['relationships'] += len(gedcom.family_edges(record))
+    else:
+        import json
+        importer = common.load_handler('import-gedcom')
+        body = Path(path).read_text(encoding='utf-8')
+        event = {'httpMethod': 'POST', 'queryStringParameters': {'user_email': 'gedcom@example.com'}, 'body': body}
+        del body
+        counts = json.loads(common.call(importer, event, 'import-gedcom')['body'])
+    elapsed = time.perf_counter() - started
+    return {
+        'elapsed_s': round(elapsed, 2),
+        'records_per_s': round(counts['records'] / elapsed),
+        'persons': counts['persons'],
+        'relationships': counts['relationships'],
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+def run(sizes: List[int], engine_only: bool) -> List[Dict[str, Any]]:
+    if not engine_only:
+        common.prepare_database()
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = Path(directory) / f'tree_{size}.ged'
+            write_gedcom(path, size)
+            file_mb = round(os.path.getsize(path) / 1024 / 1024, 1)
+            for mode in ('parse',) if engine_only else ('parse', 'endpoint'):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(measure, mode, str(path)).result()
+                results.append({'operation': 'import-gedcom', 'mode': mode, 'individuals': size, 'file_mb': file_mb, **result})
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50000, 200000, 500000])
+    parser.add_argument('--engine-only', action='store_true')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.engine_only)
+    common.print_table(results, ['individuals', 'mode', 'file_mb', 'elapsed_s', 'records_per_s', 'persons', 'relationships', 'peak_rss_mb'])
+    print(f"Results written to {common.write_results('gedcom_import', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+'''
+Business: Scaling benchmark of save-tree, load-tree and list-trees on synthetic trees of 100 to 100k persons
+Args: --sizes - tree sizes in persons, --repeat - calls per operation, --output - results file
+Returns: prints p50/p95/p99 latency, rows written and payload bytes, writes benchmarks/results/handlers.json
+'''
+import argparse
+import json
+from typing import Dict, Any, List
+
+import common
+import treegen
+
+SCHEMA = f'"{common.SCHEMA}"'
+
+def tree_row_counts(tree_id: int) -> int:
+    conn = common.connect()
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""SELECT (SELECT COUNT(*) FROM {SCHEMA}.persons WHERE tree_id = %s)
+        + (SELECT COUNT(*) FROM {SCHEMA}.relationships WHERE tree_id = %s)""",
+        (tree_id, tree_id)
+    )
+    count = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    return count
+
+def repeat_for(size: int, repeat: int) -> int:
+    '''Fewer samples for the biggest trees so a full run stays within minutes'''
+    return max(3, min(repeat, 200000 // size))
+
+def bench_size(handlers: Dict[str, Any], size: int, repeat: int) -> List[Dict[str, Any]]:
+    user_email = f'bench-{size}@example.com'
+    tree = treegen.generate_tree(size)
+    body = json.dumps({'user_email': user_email, 'title': f'Bench {size}', **tree})
+    samples = repeat_for(size, repeat)
+    results = []
+
+    def record(operation: str, timings: List[float], rows_written: int, request_bytes: int, response_bytes: int) -> None:
+        results.append({
+            'operation': operation,
+            'persons': size,
+            'edges': len(tree['edges']),
+            **common.percentiles(timings),
+            'rows_written': rows_written,
+            'request_bytes': request_bytes,
+            'response_bytes': response_bytes
+        })
+
+    response, elapsed = common.timed(common.call, handlers['save-tree'], {'httpMethod': 'POST', 'body': body}, 'save-tree')
+    tree_id = json.loads(response['body'])['tree_id']
+    rows = tree_row_counts(tree_id)
+    record('save-tree:create', [elapsed], rows, len(body.encode()), len(response['body'].encode()))
+
+    body = json.dumps({'user_email': user_email, 'tree_id': tree_id, 'title': f'Bench {size}', **tree})
+    event = {'httpMethod': 'POST', 'body': body}
+    timings = []
+    for _ in range(samples):
+        response, elapsed = common.timed(common.call, handlers['save-tree'], event, 'save-tree')
+        timings.append(elapsed)
+    # Full saves delete and re-insert every row of the tree
+    record('save-tree:full', timings, 2 * rows, len(body.encode()), len(response['body'].encode()))
+
+    moved = dict(tree['nodes'][0], x=tree['nodes'][0]['x'] + 10)
+    body = json.dumps({'user_email': user_email, 'tree_id': tree_id, 'title': f'Bench {size}', 'patch': {'upsert_nodes': [moved]}})
+    event = {'httpMethod': 'POST', 'body': body}
+    timings = []
+    for _ in range(samples):
+        response, elapsed = common.timed(common.call, handlers['save-tree'], event, 'save-tree')
+        timings.append(elapsed)
+    record('save-tree:patch-1-node', timings, 1, len(body.encode()), len(response['body'].encode()))
+
+    event = {'httpMethod': 'GET', 'queryStringParameters': {'tree_id': str(tree_id), 'user_email': user_email}}
+    timings = []
+    for _ in range(samples):
+        response, elapsed = common.timed(common.call, handlers['load-tree'], event, 'load-tree')
+        timings.append(elapsed)
+    record('load-tree', timings, 0, 0, len(response['body'].encode()))
+
+    event = {**event, 'headers': {'If-None-Match': response['headers']['ETag']}}
+    timings = []
+    for _ in range(samples):
+        response, elapsed = common.timed(common.call, handlers['load-tree'], event, 'load-tree')
+        timings.append(elapsed)
+    record('load-tree:304', timings, 0, 0, len(response['body'].encode()))
+
+    event = {'httpMethod': 'GET', 'queryStringParameters': {'user_email': user_email}}
+    timings = []
+    for _ in range(samples):
+        response, elapsed = common.timed(common.call, handlers['list-trees'], event, 'list-trees')
+        timings.append(elapsed)
+    record('list-trees', timings, 0, 0, len(response['body'].encode()))
+
+    return results
+
+def run(sizes: List[int], repeat: int) -> List[Dict[str, Any]]:
+    common.prepare_database()
+    handlers = {name: common.load_handler(name) for name in ('save-tree', 'load-tree', 'list-trees')}
+    results = []
+    for size in sizes:
+        size_results = bench_size(handlers, size, repeat)
+        for row in size_results:
+            print(f"{row['operation']:<24} {size:>7} persons  p50 {row['p50_ms']:>9} ms  p95 {row['p95_ms']:>9} ms")
+        results.extend(size_results)
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+    common.print_table(results, [
+        'operation', 'persons', 'p50_ms', 'p95_ms', 'p99_ms', 'samples',
+        'rows_written', 'request_bytes', 'response_bytes'
+    ])
+    print(f"Results written to {common.write_results('handlers', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
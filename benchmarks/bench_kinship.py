@@ -0,0 +1,98 @@
+'''
+Business: kinship engine and endpoint on large synthetic trees: index build, relation queries between random pairs, cousins
+Args: --sizes - tree sizes in persons, --queries - random pairs per size, --engine-only - skip Postgres and time the engine alone
+Returns: prints a table and writes benchmarks/results/kinship.json
+'''
+import argparse
+import json
+import random
+from typing import Dict, Any, List
+
+import common
+import treegen
+
+def engine_rows(tree: Dict[str, List[Dict[str, Any]]]):
+    '''The rows build_index reads from Postgres, taken straight from the generated tree'''
+    persons = [(int(node['id']), node['id']) for node in tree['nodes']]
+    relationships = [
+        (int(edge['source']), int(edge['target']), 'spouse' if edge.get('type') == 'spouse' else 'parent')
+        for edge in tree['edges']
+    ]
+    return persons, relationships
+
+def time_engine(KinshipIndex, tree, pairs, repeat: int) -> List[Dict[str, Any]]:
+    persons, relationships = engine_rows(tree)
+    build_timings = []
+    for _ in range(repeat):
+        index, elapsed = common.timed(KinshipIndex.build, persons, relationships)
+        build_timings.append(elapsed)
+    results = [{'mode': 'engine-build', **common.percentiles(build_timings)}]
+
+    positions = [(index.position(a), index.position(b)) for a, b in pairs]
+    for mode, query in (
+        ('engine-kinship', lambda a, b: index.kinship(a, b)),
+        ('engine-path', lambda a, b: index.relationship_path(a, b)),
+        ('engine-cousins-1', lambda a, b: index.cousins(a, 1)),
+        ('engine-cousins-3', lambda a, b: index.cousins(a, 3))
+    ):
+        timings = [common.timed(query, a, b)[1] for a, b in positions]
+        results.append({'mode': mode, **common.percentiles(timings)})
+    return results
+
+def time_endpoint(kinship_handler, tree_id: int, pairs, repeat: int) -> List[Dict[str, Any]]:
+    def event(params: Dict[str, str]) -> Dict[str, Any]:
+        return {'httpMethod': 'GET', 'queryStringParameters': {'tree_id': str(tree_id), **params}}
+
+    cold = []
+    for a, b in pairs[:repeat]:
+        kinship_handler._indexes.clear()
+        _, elapsed = common.timed(common.call, kinship_handler, event({'a': a, 'b': b}), 'kinship')
+        cold.append(elapsed)
+    results = [{'mode': 'endpoint-cold', **common.percentiles(cold)}]
+
+    for mode, params in (('endpoint-relation', lambda a, b: {'a': a, 'b': b}),
+                         ('endpoint-cousins-2', lambda a, b: {'query': 'cousins', 'a': a, 'grade': '2'})):
+        timings, body_bytes = [], []
+        for a, b in pairs:
+            response, elapsed = common.timed(common.call, kinship_handler, event(params(a, b)), 'kinship')
+            timings.append(elapsed)
+            body_bytes.append(len(response['body'].encode()))
+        results.append({'mode': mode, **common.percentiles(timings), 'response_bytes': max(body_bytes)})
+    return results
+
+def run(sizes: List[int], queries: int, repeat: int, engine_only: bool) -> List[Dict[str, Any]]:
+    if not engine_only:
+        common.prepare_database()
+        save_tree = common.load_handler('save-tree')
+    kinship_handler = common.load_handler('kinship')
+    results = []
+    for size in sizes:
+        tree = treegen.generate_tree(size)
+        rng = random.Random(size)
+        # Random pairs from the younger half of the tree, where most lookups come from
+        younger = [node['id'] for node in tree['nodes'][len(tree['nodes']) // 2:]]
+        pairs = [(rng.choice(younger), rng.choice(younger)) for _ in range(queries)]
+
+        size_results = time_engine(kinship_handler.KinshipIndex, tree, pairs, repeat)
+        if not engine_only:
+            response = common.call(save_tree, {'httpMethod': 'POST', 'body': json.dumps({'user_email': 'kin@example.com', **tree})}, 'save-tree')
+            tree_id = json.loads(response['body'])['tree_id']
+            size_results += time_endpoint(kinship_handler, tree_id, pairs, repeat)
+        results += [{'operation': 'kinship', 'persons': size, **result} for result in size_results]
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--engine-only', action='store_true')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.queries, args.repeat, args.engine_only)
+    common.print_table(results, ['persons', 'mode', 'p50_ms', 'p95_ms', 'p99_ms', 'response_bytes'])
+    print(f"Results written to {common.write_results('kinship', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
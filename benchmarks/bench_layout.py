@@ -0,0 +1,121 @@
+'''
+Business: layout-tree auto-layout on large synthetic trees: layout time, edge crossings and spacing against the generator's
+          row-by-row positions, and the endpoint end to end (load, layout, bulk position update)
+Args: --sizes - tree sizes in persons, --repeat - layouts per size, --engine-only - skip Postgres and time the engine alone
+Returns: prints a table and writes benchmarks/results/layout.json
+'''
+import argparse
+import json
+import sys
+from typing import Dict, Any, List
+
+import numpy as np
+
+import common
+import treegen
+
+def edge_arrays(tree: Dict[str, List[Dict[str, Any]]]):
+    '''Parent and spouse edges as dense person numbers, the shape layout-tree builds from Postgres rows'''
+    position = {node['id']: i for i, node in enumerate(tree['nodes'])}
+    parent_edges = [(position[e['source']], position[e['target']]) for e in tree['edges'] if e.get('type') != 'spouse']
+    spouse_edges = [(position[e['source']], position[e['target']]) for e in tree['edges'] if e.get('type') == 'spouse']
+    parents, children = (np.array(column, dtype=np.int64) for column in zip(*parent_edges))
+    spouses_a, spouses_b = (np.array(column, dtype=np.int64) for column in zip(*spouse_edges))
+    return parents, children, spouses_a, spouses_b
+
+def count_crossings(x: np.ndarray, y: np.ndarray, parents: np.ndarray, children: np.ndarray) -> int:
+    '''Crossing pairs among parent edges that span exactly one row, counted per row pair with a Fenwick tree'''
+    rows = np.unique(y, return_inverse=True)[1]
+    short = rows[children] == rows[parents] + 1
+    top, bottom, row = x[parents[short]], x[children[short]], rows[parents[short]]
+    order = np.lexsort((bottom, top, row))
+    bottom_rank = np.unique(bottom, return_inverse=True)[1] + 1
+    crossings = 0
+    tree = [0] * (int(bottom_rank.max(initial=0)) + 1)
+    start = 0
+    row_sorted = row[order]
+    for end in list(np.flatnonzero(np.diff(row_sorted)) + 1) + [len(order)]:
+        seen = 0
+        for edge in order[start:end]:
+            rank = int(bottom_rank[edge])
+            # Earlier edges (further left on top) ending further right on the bottom cross this one
+            not_greater, i = 0, rank
+            while i > 0:
+                not_greater += tree[i]
+                i -= i & -i
+            crossings += seen - not_greater
+            seen += 1
+            i = rank
+            while i < len(tree):
+                tree[i] += 1
+                i += i & -i
+        for edge in order[start:end]:
+            i = int(bottom_rank[edge])
+            while i < len(tree):
+                tree[i] -= 1
+                i += i & -i
+        start = end
+    return crossings
+
+def layout_quality(x, y, parents, children, spouses_a, spouses_b) -> Dict[str, Any]:
+    return {
+        'crossings': count_crossings(x, y, parents, children),
+        'parent_above_child': bool((y[parents] < y[children]).all()),
+        'spouse_gap_max': float(np.abs(x[spouses_a] - x[spouses_b]).max(initial=0)),
+        'width': float(x.max() - x.min()),
+        'rows': int(np.unique(y).size)
+    }
+
+def time_engine(layout_module, tree, repeat: int) -> List[Dict[str, Any]]:
+    parents, children, spouses_a, spouses_b = edge_arrays(tree)
+    count = len(tree['nodes'])
+    generated_x = np.array([node['x'] for node in tree['nodes']], dtype=np.float64)
+    generated_y = np.array([node['y'] for node in tree['nodes']], dtype=np.float64)
+    results = [{'mode': 'generator-positions', **layout_quality(generated_x, generated_y, parents, children, spouses_a, spouses_b)}]
+
+    timings = []
+    for _ in range(repeat):
+        (x, y, _), elapsed = common.timed(layout_module.layout_tree, count, parents, children, spouses_a, spouses_b)
+        timings.append(elapsed)
+    results.append({'mode': 'engine', **common.percentiles(timings), **layout_quality(x, y, parents, children, spouses_a, spouses_b)})
+    return results
+
+def time_endpoint(layout_handler, tree_id: int, repeat: int) -> List[Dict[str, Any]]:
+    event = {'httpMethod': 'POST', 'body': json.dumps({'tree_id': tree_id, 'user_email': 'layout@example.com'})}
+    timings = []
+    for _ in range(repeat):
+        response, elapsed = common.timed(common.call, layout_handler, event, 'layout-tree')
+        timings.append(elapsed)
+    payload = json.loads(response['body'])
+    return [{'mode': 'endpoint', **common.percentiles(timings), 'rows': payload['layers'], 'updated': payload['updated']}]
+
+def run(sizes: List[int], repeat: int, engine_only: bool) -> List[Dict[str, Any]]:
+    if not engine_only:
+        common.prepare_database()
+        save_tree = common.load_handler('save-tree')
+    layout_handler = common.load_handler('layout-tree')
+    layout_module = sys.modules[layout_handler.layout_tree.__module__]
+    results = []
+    for size in sizes:
+        tree = treegen.generate_tree(size)
+        size_results = time_engine(layout_module, tree, repeat)
+        if not engine_only:
+            response = common.call(save_tree, {'httpMethod': 'POST', 'body': json.dumps({'user_email': 'layout@example.com', **tree})}, 'save-tree')
+            size_results += time_endpoint(layout_handler, json.loads(response['body'])['tree_id'], repeat)
+        results += [{'operation': 'layout-tree', 'persons': size, **result} for result in size_results]
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--engine-only', action='store_true')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat, args.engine_only)
+    common.print_table(results, ['persons', 'mode', 'p50_ms', 'p95_ms', 'crossings', 'spouse_gap_max', 'width', 'rows', 'updated'])
+    print(f"Results written to {common.write_results('layout', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
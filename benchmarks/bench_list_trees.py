@@ -0,0 +1,115 @@
+'''
+Business: list-trees latency for users with many trees, per-row COUNT(*) listing versus counters and keyset pages
+Args: --trees - trees per user, --persons - persons per tree, --users - users to seed, --limit - page size, --repeat - calls per mode
+Returns: prints a table and writes benchmarks/results/list_trees.json
+'''
+import argparse
+import json
+from typing import Dict, Any, List
+
+import common
+
+# The list-trees query before the denormalized counters: a correlated COUNT(*) for every tree of the user
+LEGACY_QUERY = f"""SELECT ft.id, ft.title, ft.description, ft.created_at, ft.updated_at,
+    (SELECT COUNT(*) FROM "{common.SCHEMA}".persons WHERE tree_id = ft.id) as persons_count
+    FROM "{common.SCHEMA}".family_trees ft
+    JOIN "{common.SCHEMA}".users u ON ft.user_id = u.id
+    WHERE u.email = %s
+    ORDER BY ft.updated_at DESC"""
+
+def seed(users: int, trees: int, persons: int) -> None:
+    '''Bulk-create users with many small trees straight in SQL, then fill the counters like V0007 does'''
+    conn = common.connect()
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""INSERT INTO "{common.SCHEMA}".users (email)
+        SELECT 'list' || u || '@example.com' FROM generate_series(1, %s) u""",
+        (users,)
+    )
+    cursor.execute(
+        f"""INSERT INTO "{common.SCHEMA}".family_trees (user_id, title, updated_at)
+        SELECT u.id, 'Tree ' || t, CURRENT_TIMESTAMP - t * INTERVAL '1 minute'
+        FROM "{common.SCHEMA}".users u, generate_series(1, %s) t""",
+        (trees,)
+    )
+    cursor.execute(
+        f"""INSERT INTO "{common.SCHEMA}".persons (tree_id, client_id, first_name, last_name)
+        SELECT ft.id, p::text, 'Иван', 'Петров'
+        FROM "{common.SCHEMA}".family_trees ft, generate_series(1, %s) p""",
+        (persons,)
+    )
+    cursor.execute(
+        f"""UPDATE "{common.SCHEMA}".family_trees ft
+        SET persons_count = (SELECT COUNT(*) FROM "{common.SCHEMA}".persons p WHERE p.tree_id = ft.id)"""
+    )
+    conn.commit()
+    cursor.execute(f'ANALYZE "{common.SCHEMA}".family_trees')
+    cursor.execute(f'ANALYZE "{common.SCHEMA}".persons')
+    conn.commit()
+    conn.close()
+
+def time_legacy(email: str, repeat: int) -> List[float]:
+    conn = common.connect()
+    cursor = conn.cursor()
+    timings = []
+    for _ in range(repeat):
+        _, elapsed = common.timed(lambda: (cursor.execute(LEGACY_QUERY, (email,)), cursor.fetchall()))
+        timings.append(elapsed)
+    conn.close()
+    return timings
+
+def walk_pages(list_trees, email: str, limit: int) -> List[str]:
+    '''Follow next_cursor to the last page, returns the cursors of all pages after the first'''
+    params = {'user_email': email, 'limit': str(limit)}
+    cursors = []
+    while True:
+        response = common.call(list_trees, {'httpMethod': 'GET', 'queryStringParameters': params}, 'list-trees')
+        next_cursor = json.loads(response['body'])['next_cursor']
+        if not next_cursor:
+            return cursors
+        cursors.append(next_cursor)
+        params = {**params, 'cursor': next_cursor}
+
+def run(users: int, trees: int, persons: int, limit: int, repeat: int) -> List[Dict[str, Any]]:
+    common.prepare_database()
+    seed(users, trees, persons)
+    list_trees = common.load_handler('list-trees')
+    email = 'list1@example.com'
+
+    cursors, walk_elapsed = common.timed(walk_pages, list_trees, email, limit)
+    first_page = {'user_email': email, 'limit': str(limit)}
+    last_page = {**first_page, 'cursor': cursors[-1]} if cursors else first_page
+
+    modes = {
+        'legacy-all': time_legacy(email, repeat),
+        'first-page': [common.timed(common.call, list_trees, {'httpMethod': 'GET', 'queryStringParameters': first_page}, 'list-trees')[1] for _ in range(repeat)],
+        'last-page': [common.timed(common.call, list_trees, {'httpMethod': 'GET', 'queryStringParameters': last_page}, 'list-trees')[1] for _ in range(repeat)],
+        f'walk-{len(cursors) + 1}-pages': [walk_elapsed]
+    }
+    results = []
+    for mode, timings in modes.items():
+        results.append({
+            'operation': 'list-trees',
+            'mode': mode,
+            'trees': trees,
+            'persons_per_tree': persons,
+            **common.percentiles(timings)
+        })
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--trees', type=int, default=1000)
+    parser.add_argument('--persons', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.users, args.trees, args.persons, args.limit, args.repeat)
+    common.print_table(results, ['trees', 'persons_per_tree', 'mode', 'p50_ms', 'p95_ms', 'p99_ms'])
+    print(f"Results written to {common.write_results('list_trees', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
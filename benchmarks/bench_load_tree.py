@@ -0,0 +1,70 @@
+'''
+Business: load-tree latency and function CPU time, Python assembly versus JSON built in Postgres
+Args: --sizes - tree sizes in persons, --repeat - loads per mode, --output - results file
+Returns: prints a table and writes benchmarks/results/load_tree.json, fails if the two bodies differ
+'''
+import argparse
+import json
+import sys
+import time
+from typing import Dict, Any, List
+
+import common
+import treegen
+
+def drop_snapshots(tree_id: int) -> None:
+    conn = common.connect()
+    cursor = conn.cursor()
+    cursor.execute(f'DELETE FROM "{common.SCHEMA}".tree_snapshots WHERE tree_id = %s', (tree_id,))
+    conn.commit()
+    conn.close()
+
+def run(sizes: List[int], repeat: int) -> List[Dict[str, Any]]:
+    common.prepare_database()
+    save_tree = common.load_handler('save-tree')
+    load_tree = common.load_handler('load-tree')
+    cache = sys.modules[load_tree.get_snapshot.__module__]
+    results = []
+    for size in sizes:
+        tree = treegen.generate_tree(size)
+        response = common.call(save_tree, {'httpMethod': 'POST', 'body': json.dumps({'user_email': 'load@example.com', **tree})}, 'save-tree')
+        tree_id = json.loads(response['body'])['tree_id']
+
+        bodies = {}
+        for mode in ('python', 'db'):
+            event = {'httpMethod': 'GET', 'queryStringParameters': {'tree_id': str(tree_id), 'assembly': mode}}
+            timings, cpu_timings = [], []
+            for _ in range(repeat):
+                # Measure assembly, not the snapshot cache (the db mode still pays for writing the snapshot)
+                cache.memory_cache.clear()
+                drop_snapshots(tree_id)
+                cpu_started = time.process_time()
+                response, elapsed = common.timed(common.call, load_tree, event, 'load-tree')
+                cpu_timings.append((time.process_time() - cpu_started) * 1000)
+                timings.append(elapsed)
+            bodies[mode] = response['body']
+            results.append({
+                'operation': 'load-tree',
+                'mode': mode,
+                'persons': size,
+                **common.percentiles(timings),
+                'cpu_p50_ms': common.percentiles(cpu_timings)['p50_ms'],
+                'response_bytes': len(response['body'].encode())
+            })
+        if bodies['python'] != bodies['db']:
+            raise SystemExit(f'{size} persons: db-assembled body differs from the Python one')
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+    common.print_table(results, ['persons', 'mode', 'p50_ms', 'p95_ms', 'cpu_p50_ms', 'response_bytes'])
+    print(f"Results written to {common.write_results('load_tree', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
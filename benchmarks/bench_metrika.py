@@ -0,0 +1,74 @@
+'''
+Business: metrika-stats latency against a local Metrika stub: sequential and parallel cold fetches, warm cache,
+          stale-while-revalidate and upstream failure
+Args: --requests - calls per mode, --latency-ms - stub delay per Metrika query, --output - results file
+Returns: prints a table and writes benchmarks/results/metrika.json
+'''
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+
+import common
+from stub_metrika import start_stub
+
+def age_cache(metrika, seconds: float) -> None:
+    '''Pretend every cached period was fetched this many seconds ago'''
+    with metrika.cache_lock:
+        for key, (_, result) in list(metrika.cache.items()):
+            metrika.cache[key] = (time.monotonic() - seconds, result)
+
+def run(requests: int, latency_ms: float) -> List[Dict[str, Any]]:
+    server, base_url = start_stub(latency_ms)
+    os.environ.update({'YANDEX_METRIKA_TOKEN': 'bench', 'METRIKA_API_URL': base_url})
+    metrika = common.load_handler('metrika-stats')
+    event = {'httpMethod': 'GET', 'queryStringParameters': {}}
+
+    def before_call(mode: str) -> None:
+        if mode in ('cold-sequential', 'cold-parallel'):
+            metrika.cache.clear()
+        elif mode == 'stale-while-revalidate':
+            age_cache(metrika, metrika.CACHE_TTL_SECONDS + 1)
+        elif mode == 'upstream-down':
+            age_cache(metrika, metrika.CACHE_TTL_SECONDS + metrika.STALE_WHILE_REVALIDATE_SECONDS + 1)
+
+    results = []
+    for mode in ('cold-sequential', 'cold-parallel', 'warm', 'stale-while-revalidate', 'upstream-down'):
+        # One worker runs the totals and goals queries back to back, like the handler used to
+        metrika.executor = ThreadPoolExecutor(max_workers=1 if mode == 'cold-sequential' else 4)
+        server.state['failing'] = mode == 'upstream-down'
+        upstream_before = server.state['requests']
+        common.call(metrika, event, 'metrika-stats')
+        timings, flags = [], set()
+        for _ in range(requests):
+            before_call(mode)
+            response, elapsed = common.timed(common.call, metrika, event, 'metrika-stats')
+            timings.append(elapsed)
+            payload = json.loads(response['body'])
+            flags.add(f"{response['statusCode']}{' stale' if payload.get('stale') else ''}")
+        time.sleep(latency_ms / 1000 * 3)
+        results.append({
+            'operation': 'metrika-stats',
+            'mode': mode,
+            **common.percentiles(timings),
+            'responses': ', '.join(sorted(flags)),
+            'upstream_requests': server.state['requests'] - upstream_before
+        })
+    server.shutdown()
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=150.0)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.requests, args.latency_ms)
+    common.print_table(results, ['mode', 'p50_ms', 'p95_ms', 'responses', 'upstream_requests'])
+    print(f"Results written to {common.write_results('metrika', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
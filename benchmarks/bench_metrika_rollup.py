@@ -0,0 +1,69 @@
+'''
+Business: metrika-stats from the daily rollup table versus live Metrika queries for ranges of one month to a year
+Args: --ranges - range lengths in days, --requests - calls per mode, --latency-ms - stub delay per Metrika query
+Returns: prints a table and writes benchmarks/results/metrika_rollup.json
+'''
+import argparse
+import json
+import os
+from datetime import date, timedelta
+from typing import Dict, Any, List
+
+import common
+from stub_metrika import start_stub
+
+def run(ranges: List[int], requests: int, latency_ms: float) -> List[Dict[str, Any]]:
+    common.prepare_database()
+    server, base_url = start_stub(latency_ms)
+    os.environ.update({'YANDEX_METRIKA_TOKEN': 'bench', 'METRIKA_API_URL': base_url})
+    # Far from today, so no day of the ranges counts as still mutable
+    date2 = date.today() - timedelta(days=10)
+
+    results = []
+    for days in ranges:
+        date1 = date2 - timedelta(days=days - 1)
+        for mode in ('live', 'rollup-cold', 'rollup-day', 'rollup-week', 'rollup-month', 'rollup-total'):
+            if mode == 'live':
+                os.environ.pop('DATABASE_URL', None)
+            else:
+                common.prepare_database(reset=mode == 'rollup-cold')
+            metrika = common.load_handler('metrika-stats')
+            granularity = mode.split('-')[1] if mode not in ('live', 'rollup-cold') else 'total'
+            event = {
+                'httpMethod': 'GET',
+                'queryStringParameters': {'date1': date1.isoformat(), 'date2': date2.isoformat(), 'granularity': granularity}
+            }
+            timings = []
+            upstream_before = server.state['requests']
+            # The live path keeps its own in-memory cache, clear it to see what an uncached request costs
+            for _ in range(1 if mode == 'rollup-cold' else requests):
+                metrika.cache.clear()
+                response, elapsed = common.timed(common.call, metrika, event, 'metrika-stats')
+                timings.append(elapsed)
+            payload = json.loads(response['body'])
+            results.append({
+                'operation': 'metrika-stats',
+                'mode': mode,
+                'range_days': days,
+                **common.percentiles(timings),
+                'buckets': len(payload.get('series', [])) or 1,
+                'upstream_requests': server.state['requests'] - upstream_before,
+                'visits': payload['visits']
+            })
+    server.shutdown()
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--ranges', type=int, nargs='+', default=[30, 180, 365])
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=300.0)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.ranges, args.requests, args.latency_ms)
+    common.print_table(results, ['range_days', 'mode', 'p50_ms', 'p95_ms', 'buckets', 'upstream_requests', 'visits'])
+    print(f"Results written to {common.write_results('metrika_rollup', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
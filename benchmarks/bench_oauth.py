@@ -0,0 +1,66 @@
+'''
+Business: OAuth callback latency against a local stub provider, fresh connections versus the keep-alive client
+Args: --requests - callbacks per provider and mode, --latency-ms - stub delay per provider call,
+      --fail-rate - share of provider GETs failing with 503, --output - results file
+Returns: prints a table with per-endpoint stats and writes benchmarks/results/oauth.json
+'''
+import argparse
+import os
+import sys
+from typing import Dict, Any, List
+
+import common
+from stub_oauth import start_stub
+
+def run(requests: int, latency_ms: float, fail_rate: float) -> List[Dict[str, Any]]:
+    common.prepare_database()
+    server, base_url = start_stub(latency_ms, fail_rate)
+    # Provider URLs and credentials are read when the auth function is imported
+    os.environ.update({
+        'YANDEX_CLIENT_ID': 'bench', 'YANDEX_CLIENT_SECRET': 'bench',
+        'VK_CLIENT_ID': 'bench', 'VK_CLIENT_SECRET': 'bench',
+        'YANDEX_OAUTH_URL': base_url, 'YANDEX_LOGIN_URL': base_url,
+        'VK_OAUTH_URL': base_url, 'VK_API_URL': base_url
+    })
+    results = []
+    for keepalive in (False, True):
+        auth = common.load_handler('auth')
+        client = sys.modules[auth.fetch_json.__module__]
+        client.KEEPALIVE = keepalive
+        for provider in ('yandex', 'vk'):
+            timings = []
+            for index in range(requests):
+                # A handful of distinct codes: first callbacks create users, the rest log them in
+                event = {'httpMethod': 'GET', 'queryStringParameters': {'provider': provider, 'code': f'code-{index % 20}'}}
+                response, elapsed = common.timed(common.call, auth, event, 'auth')
+                if response['statusCode'] != 302:
+                    raise SystemExit(f"{provider} callback failed: {response['body']}")
+                timings.append(elapsed)
+            endpoints = {name: stats for name, stats in client.http_stats().items() if name.startswith(provider)}
+            results.append({
+                'operation': 'oauth-callback',
+                'provider': provider,
+                'keepalive': keepalive,
+                **common.percentiles(timings),
+                'provider_p50_ms': ' / '.join(f"{name}={stats['p50_ms']}" for name, stats in endpoints.items()),
+                'reused': sum(stats['reused'] for stats in endpoints.values()),
+                'retries': sum(stats['retries'] for stats in endpoints.values())
+            })
+        client.close_all()
+    server.shutdown()
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.requests, args.latency_ms, args.fail_rate)
+    common.print_table(results, ['provider', 'keepalive', 'p50_ms', 'p95_ms', 'provider_p50_ms', 'reused', 'retries'])
+    print(f"Results written to {common.write_results('oauth', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
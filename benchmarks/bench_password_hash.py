@@ -0,0 +1,54 @@
+'''
+Business: Password hashing throughput per core for PBKDF2-SHA256 and scrypt cost settings
+Args: --seconds - time spent on each configuration, --output - results file
+Returns: prints hashes per second and ms per hash, writes benchmarks/results/password_hash.json
+'''
+import argparse
+import sys
+import time
+from typing import Dict, Any, List
+
+import common
+
+CONFIGURATIONS = [
+    {'algorithm': 'pbkdf2_sha256', 'iterations': 100000},
+    {'algorithm': 'pbkdf2_sha256', 'iterations': 310000},
+    {'algorithm': 'pbkdf2_sha256', 'iterations': 600000},
+    {'algorithm': 'scrypt', 'n': 2 ** 14, 'r': 8, 'p': 1},
+    {'algorithm': 'scrypt', 'n': 2 ** 15, 'r': 8, 'p': 1},
+    {'algorithm': 'scrypt', 'n': 2 ** 16, 'r': 8, 'p': 1}
+]
+
+def run(seconds: float) -> List[Dict[str, Any]]:
+    # The auth function imports psycopg2 but hashing needs no database
+    auth = common.load_handler('auth')
+    passwords = sys.modules[auth.hash_password.__module__]
+    results = []
+    for params in CONFIGURATIONS:
+        stored = passwords.hash_password('correct horse battery staple', params)
+        timings = []
+        started = time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            _, elapsed = common.timed(passwords.verify_password, 'correct horse battery staple', stored)
+            timings.append(elapsed)
+        cost = ', '.join(f'{key}={value}' for key, value in params.items() if key != 'algorithm')
+        results.append({
+            'algorithm': params['algorithm'],
+            'cost': cost,
+            'hashes_per_second': round(len(timings) / sum(timings) * 1000, 2),
+            **common.percentiles(timings)
+        })
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.seconds)
+    common.print_table(results, ['algorithm', 'cost', 'hashes_per_second', 'p50_ms', 'p95_ms'])
+    print(f"Results written to {common.write_results('password_hash', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
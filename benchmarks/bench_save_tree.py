@@ -0,0 +1,83 @@
+'''
+Business: Save latency of row-by-row INSERTs versus the bulk write path of save-tree
+Args: --sizes - tree sizes in persons, --repeat - saves per size, --output - results file
+Returns: prints a table and writes benchmarks/results/save_tree_bulk.json
+'''
+import argparse
+import json
+from typing import Dict, Any, List
+
+from psycopg2.extras import RealDictCursor
+
+import common
+import treegen
+
+SCHEMA = f'"{common.SCHEMA}"'
+
+def row_by_row_save(save_tree, tree_id: int, nodes: List[Dict], edges: List[Dict]) -> None:
+    '''Reference copy of the pre-bulk save path: one INSERT per node and per edge'''
+    conn = common.connect()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(f"DELETE FROM {SCHEMA}.relationships WHERE tree_id = %s", (tree_id,))
+    cursor.execute(f"DELETE FROM {SCHEMA}.persons WHERE tree_id = %s", (tree_id,))
+    node_id_map = {}
+    for node in nodes:
+        cursor.execute(
+            f"""INSERT INTO {SCHEMA}.persons (tree_id, client_id, {save_tree.PERSON_COLUMNS})
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id""",
+            (tree_id, node['id']) + save_tree.person_values(node)
+        )
+        node_id_map[node['id']] = cursor.fetchone()['id']
+    for edge in edges:
+        source_db_id = node_id_map.get(edge['source'])
+        target_db_id = node_id_map.get(edge['target'])
+        if source_db_id and target_db_id:
+            cursor.execute(
+                f"""INSERT INTO {SCHEMA}.relationships (tree_id, source_person_id, target_person_id, relationship_type)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (source_person_id, target_person_id, relationship_type) DO NOTHING""",
+                (tree_id, source_db_id, target_db_id, save_tree.edge_type(edge))
+            )
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def run(sizes: List[int], repeat: int) -> List[Dict[str, Any]]:
+    common.prepare_database()
+    save_tree = common.load_handler('save-tree')
+    results = []
+    for size in sizes:
+        tree = treegen.generate_tree(size)
+        body = json.dumps({'user_email': f'bench-{size}@example.com', 'title': f'Bench {size}', **tree})
+        response = common.call(save_tree, {'httpMethod': 'POST', 'body': body}, 'save-tree')
+        tree_id = json.loads(response['body'])['tree_id']
+
+        before = [common.timed(row_by_row_save, save_tree, tree_id, tree['nodes'], tree['edges'])[1] for _ in range(repeat)]
+        event = {'httpMethod': 'POST', 'body': json.dumps({'user_email': f'bench-{size}@example.com', 'tree_id': tree_id, **tree})}
+        after = [common.timed(common.call, save_tree, event, 'save-tree')[1] for _ in range(repeat)]
+
+        before_p50 = common.percentiles(before)['p50_ms']
+        after_p50 = common.percentiles(after)['p50_ms']
+        results.append({
+            'persons': size,
+            'edges': len(tree['edges']),
+            'row_by_row_p50_ms': before_p50,
+            'bulk_p50_ms': after_p50,
+            'speedup': round(before_p50 / after_p50, 2) if after_p50 else None
+        })
+        print(f"{size} persons: row-by-row {before_p50} ms, bulk {after_p50} ms")
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+    common.print_table(results, ['persons', 'edges', 'row_by_row_p50_ms', 'bulk_p50_ms', 'speedup'])
+    print(f"Results written to {common.write_results('save_tree_bulk', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+'''
+Business: search-persons latency with millions of persons in the table: exact, prefix, typo, transliterated,
+          place and occupation queries for one user, against an ILIKE scan of the same user's trees
+Args: --users, --trees-per-user, --persons-per-tree - synthetic data size (defaults give 2M persons),
+      --repeat - requests per query, --skip-load - reuse the data of a previous run
+Returns: prints a table and writes benchmarks/results/search.json
+'''
+import argparse
+import json
+import time
+from typing import Dict, Any, List
+
+import common
+import treegen
+
+USER_EMAIL = 'search0@example.com'
+SURNAME_ROOTS = [
+    'Смирн', 'Иван', 'Кузнец', 'Сокол', 'Поп', 'Лебед', 'Козл', 'Новик', 'Мороз', 'Петр', 'Волк', 'Соловь',
+    'Василь', 'Зайц', 'Павл', 'Семен', 'Голуб', 'Виноград', 'Богдан', 'Воробь', 'Фёдор', 'Михайл', 'Беляк',
+    'Тарас', 'Белоус', 'Комар', 'Орл', 'Киселёв', 'Макар', 'Андре', 'Ковал', 'Ильин', 'Гусь', 'Тит', 'Кузьмин'
+]
+SURNAME_SUFFIXES = ['ов', 'ев', 'ин']
+PLACES = treegen.PLACES + ['Вологда', 'Псков', 'Смоленск', 'Калуга', 'Кострома', 'Владимир', 'Самара', 'Пермь']
+OCCUPATIONS = treegen.OCCUPATIONS + ['портной', 'кузнец', 'мельник', 'священник', 'бухгалтер', 'шофёр']
+RARE_SURNAME = 'Вишневецкий'
+QUERIES = [
+    ('surname', 'Смирнов'),
+    ('full name', 'Иван Петров'),
+    ('prefix', 'Кузне'),
+    ('typo', 'Смирнв'),
+    ('latin', 'Sokolov'),
+    ('latin full name', 'Mariya Volkova'),
+    ('rare surname', RARE_SURNAME),
+    ('place', 'Тверь'),
+    ('occupation', 'купец'),
+    ('no match', 'Zzyzx')
+]
+
+LOAD_PERSONS = f"""INSERT INTO {common.SCHEMA}.persons
+    (tree_id, client_id, first_name, last_name, middle_name, gender, birth_date, birth_place, occupation)
+SELECT tree_id, 'p' || n,
+    CASE WHEN male THEN m[1 + r1 %% array_length(m, 1)] ELSE f[1 + r1 %% array_length(f, 1)] END,
+    s[1 + r2 %% array_length(s, 1)] || CASE WHEN male THEN '' ELSE 'а' END,
+    m[1 + r3 %% array_length(m, 1)] || CASE WHEN male THEN 'ович' ELSE 'овна' END,
+    CASE WHEN male THEN 'male' ELSE 'female' END,
+    (1700 + r4 %% 300)::text, pl[1 + r5 %% array_length(pl, 1)], oc[1 + r6 %% array_length(oc, 1)]
+FROM (
+    SELECT ft.id AS tree_id, g AS n, g %% 2 = 0 AS male,
+        (random() * 1e6)::int AS r1, (random() * 1e6)::int AS r2, (random() * 1e6)::int AS r3,
+        (random() * 1e6)::int AS r4, (random() * 1e6)::int AS r5, (random() * 1e6)::int AS r6
+    FROM {common.SCHEMA}.family_trees ft CROSS JOIN generate_series(1, %(per_tree)s) g
+    WHERE ft.user_id = %(user_id)s
+) x, (SELECT %(male)s::text[] AS m, %(female)s::text[] AS f, %(surnames)s::text[] AS s,
+    %(places)s::text[] AS pl, %(occupations)s::text[] AS oc) arrays"""
+
+# What the browser-side search amounts to without an index: every person of every tree of the user
+SCAN_QUERY = f"""SELECT p.id FROM {common.SCHEMA}.persons p
+JOIN {common.SCHEMA}.family_trees ft ON ft.id = p.tree_id
+JOIN {common.SCHEMA}.users u ON u.id = ft.user_id
+WHERE u.email = %(email)s AND concat_ws(' ', p.first_name, p.last_name, p.middle_name, p.maiden_name,
+    p.birth_place, p.death_place, p.occupation) ILIKE %(pattern)s
+LIMIT 21"""
+
+def load_data(users: int, trees_per_user: int, persons_per_tree: int) -> None:
+    conn = common.connect()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute('SELECT setseed(0.42)')
+    cursor.execute(
+        f"""INSERT INTO {common.SCHEMA}.users (email)
+        SELECT 'search' || i || '@example.com' FROM generate_series(0, %s - 1) i RETURNING id""",
+        (users,)
+    )
+    user_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        f"""INSERT INTO {common.SCHEMA}.family_trees (user_id, title)
+        SELECT u, 'Древо ' || t FROM unnest(%s::int[]) u, generate_series(1, %s) t""",
+        (user_ids, trees_per_user)
+    )
+    surnames = [root + suffix for root in SURNAME_ROOTS for suffix in SURNAME_SUFFIXES]
+    for index, user_id in enumerate(user_ids):
+        started = time.perf_counter()
+        cursor.execute(LOAD_PERSONS, {
+            'per_tree': persons_per_tree, 'user_id': user_id, 'male': treegen.MALE_NAMES,
+            'female': treegen.FEMALE_NAMES, 'surnames': surnames, 'places': PLACES, 'occupations': OCCUPATIONS
+        })
+        print(f'  user {index + 1}/{users}: {cursor.rowcount} persons in {time.perf_counter() - started:.1f}s', flush=True)
+    cursor.execute(
+        f"""UPDATE {common.SCHEMA}.persons SET last_name = %s
+        WHERE id = (SELECT MIN(id) FROM {common.SCHEMA}.persons WHERE tree_id IN (
+            SELECT id FROM {common.SCHEMA}.family_trees WHERE user_id = %s))""",
+        (RARE_SURNAME, user_ids[0])
+    )
+    cursor.execute(f'ANALYZE {common.SCHEMA}.persons')
+    cursor.close()
+    conn.close()
+
+def time_queries(repeat: int) -> List[Dict[str, Any]]:
+    search = common.load_handler('search-persons')
+    conn = common.connect()
+    cursor = conn.cursor()
+    results = []
+    for label, text in QUERIES:
+        event = {'httpMethod': 'GET', 'queryStringParameters': {'q': text, 'user_email': USER_EMAIL}}
+        common.call(search, event, 'search-persons')
+        timings = []
+        for _ in range(repeat):
+            response, elapsed = common.timed(common.call, search, event, 'search-persons')
+            timings.append(elapsed)
+        body = json.loads(response['body'])
+        top = body['results'][0] if body['results'] else {}
+        results.append({
+            'operation': 'search-persons', 'query': label, 'q': text, 'mode': 'indexed', **common.percentiles(timings),
+            'hits': body['count'], 'top': f"{top.get('lastName', '')} {top.get('firstName', '')}".strip()
+        })
+
+        scan_timings = []
+        for _ in range(max(1, repeat // 5)):
+            started = time.perf_counter()
+            cursor.execute(SCAN_QUERY, {'email': USER_EMAIL, 'pattern': f'%{text}%'})
+            hits = len(cursor.fetchall())
+            scan_timings.append((time.perf_counter() - started) * 1000)
+        results.append({
+            'operation': 'search-persons', 'query': label, 'q': text, 'mode': 'ilike-scan',
+            **common.percentiles(scan_timings), 'hits': hits
+        })
+    cursor.close()
+    conn.close()
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=40)
+    parser.add_argument('--trees-per-user', type=int, default=25)
+    parser.add_argument('--persons-per-tree', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--skip-load', action='store_true')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    common.prepare_database(reset=not args.skip_load)
+    if not args.skip_load:
+        print(f'Loading {args.users * args.trees_per_user * args.persons_per_tree} persons...')
+        load_data(args.users, args.trees_per_user, args.persons_per_tree)
+    results = time_queries(args.repeat)
+    common.print_table(results, ['query', 'q', 'mode', 'p50_ms', 'p95_ms', 'p99_ms', 'hits', 'top'])
+    print(f"Results written to {common.write_results('search', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
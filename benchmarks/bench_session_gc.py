@@ -0,0 +1,115 @@
+'''
+Business: auth verify latency on a sessions table full of expired rows, before and after the batched cleanup
+Args: --expired - expired sessions to seed, --live - valid sessions verified, --batch-size - rows per DELETE,
+      --requests - verify calls per phase
+Returns: prints a table and writes benchmarks/results/session_gc.json
+'''
+import argparse
+import sys
+import time
+from typing import Dict, Any, List
+
+import common
+
+def seed(expired: int, live: int) -> List[str]:
+    '''One user with many expired sessions and a few live ones, returns the live tokens'''
+    conn = common.connect()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO auth_users (email, display_name) VALUES ('gc@example.com', 'GC') RETURNING id")
+    user_id = cursor.fetchone()[0]
+    cursor.execute(
+        """INSERT INTO auth_sessions (user_id, session_token, expires_at)
+        SELECT %s, md5(random()::text) || md5(g::text), CURRENT_TIMESTAMP - (g % 1000) * INTERVAL '1 hour'
+        FROM generate_series(1, %s) g""",
+        (user_id, expired)
+    )
+    cursor.execute(
+        """INSERT INTO auth_sessions (user_id, session_token, expires_at)
+        SELECT %s, 'live-' || g, CURRENT_TIMESTAMP + INTERVAL '30 days'
+        FROM generate_series(1, %s) g
+        RETURNING session_token""",
+        (user_id, live)
+    )
+    tokens = [row[0] for row in cursor.fetchall()]
+    conn.commit()
+    conn.autocommit = True
+    cursor.execute('VACUUM ANALYZE auth_sessions')
+    conn.close()
+    return tokens
+
+def table_size() -> Dict[str, Any]:
+    conn = common.connect()
+    cursor = conn.cursor()
+    cursor.execute(
+        """SELECT COUNT(*), pg_total_relation_size('auth_sessions'), pg_relation_size('idx_auth_sessions_token')
+        FROM auth_sessions"""
+    )
+    rows, table_bytes, index_bytes = cursor.fetchone()
+    conn.close()
+    return {'rows': rows, 'table_bytes': table_bytes, 'token_index_bytes': index_bytes}
+
+def verify_timings(auth, cache, tokens: List[str], requests: int) -> List[float]:
+    timings = []
+    for index in range(requests):
+        # Every call goes to Postgres, the session cache would hide the table size
+        cache.session_cache.clear()
+        event = {
+            'httpMethod': 'GET',
+            'queryStringParameters': {'action': 'verify'},
+            'headers': {'X-Session-Token': tokens[index % len(tokens)]}
+        }
+        timings.append(common.timed(common.call, auth, event, 'auth')[1])
+    return timings
+
+def run(expired: int, live: int, batch_size: int, requests: int) -> List[Dict[str, Any]]:
+    common.prepare_database()
+    tokens = seed(expired, live)
+    auth = common.load_handler('auth')
+    cache = sys.modules[auth.get_verified.__module__]
+    gc = sys.modules[auth.collect_expired.__module__]
+
+    results = [{
+        'phase': 'before',
+        **table_size(),
+        **common.percentiles(verify_timings(auth, cache, tokens, requests))
+    }]
+
+    started = time.perf_counter()
+    report = gc.collect_expired(common.database_url(), batch_size=batch_size, time_budget=float('inf'))
+    elapsed = time.perf_counter() - started
+    removed = sum(report['removed'].values())
+    results.append({
+        'phase': 'cleanup',
+        'rows_removed': removed,
+        'batches': report['batches'],
+        'rows_per_second': round(removed / elapsed, 1) if elapsed else 0.0,
+        'elapsed_ms': report['elapsed_ms']
+    })
+
+    # Autovacuum would do this eventually; run it so the after numbers are stable
+    conn = common.connect()
+    conn.autocommit = True
+    conn.cursor().execute('VACUUM ANALYZE auth_sessions')
+    conn.close()
+    results.append({
+        'phase': 'after',
+        **table_size(),
+        **common.percentiles(verify_timings(auth, cache, tokens, requests))
+    })
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--expired', type=int, default=2000000)
+    parser.add_argument('--live', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.expired, args.live, args.batch_size, args.requests)
+    common.print_table(results, ['phase', 'rows', 'table_bytes', 'token_index_bytes', 'p50_ms', 'p95_ms', 'rows_removed', 'batches', 'elapsed_ms', 'rows_per_second'])
+    print(f"Results written to {common.write_results('session_gc', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
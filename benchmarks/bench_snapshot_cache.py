@@ -0,0 +1,60 @@
+'''
+Business: Repeated load-tree latency with a cold cache, snapshot-table hits and warm in-memory hits
+Args: --sizes - tree sizes in persons, --repeat - loads per mode, --output - results file
+Returns: prints a table with cache stats and writes benchmarks/results/snapshot_cache.json
+'''
+import argparse
+import json
+import sys
+from typing import Dict, Any, List
+
+import common
+import treegen
+from bench_load_tree import drop_snapshots
+
+def run(sizes: List[int], repeat: int) -> List[Dict[str, Any]]:
+    common.prepare_database()
+    save_tree = common.load_handler('save-tree')
+    load_tree = common.load_handler('load-tree')
+    cache = sys.modules[load_tree.get_snapshot.__module__]
+    results = []
+    for size in sizes:
+        tree = treegen.generate_tree(size)
+        response = common.call(save_tree, {'httpMethod': 'POST', 'body': json.dumps({'user_email': 'cache@example.com', **tree})}, 'save-tree')
+        tree_id = json.loads(response['body'])['tree_id']
+        event = {'httpMethod': 'GET', 'queryStringParameters': {'tree_id': str(tree_id)}}
+
+        for mode in ('cold', 'snapshot', 'warm'):
+            cache.memory_cache = cache.SnapshotLRU(cache.MAX_BYTES)
+            timings = []
+            for _ in range(repeat):
+                if mode == 'cold':
+                    drop_snapshots(tree_id)
+                if mode != 'warm':
+                    cache.memory_cache.clear()
+                response, elapsed = common.timed(common.call, load_tree, event, 'load-tree')
+                timings.append(elapsed)
+            stats = cache.cache_stats()
+            results.append({
+                'operation': 'load-tree',
+                'cache': mode,
+                'persons': size,
+                **common.percentiles(timings),
+                'response_bytes': len(response['body'].encode()),
+                **{key: stats[key] for key in ('memory_hits', 'snapshot_hits', 'misses', 'evictions', 'hit_rate')}
+            })
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+    common.print_table(results, ['persons', 'cache', 'p50_ms', 'p95_ms', 'memory_hits', 'snapshot_hits', 'misses', 'evictions', 'hit_rate'])
+    print(f"Results written to {common.write_results('snapshot_cache', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+'''
+Business: load-tree full view versus a viewport window and the minimap outline on large trees
+Args: --sizes - tree sizes in persons, --repeat - loads per view, --viewport - window width and height
+Returns: prints a table and writes benchmarks/results/window.json
+'''
+import argparse
+import json
+from typing import Dict, Any, List
+
+import common
+import treegen
+
+def run(sizes: List[int], repeat: int, viewport: List[int]) -> List[Dict[str, Any]]:
+    common.prepare_database()
+    save_tree = common.load_handler('save-tree')
+    load_tree = common.load_handler('load-tree')
+    results = []
+    for size in sizes:
+        tree = treegen.generate_tree(size)
+        response = common.call(save_tree, {'httpMethod': 'POST', 'body': json.dumps({'user_email': 'window@example.com', **tree})}, 'save-tree')
+        tree_id = json.loads(response['body'])['tree_id']
+
+        # A viewport in the middle of the widest generation
+        xs = sorted(node['x'] for node in tree['nodes'])
+        ys = sorted(node['y'] for node in tree['nodes'])
+        center_x, center_y = xs[len(xs) // 2], ys[len(ys) // 2]
+        width, height = viewport
+        views = {
+            'full': {},
+            'window': {
+                'view': 'window',
+                'min_x': str(center_x - width / 2), 'max_x': str(center_x + width / 2),
+                'min_y': str(center_y - height / 2), 'max_y': str(center_y + height / 2)
+            },
+            'outline': {'view': 'outline'}
+        }
+        for view, view_params in views.items():
+            event = {'httpMethod': 'GET', 'queryStringParameters': {'tree_id': str(tree_id), **view_params}}
+            common.call(load_tree, event, 'load-tree')
+            timings = []
+            for _ in range(repeat):
+                response, elapsed = common.timed(common.call, load_tree, event, 'load-tree')
+                timings.append(elapsed)
+            payload = json.loads(response['body'])
+            results.append({
+                'operation': 'load-tree',
+                'mode': view,
+                'persons': size,
+                **common.percentiles(timings),
+                'nodes_returned': len(payload['nodes']),
+                'edges_returned': len(payload.get('edges', [])),
+                'response_bytes': len(response['body'].encode())
+            })
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--viewport', type=int, nargs=2, default=[1920, 1080])
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat, args.viewport)
+    common.print_table(results, ['persons', 'mode', 'p50_ms', 'p95_ms', 'nodes_returned', 'edges_returned', 'response_bytes'])
+    print(f"Results written to {common.write_results('window', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+'''
+Business: Shared helpers for backend benchmarks (local Postgres setup, handler loading, stats)
+Args: BENCH_DATABASE_URL - local Postgres database the benchmarks may wipe and recreate
+Returns: helpers used by the bench_*.py scripts
+'''
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, Any, List, Optional
+from urllib.parse import quote
+
+import psycopg2
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = ROOT_DIR / 'backend'
+MIGRATIONS_DIR = ROOT_DIR / 'db_migrations'
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+SCHEMA = 't_p57451291_family_tree_builder_'
+
+class Context:
+    '''Minimal stand-in for the cloud function context object'''
+    def __init__(self, function_name: str):
+        self.function_name = function_name
+        self.request_id = 'bench'
+
+def database_url() -> str:
+    '''Benchmark database URL with search_path pointed at the app schema'''
+    url = os.environ.get('BENCH_DATABASE_URL')
+    if not url:
+        sys.exit('Set BENCH_DATABASE_URL to a local Postgres database the benchmarks may wipe')
+    separator = '&' if '?' in url else '?'
+    return f"{url}{separator}options={quote(f'-c search_path={SCHEMA}')}"
+
+def prepare_database(reset: bool = True) -> str:
+    '''Recreate the app schema from db_migrations and export DATABASE_URL for the handlers'''
+    url = database_url()
+    conn = psycopg2.connect(url)
+    conn.autocommit = True
+    cursor = conn.cursor()
+    if reset:
+        cursor.execute(f'DROP SCHEMA IF EXISTS "{SCHEMA}" CASCADE')
+    cursor.execute(f'CREATE SCHEMA IF NOT EXISTS "{SCHEMA}"')
+    cursor.execute(f'SET search_path TO "{SCHEMA}"')
+    if reset:
+        for migration in sorted(MIGRATIONS_DIR.glob('V*.sql')):
+            cursor.execute(migration.read_text(encoding='utf-8'))
+    cursor.close()
+    conn.close()
+    os.environ['DATABASE_URL'] = url
+    return url
+
+def connect():
+    return psycopg2.connect(database_url())
+
+def load_handler(function_name: str) -> ModuleType:
+    '''Import backend/<function_name>/index.py as a standalone module'''
+    function_dir = BACKEND_DIR / function_name
+    # Function directories may ship helper modules with the same names, drop cached copies
+    for helper in function_dir.glob('*.py'):
+        if helper.stem != 'index':
+            sys.modules.pop(helper.stem, None)
+    sys.path.insert(0, str(function_dir))
+    try:
+        spec = importlib.util.spec_from_file_location(f"bench_{function_name.replace('-', '_')}", function_dir / 'index.py')
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(str(function_dir))
+    return module
+
+def call(module: ModuleType, event: Dict[str, Any], function_name: str = 'bench') -> Dict[str, Any]:
+    response = module.handler(event, Context(function_name))
+    if response['statusCode'] >= 500:
+        raise RuntimeError(f"{function_name} failed: {response['body'][:500]}")
+    return response
+
+def timed(fn, *args, **kwargs):
+    '''Run fn and return (result, elapsed milliseconds)'''
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples_ms)
+    if not ordered:
+        return {'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'samples': 0}
+
+    def pick(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))], 3)
+
+    return {'p50_ms': pick(0.50), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99), 'samples': len(ordered)}
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_results(name: str, results: List[Dict[str, Any]], output: Optional[str] = None) -> Path:
+    '''Write results as JSON tagged with the current commit so runs can be compared'''
+    path = Path(output) if output else RESULTS_DIR / f"{name}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({
+        'benchmark': name,
+        'commit': git_commit(),
+        'created_at': datetime.utcnow().isoformat(),
+        'results': results
+    }, ensure_ascii=False, indent=2), encoding='utf-8')
+    return path
+
+def print_table(results: List[Dict[str, Any]], columns: List[str]) -> None:
+    widths = [max(len(column), *(len(str(row.get(column, ''))) for row in results)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in results:
+        print('  '.join(str(row.get(column, '')).ljust(width) for column, width in zip(columns, widths)))
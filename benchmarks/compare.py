@@ -0,0 +1,49 @@
+'''
+Business: Compare two benchmark result files (e.g. from two commits) and flag regressions
+Args: baseline - older results JSON, candidate - newer results JSON, --threshold - allowed p50 slowdown
+Returns: prints per-row p50 change, exits with 1 when a row regressed beyond the threshold
+'''
+import argparse
+import json
+import sys
+from typing import Dict, Any, Tuple
+
+KEY_FIELDS = ('operation', 'function', 'persons', 'pooled', 'cache', 'mode')
+
+def row_key(row: Dict[str, Any]) -> Tuple:
+    return tuple((field, row[field]) for field in KEY_FIELDS if field in row)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed relative p50 slowdown')
+    parser.add_argument('--metric', default='p50_ms')
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding='utf-8') as f:
+        candidate = json.load(f)
+
+    baseline_rows = {row_key(row): row for row in baseline['results']}
+    print(f"{(baseline.get('commit') or '?')[:10]} -> {(candidate.get('commit') or '?')[:10]} ({args.metric})")
+
+    regressed = False
+    for row in candidate['results']:
+        key = row_key(row)
+        old = baseline_rows.get(key)
+        if not old or args.metric not in row or not old.get(args.metric):
+            continue
+        change = (row[args.metric] - old[args.metric]) / old[args.metric]
+        marker = ''
+        if change > args.threshold:
+            marker = '  REGRESSION'
+            regressed = True
+        label = ', '.join(f'{field}={value}' for field, value in key)
+        print(f"{label:<60} {old[args.metric]:>10} -> {row[args.metric]:>10} ({change:+.1%}){marker}")
+
+    sys.exit(1 if regressed else 0)
+
+if __name__ == '__main__':
+    main()
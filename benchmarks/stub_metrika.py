@@ -0,0 +1,93 @@
+'''
+Business: Local stand-in for the Yandex Metrika reporting API (/stat/v1/data) used by metrika-stats
+Args: --port, --latency-ms - delay added to every response
+Returns: an HTTP server answering totals and goal queries (whole period or per day); start_stub() runs it in a thread, set .failing to return 503s
+'''
+import argparse
+import json
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+from urllib.parse import urlsplit, parse_qs
+
+GOALS = ['tree_first_save', 'person_added', 'plan_selected_Старт', 'plan_selected_Премиум год']
+
+def daily_rows(query: dict) -> list:
+    '''Per-day totals (dimensions=ym:s:date) or per-day goal reaches (ym:s:date,ym:s:goalDimension)'''
+    start, end = date.fromisoformat(query['date1']), date.fromisoformat(query['date2'])
+    rows = []
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        visits = float(100 + day.toordinal() % 50)
+        if 'goalDimension' in query['dimensions']:
+            rows.extend(
+                {'dimensions': [{'name': day.isoformat()}, {'name': goal}], 'metrics': [float(index + day.day % 3)]}
+                for index, goal in enumerate(GOALS)
+            )
+        else:
+            rows.append({'dimensions': [{'name': day.isoformat()}], 'metrics': [visits, visits * 0.6, visits * 4]})
+    return rows
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency_ms = 0.0
+    state = {'failing': False, 'requests': 0}
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        time.sleep(self.latency_ms / 1000)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        self.state['requests'] += 1
+        parts = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        if parts.path != '/stat/v1/data':
+            self.reply(404, {'errors': [{'message': 'not found'}]})
+        elif self.state['failing']:
+            self.reply(503, {'errors': [{'message': 'stub is failing'}]})
+        elif 'ym:s:date' in query.get('dimensions', ''):
+            self.reply(200, {'data': daily_rows(query)})
+        elif 'dimensions' in query:
+            self.reply(200, {'data': [
+                {'dimensions': [{'name': goal}], 'metrics': [float(10 * (index + 1))]}
+                for index, goal in enumerate(GOALS)
+            ]})
+        else:
+            self.reply(200, {'data': [], 'totals': [1234.0, 567.0, 8910.0]})
+
+def start_stub(latency_ms: float = 0.0, port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    '''Serve the stub in a daemon thread, returns the server (server.state controls failures) and its base URL'''
+    state = {'failing': False, 'requests': 0}
+    handler = type('ConfiguredStubHandler', (StubHandler,), {'latency_ms': latency_ms, 'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, base_url = start_stub(args.latency_ms, args.port)
+    print(f'Stub Metrika API on {base_url}, Ctrl+C to stop')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+'''
+Business: Local stand-in for the Yandex and VK OAuth endpoints used by the auth function
+Args: --port, --latency-ms - delay added to every response, --fail-rate - share of GETs answered with 503
+Returns: an HTTP/1.1 keep-alive server; start_stub() runs it in a thread for benchmarks
+'''
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+from urllib.parse import urlsplit, parse_qs
+
+def user_number(secret: str) -> int:
+    '''Stable fake provider user id derived from the code or access token'''
+    return int(hashlib.sha256(secret.encode()).hexdigest()[:8], 16)
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes, Nagle would add delayed-ACK stalls to every reply
+    disable_nagle_algorithm = True
+    latency_ms = 0.0
+    fail_rate = 0.0
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        time.sleep(self.latency_ms / 1000)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length', '0'))
+        form = parse_qs(self.rfile.read(length).decode())
+        if urlsplit(self.path).path == '/token':
+            self.reply(200, {'access_token': f"stub-{form.get('code', [''])[0]}", 'token_type': 'bearer'})
+        else:
+            self.reply(404, {'error': 'not found'})
+
+    def do_GET(self) -> None:
+        parts = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        if random.random() < self.fail_rate:
+            self.reply(503, {'error': 'unavailable'})
+        elif parts.path == '/info':
+            number = user_number(self.headers.get('Authorization', ''))
+            self.reply(200, {
+                'id': str(number),
+                'default_email': f'yandex{number}@example.com',
+                'display_name': f'Yandex {number}'
+            })
+        elif parts.path == '/access_token':
+            number = user_number(query.get('code', ''))
+            self.reply(200, {'access_token': f"stub-{query.get('code', '')}", 'user_id': number, 'email': f'vk{number}@example.com'})
+        elif parts.path == '/method/users.get':
+            self.reply(200, {'response': [{'id': int(query.get('user_ids', '0')), 'first_name': 'VK', 'last_name': query.get('user_ids', '')}]})
+        else:
+            self.reply(404, {'error': 'not found'})
+
+def start_stub(latency_ms: float = 0.0, fail_rate: float = 0.0, port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    '''Serve the stub in a daemon thread, returns the server and its base URL'''
+    handler = type('ConfiguredStubHandler', (StubHandler,), {'latency_ms': latency_ms, 'fail_rate': fail_rate})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, base_url = start_stub(args.latency_ms, args.fail_rate, args.port)
+    print(f'Stub OAuth provider on {base_url}, Ctrl+C to stop')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
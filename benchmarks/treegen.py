@@ -0,0 +1,113 @@
+'''
+Business: Synthetic multi-generation family trees in the save-tree node/edge JSON shape
+Args: size - number of persons, seed - RNG seed for reproducible trees
+Returns: dict with nodes and edges lists
+'''
+import random
+from typing import Dict, Any, List, Optional
+
+MALE_NAMES = ['Иван', 'Пётр', 'Алексей', 'Николай', 'Михаил', 'Сергей', 'Андрей', 'Дмитрий', 'Фёдор', 'Василий']
+FEMALE_NAMES = ['Мария', 'Анна', 'Екатерина', 'Ольга', 'Наталья', 'Елена', 'Татьяна', 'Софья', 'Дарья', 'Анастасия']
+LAST_NAMES = ['Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Соколов', 'Попов', 'Лебедев', 'Козлов', 'Новиков', 'Морозов']
+PLACES = ['Москва', 'Санкт-Петербург', 'Тверь', 'Казань', 'Нижний Новгород', 'Ярославль', 'Рязань', 'Тула']
+OCCUPATIONS = ['крестьянин', 'купец', 'учитель', 'инженер', 'врач', 'рабочий', 'офицер', 'агроном']
+
+GENERATION_YEARS = 28
+X_STEP = 220
+Y_STEP = 180
+
+def feminine(last_name: str) -> str:
+    return last_name + 'а' if last_name.endswith(('ов', 'ев', 'ин')) else last_name
+
+def make_person(rng: random.Random, person_id: int, gender: str, last_name: str,
+                birth_year: int, generation: int, bio_chars: int) -> Dict[str, Any]:
+    first_name = rng.choice(MALE_NAMES if gender == 'male' else FEMALE_NAMES)
+    is_alive = birth_year > 1940 and rng.random() > 0.2
+    return {
+        'id': str(person_id),
+        'x': 0,
+        'y': generation * Y_STEP,
+        'firstName': first_name,
+        'lastName': last_name if gender == 'male' else feminine(last_name),
+        'middleName': rng.choice(MALE_NAMES) + ('ович' if gender == 'male' else 'овна'),
+        'maidenName': '',
+        'gender': gender,
+        'birthDate': f"{birth_year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        'birthPlace': rng.choice(PLACES),
+        'deathDate': '' if is_alive else str(birth_year + rng.randint(40, 90)),
+        'deathPlace': '' if is_alive else rng.choice(PLACES),
+        'isAlive': is_alive,
+        'occupation': rng.choice(OCCUPATIONS),
+        'relation': '',
+        'bio': ('Биография ' * (bio_chars // 10 + 1))[:bio_chars],
+        'historyContext': ''
+    }
+
+def generate_tree(size: int, seed: int = 42, bio_chars: int = 120,
+                  founder_year: int = 1750) -> Dict[str, List[Dict[str, Any]]]:
+    '''Grow a tree generation by generation: couples marry in-laws and have 1-5 children'''
+    rng = random.Random(seed)
+    nodes: List[Dict[str, Any]] = []
+    edges: List[Dict[str, Any]] = []
+    next_id = 1
+
+    def add(gender: str, last_name: str, birth_year: int, generation: int) -> Dict[str, Any]:
+        nonlocal next_id
+        node = make_person(rng, next_id, gender, last_name, birth_year, generation, bio_chars)
+        next_id += 1
+        nodes.append(node)
+        return node
+
+    def marry(person: Dict[str, Any], generation: int) -> Optional[Dict[str, Any]]:
+        if len(nodes) >= size:
+            return None
+        spouse_gender = 'female' if person['gender'] == 'male' else 'male'
+        spouse_year = int(person['birthDate'][:4]) + rng.randint(-5, 5)
+        spouse = add(spouse_gender, rng.choice(LAST_NAMES), spouse_year, generation)
+        wife, husband = (spouse, person) if spouse_gender == 'female' else (person, spouse)
+        wife['maidenName'] = wife['lastName']
+        wife['lastName'] = feminine(husband['lastName'])
+        edges.append({'id': f"e-spouse-{person['id']}-{spouse['id']}", 'source': person['id'], 'target': spouse['id'], 'type': 'spouse'})
+        return spouse
+
+    founder_count = max(1, size // 2000)
+    generation = 0
+    couples = []
+    for _ in range(founder_count):
+        founder = add('male', rng.choice(LAST_NAMES), founder_year + rng.randint(0, 20), generation)
+        spouse = marry(founder, generation)
+        couples.append((founder, spouse))
+
+    while len(nodes) < size and couples:
+        generation += 1
+        next_couples = []
+        for father, mother in couples:
+            if len(nodes) >= size:
+                break
+            husband = father if father['gender'] == 'male' or not mother else mother
+            base_year = int(father['birthDate'][:4]) + GENERATION_YEARS
+            for _ in range(rng.randint(1, 5)):
+                if len(nodes) >= size:
+                    break
+                child = add(rng.choice(['male', 'female']), husband['lastName'], base_year + rng.randint(-4, 10), generation)
+                for parent in (father, mother):
+                    if parent:
+                        edges.append({'id': f"e-{parent['id']}-{child['id']}", 'source': parent['id'], 'target': child['id']})
+                if rng.random() < 0.75:
+                    spouse = marry(child, generation)
+                    if spouse:
+                        next_couples.append((child, spouse))
+        rng.shuffle(next_couples)
+        couples = next_couples or couples
+
+    x_by_generation: Dict[int, int] = {}
+    for node in nodes:
+        row = node['y'] // Y_STEP
+        node['x'] = x_by_generation.get(row, 0)
+        x_by_generation[row] = node['x'] + X_STEP
+
+    return {'nodes': nodes, 'edges': edges}
+
+def count_edges(tree: Dict[str, List[Dict[str, Any]]]) -> Dict[str, int]:
+    spouse = sum(1 for edge in tree['edges'] if edge.get('type') == 'spouse')
+    return {'persons': len(tree['nodes']), 'parent_edges': len(tree['edges']) - spouse, 'spouse_edges': spouse}
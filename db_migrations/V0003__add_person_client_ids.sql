@@ -0,0 +1,8 @@
+-- Стабильный идентификатор персоны со стороны клиента (id узла во фронтенде)
+ALTER TABLE persons ADD COLUMN IF NOT EXISTS client_id VARCHAR(64);
+
+-- Для уже сохранённых персон клиентский id совпадает с id из load-tree
+UPDATE persons SET client_id = id::text WHERE client_id IS NULL;
+
+-- Уникальность клиентского id в пределах древа (ключ для инкрементального сохранения)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_persons_tree_client_id ON persons(tree_id, client_id);
@@ -0,0 +1,2 @@
+-- Версия древа: увеличивается при каждом сохранении, используется как ETag в load-tree
+ALTER TABLE family_trees ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1;
@@ -0,0 +1,7 @@
+-- Сериализованный ответ load-tree для последней версии древа
+CREATE TABLE IF NOT EXISTS tree_snapshots (
+    tree_id INTEGER PRIMARY KEY REFERENCES family_trees(id),
+    version BIGINT NOT NULL,
+    body TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
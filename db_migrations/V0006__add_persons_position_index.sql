@@ -0,0 +1,2 @@
+-- Выборка персон по прямоугольнику на холсте; id и client_id в индексе позволяют строить мини-карту без чтения таблицы
+CREATE INDEX IF NOT EXISTS idx_persons_tree_position ON persons(tree_id, position_x, position_y) INCLUDE (id, client_id);
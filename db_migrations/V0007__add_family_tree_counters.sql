@@ -0,0 +1,10 @@
+-- Денормализованные счётчики персон и связей, поддерживаются save-tree
+ALTER TABLE family_trees ADD COLUMN IF NOT EXISTS persons_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE family_trees ADD COLUMN IF NOT EXISTS relationships_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE family_trees ft SET
+    persons_count = (SELECT COUNT(*) FROM persons p WHERE p.tree_id = ft.id),
+    relationships_count = (SELECT COUNT(*) FROM relationships r WHERE r.tree_id = ft.id);
+
+-- Постраничный вывод списка древ пользователя по (updated_at, id)
+CREATE INDEX IF NOT EXISTS idx_family_trees_user_updated ON family_trees(user_id, updated_at, id);
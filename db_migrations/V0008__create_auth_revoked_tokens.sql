@@ -0,0 +1,10 @@
+-- Отозванные подписанные сессионные токены (до истечения их срока действия)
+CREATE TABLE IF NOT EXISTS auth_revoked_tokens (
+    token_id VARCHAR(64) PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES auth_users(id),
+    expires_at TIMESTAMP NOT NULL,
+    revoked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Инкрементальная подгрузка новых отзывов по revoked_at
+CREATE INDEX IF NOT EXISTS idx_auth_revoked_tokens_revoked_at ON auth_revoked_tokens(revoked_at);
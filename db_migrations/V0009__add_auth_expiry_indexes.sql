@@ -0,0 +1,4 @@
+-- Индексы по сроку действия для пакетной очистки истёкших сессий и токенов
+CREATE INDEX IF NOT EXISTS idx_auth_sessions_expires_at ON auth_sessions(expires_at);
+CREATE INDEX IF NOT EXISTS idx_auth_verification_expires_at ON auth_verification_tokens(expires_at);
+CREATE INDEX IF NOT EXISTS idx_auth_revoked_tokens_expires_at ON auth_revoked_tokens(expires_at);
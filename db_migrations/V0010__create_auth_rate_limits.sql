@@ -0,0 +1,6 @@
+-- Общие для всех инстансов корзины токенов для ограничения попыток входа и регистрации
+CREATE TABLE IF NOT EXISTS auth_rate_limits (
+    bucket_key VARCHAR(320) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
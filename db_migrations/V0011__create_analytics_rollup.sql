@@ -0,0 +1,16 @@
+-- Посуточные значения метрик Яндекс.Метрики: визиты, посетители, просмотры и достижения целей (goal:<имя>)
+CREATE TABLE IF NOT EXISTS analytics_daily (
+    counter_id VARCHAR(32) NOT NULL,
+    day DATE NOT NULL,
+    metric VARCHAR(255) NOT NULL,
+    value DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (counter_id, day, metric)
+);
+
+-- Какие сутки уже загружены (в том числе сутки без данных) и когда
+CREATE TABLE IF NOT EXISTS analytics_rollup_days (
+    counter_id VARCHAR(32) NOT NULL,
+    day DATE NOT NULL,
+    fetched_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (counter_id, day)
+);
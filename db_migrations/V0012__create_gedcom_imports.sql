@@ -0,0 +1,14 @@
+-- Ход импорта GEDCOM: обновляется после каждой пачки записей, пока импорт идёт
+CREATE TABLE IF NOT EXISTS gedcom_imports (
+    id VARCHAR(64) PRIMARY KEY,
+    tree_id INTEGER,
+    user_id INTEGER,
+    status VARCHAR(16) NOT NULL DEFAULT 'running',
+    records INTEGER NOT NULL DEFAULT 0,
+    persons INTEGER NOT NULL DEFAULT 0,
+    relationships INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
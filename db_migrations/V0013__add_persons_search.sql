@@ -0,0 +1,20 @@
+-- Поиск персон по всем древам пользователя: полнотекстовый (русская морфология) и по триграммам (опечатки, транслит)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+-- Веса: A - фамилия, девичья фамилия и имя, B - отчество, C - места рождения и смерти, D - род занятий
+ALTER TABLE persons ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', coalesce(last_name, '') || ' ' || coalesce(maiden_name, '') || ' ' || coalesce(first_name, '')), 'A')
+    || setweight(to_tsvector('russian', coalesce(middle_name, '')), 'B')
+    || setweight(to_tsvector('russian', coalesce(birth_place, '') || ' ' || coalesce(death_place, '')), 'C')
+    || setweight(to_tsvector('russian', coalesce(occupation, '')), 'D')
+) STORED;
+
+-- Все имена одной строкой в нижнем регистре для сравнения по триграммам
+ALTER TABLE persons ADD COLUMN IF NOT EXISTS search_name TEXT GENERATED ALWAYS AS (
+    lower(coalesce(last_name, '') || ' ' || coalesce(maiden_name, '') || ' ' || coalesce(first_name, '') || ' ' || coalesce(middle_name, ''))
+) STORED;
+
+-- tree_id первым столбцом (btree_gin): поиск сразу ограничен древами пользователя, а не всей таблицей
+CREATE INDEX IF NOT EXISTS idx_persons_search_vector ON persons USING GIN (tree_id, search_vector);
+CREATE INDEX IF NOT EXISTS idx_persons_search_name ON persons USING GIN (tree_id, search_name gin_trgm_ops);
@@ -0,0 +1,2 @@
+-- Индекс для пакетной очистки давно не использованных (уже полных) корзин ограничения попыток
+CREATE INDEX IF NOT EXISTS idx_auth_rate_limits_updated_at ON auth_rate_limits(updated_at);
@@ -30,6 +30,31 @@ const API_URLS = {
   listTrees: 'https://functions.poehali.dev/37b2ca54-22fb-4d55-a1eb-6415bea1e80f'
 };
 
+interface SavedSnapshot {
+  nodes: Map<string, string>;
+  edges: Map<string, Edge>;
+}
+
+const edgeKey = (edge: Edge) => `${edge.source}|${edge.target}|${edge.type === 'spouse' ? 'spouse' : 'parent'}`;
+
+function takeSnapshot(nodes: FamilyNode[], edges: Edge[]): SavedSnapshot {
+  return {
+    nodes: new Map(nodes.map((n) => [n.id, JSON.stringify(n)])),
+    edges: new Map(edges.map((e) => [edgeKey(e), e]))
+  };
+}
+
+function diffSnapshot(saved: SavedSnapshot, current: SavedSnapshot) {
+  return {
+    upsert_nodes: [...current.nodes.entries()]
+      .filter(([id, json]) => saved.nodes.get(id) !== json)
+      .map(([, json]) => JSON.parse(json) as FamilyNode),
+    delete_nodes: [...saved.nodes.keys()].filter((id) => !current.nodes.has(id)),
+    upsert_edges: [...current.edges.entries()].filter(([key]) => !saved.edges.has(key)).map(([, e]) => e),
+    delete_edges: [...saved.edges.entries()].filter(([key]) => !current.edges.has(key)).map(([, e]) => e)
+  };
+}
+
 export function useTreeData(currentView: string) {
   const [nodes, setNodes] = useState<FamilyNode[]>(INITIAL_NODES);
   const [edges, setEdges] = useState<Edge[]>([]);
@@ -41,10 +66,17 @@ export function useTreeData(currentView: string) {
   const [showSuccessToast, setShowSuccessToast] = useState(false);
   const [autoSaveTimer, setAutoSaveTimer] = useState<NodeJS.Timeout | null>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
+  const lastSavedRef = useRef<SavedSnapshot | null>(null);
 
   const saveTreeToDatabase = useCallback(async () => {
     setIsSaving(true);
     try {
+      const snapshot = takeSnapshot(nodes, edges);
+      // Если древо уже сохранялось в этой сессии, отправляем только изменения
+      const payload = currentTreeId && lastSavedRef.current
+        ? { patch: diffSnapshot(lastSavedRef.current, snapshot) }
+        : { nodes, edges };
+
       const response = await fetch(API_URLS.saveTree, {
         method: 'POST',
         headers: {
@@ -55,14 +87,14 @@ export function useTreeData(currentView: string) {
           tree_id: currentTreeId,
           user_email: userEmail,
           title: 'Моё семейное древо',
-          nodes,
-          edges
+          ...payload
         })
       });
       
       const data = await response.json();
       
       if (response.ok) {
+        lastSavedRef.current = snapshot;
         setCurrentTreeId(data.tree_id);
         localStorage.setItem('familyTree_treeId', data.tree_id.toString());
         